@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Crash and resume test of the checkpoint journal of AsyncBotWrapper (pywikibot/run_checkpoint.py), with
+vlw_producerpages.py run against the mock wiki of bench_end_to_end.py.
+
+The mock wiki is seeded with synthetic producers, and with some broken producer pages (no {{ProdLinks}}) that the
+bot reports as errors. The bot is run with -checkpoint, killed (SIGKILL) once it has saved a part of the producer
+pages, then run again in the same directory. The script reports the time and the pages read by both runs, and
+exits with status 1 unless:
+  - every producer page has been fixed, and no page has been saved twice (the completed pages were skipped)
+  - the final report lists the broken pages found before and after the crash
+  - the journal has been deleted at the end of the resumed run
+
+vlw_producerpages.py requires Python 3.12+, run this script with the same interpreter as the bot.
+
+Usage:
+
+python benchmarks/bench_checkpoint_resume.py [-producers:100] [-songs:20] [-albums:4] [-broken:10] [-killafter:0.4] [-latency:0.02] [-seed:1] [-verbose]
+
+  -broken       Number of broken producer pages
+  -killafter    Fraction of the producer pages saved before the bot is killed
+
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import random
+import signal
+import subprocess
+import tempfile
+from time import perf_counter, sleep
+
+from typing import Dict, List, Tuple
+
+from mock_mediawiki_api import MockWiki
+import bench_end_to_end
+from bench_end_to_end import seed_wiki, check_producerpages
+
+CONST_REPORT_PAGE = "User:CcxBot/Missing PWT Entries"
+CONST_CHECKPOINT_FILE = "vlw_producerpages_checkpoint.jsonl"
+
+def seed_broken_pages(wiki: MockWiki, num_broken: int) -> List[str]:
+  titles = []
+  for i in range(num_broken):
+    title = f"Broken Producer {i}"
+    wiki.add_page(title, f"'''{title}''' is a producer without a ProdLinks template.\n\n[[Category:Producers]]")
+    titles.append(title)
+  return titles
+
+def start_bot(api_url: str, directory: str, log_path: str) -> subprocess.Popen:
+  args = [sys.executable, bench_end_to_end.__file__, "-run:producerpages", f"-api:{api_url}", f"-result:{os.path.join(directory, 'result.json')}", "-checkpoint"]
+  with open(log_path, "a") as log:
+    return subprocess.Popen(args, cwd=directory, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+
+def run_until(wiki: MockWiki, process: subprocess.Popen, num_edits: int) -> Tuple[float, bool]:
+  """Wait until the bot exits, or kill it once it has made num_edits edits"""
+  start_time = perf_counter()
+  while process.poll() is None:
+    if wiki.num_edits >= num_edits:
+      process.send_signal(signal.SIGKILL)
+      process.wait()
+      return (perf_counter() - start_time, True)
+    sleep(0.01)
+  return (perf_counter() - start_time, False)
+
+def main() -> None:
+  options: Dict[str, str] = {}
+  for arg in sys.argv[1:]:
+    arg, _, value = arg.partition(':')
+    options[arg] = value
+  num_producers = int(options.get("-producers", 100))
+  num_broken = int(options.get("-broken", 10))
+  seed = int(options.get("-seed", 1))
+  wiki = MockWiki(latency=float(options.get("-latency", 0.02)), seed=seed)
+
+  failures = []
+  with wiki, tempfile.TemporaryDirectory() as directory:
+    producers = seed_wiki(
+      wiki, num_producers, int(options.get("-songs", 20)), int(options.get("-albums", 4)), 0.2, random.Random(seed)
+    )
+    broken_titles = seed_broken_pages(wiki, num_broken)
+    log_path = os.path.join(directory, "producerpages.log")
+    wiki.reset_stats()
+    num_edits_before_kill = max(1, int(num_producers * float(options.get("-killafter", 0.4))))
+    first_time, is_killed = run_until(wiki, start_bot(wiki.url, directory, log_path), num_edits_before_kill)
+    first_edits, first_pages_read = wiki.num_edits, len(wiki.pages_read)
+    edits_by_title = wiki.edits_by_title.copy()
+    if not is_killed:
+      failures.append("the bot finished before it could be killed, raise -producers")
+    num_completed = 0
+    if os.path.exists(os.path.join(directory, CONST_CHECKPOINT_FILE)):
+      with open(os.path.join(directory, CONST_CHECKPOINT_FILE)) as f:
+        num_completed = sum(1 for _ in f) - 1
+
+    wiki.reset_stats()
+    second_time, _ = run_until(wiki, start_bot(wiki.url, directory, log_path), sys.maxsize)
+    edits_by_title.update(wiki.edits_by_title)
+    print(f"{'run':>10}{'time (s)':>10}{'edits':>8}{'pages read':>12}")
+    print(f"{'killed':>10}{first_time:>10.2f}{first_edits:>8}{first_pages_read:>12}    ({num_completed} pages in the journal)")
+    print(f"{'resumed':>10}{second_time:>10.2f}{wiki.num_edits:>8}{len(wiki.pages_read):>12}")
+
+    num_unedited = check_producerpages(wiki, producers)
+    if num_unedited > 0:
+      failures.append(f"{num_unedited} producer pages are still missing songs/albums")
+    saved_twice = [title for title, count in edits_by_title.items() if count > 1 and title != CONST_REPORT_PAGE]
+    if len(saved_twice) > 0:
+      failures.append(f"{len(saved_twice)} pages were saved twice: {', '.join(saved_twice[:5])}")
+    report = wiki.get_text(CONST_REPORT_PAGE) or ""
+    missing_errors = [title for title in broken_titles if f"[[{title}]]" not in report]
+    if len(missing_errors) > 0:
+      failures.append(f"{len(missing_errors)} broken pages are missing from the report: {', '.join(missing_errors[:5])}")
+    if os.path.exists(os.path.join(directory, CONST_CHECKPOINT_FILE)):
+      failures.append("the journal was not deleted at the end of the run")
+    if "-verbose" in options or len(failures) > 0:
+      with open(log_path) as f:
+        print(f.read())
+  for failure in failures:
+    print(f"FAILED: {failure}")
+  if len(failures) == 0:
+    print("OK")
+  sys.exit(1 if len(failures) > 0 else 0)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark for AsyncBotWrapper.run_blocking.
+
+Every page does the same blocking calls as ProducerPageEditor (exists, isRedirectPage, text and save), each of
+which is one HTTP round-trip to a local mock api.php. The pages/sec are measured with the blocking calls made
+inline on the event loop, and with the blocking calls offloaded to the bot's thread pool.
+
+Usage:
+
+python benchmarks/bench_consumer_offload.py [-pages:200] [-latency:0.02] [-workers:20]
+
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pywikibot"))
+os.environ.setdefault("PYWIKIBOT_NO_USER_CONFIG", "1")
+
+import asyncio
+import json
+import urllib.parse
+import urllib.request
+from time import perf_counter
+
+from typing import Any, Optional, Tuple
+
+from async_bot_wrapper import AsyncBotWrapper
+from mock_mediawiki_api import MockMediaWikiApi
+
+CONST_CONSUMER_COUNTS = [1, 5, 10, 25, 50, 100]
+
+class MockPage:
+  """Blocking page object that does one API round-trip per call, like an unloaded pywikibot.Page"""
+  def __init__(self, api_url: str, title: str):
+    self.api_url = api_url
+    self._title = title
+    self._text = None
+
+  def __request(self, **params) -> Any:
+    query = urllib.parse.urlencode({ "action": "query", "format": "json", "titles": self._title, **params })
+    with urllib.request.urlopen(f"{self.api_url}?{query}") as response:
+      return json.load(response)
+
+  def title(self) -> str:
+    return self._title
+
+  def exists(self) -> bool:
+    self.__request(prop="info")
+    return True
+
+  def isRedirectPage(self) -> bool:
+    self.__request(prop="info")
+    return False
+
+  @property
+  def text(self) -> str:
+    if self._text is None:
+      self.__request(prop="revisions")
+      self._text = f"{{{{ProdLinks|{self._title}}}}}"
+    return self._text
+
+  @text.setter
+  def text(self, value: str) -> None:
+    self._text = value
+
+  def save(self, **kwargs) -> None:
+    self.__request(prop="info", assert_="edit")
+
+class OffloadBenchmarkBot(AsyncBotWrapper):
+  def __init__(self, api_url: str, num_pages: int, num_consumers: int, num_workers: int, offload: bool):
+    gen = (MockPage(api_url, f"Producer {i}") for i in range(num_pages))
+    super().__init__(generator=gen, queue_size=500, num_consumers=num_consumers, num_workers=num_workers)
+    self.offload = offload
+
+  def log(self, message: str, status=None) -> None:
+    pass
+
+  def process(self, page: MockPage) -> None:
+    if page.exists() and not page.isRedirectPage():
+      page.text = page.text + "\n"
+      page.save(summary="Benchmark")
+
+  async def treat_one_page(self, page: MockPage) -> Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]:
+    if self.offload:
+      await self.run_blocking(self.process, page)
+    else:
+      self.process(page)
+    return (True, page.title(), None, None, None)
+
+  def save_page(self, page: MockPage) -> None:
+    # The page has already been saved by process(), so that the saves are also made inline when not offloading
+    pass
+
+  async def run_on_termination(self):
+    pass
+
+def run_once(api_url: str, num_pages: int, num_consumers: int, num_workers: int, offload: bool) -> float:
+  bot = OffloadBenchmarkBot(api_url, num_pages, num_consumers, num_workers, offload)
+  start_time = perf_counter()
+  asyncio.run(bot.run_async())
+  return num_pages / (perf_counter() - start_time)
+
+def main() -> None:
+  options = {}
+  for arg in sys.argv[1:]:
+    arg, _, value = arg.partition(':')
+    options[arg] = value
+  num_pages = int(options.get("-pages", 200))
+  latency = float(options.get("-latency", 0.02))
+  num_workers = int(options.get("-workers", 20))
+
+  with MockMediaWikiApi(latency=latency) as api:
+    print(f"{num_pages} pages, {latency * 1000:.0f} ms API latency, {num_workers} worker threads")
+    print(f"{'consumers':>10}{'inline pages/s':>18}{'offloaded pages/s':>20}")
+    for num_consumers in CONST_CONSUMER_COUNTS:
+      inline = run_once(api.url, num_pages, num_consumers, num_workers, False)
+      offloaded = run_once(api.url, num_pages, num_consumers, num_workers, True)
+      print(f"{num_consumers:>10}{inline:>18.1f}{offloaded:>20.1f}")
+
+if __name__ == "__main__":
+  main()
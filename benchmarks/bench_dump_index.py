@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark and correctness check for dump_index.DumpIndex.
+
+Writes synthetic XML dump files in the format of mwn/export-songs.ts, indexes them, then looks up random pages by
+title and by page id, both by scanning the dumps from the start (xml_dump.iter_dump_pages) and through the index. Every
+page returned by the index must have the same title, id and text as the page found by the scan.
+
+The script exits with status 1 if any lookup differs.
+
+Usage:
+
+python benchmarks/bench_dump_index.py [-pages:20000] [-files:10] [-lookups:200] [-seed:1]
+
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pywikibot"))
+
+import random
+import tempfile
+from time import perf_counter
+from xml.sax.saxutils import escape
+
+from typing import List, Optional
+
+from dump_index import DumpIndex
+from xml_dump import DumpPage, iter_dump_pages
+
+CONST_DUMP_HEADER = '<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" version="0.11" xml:lang="en">\n  <siteinfo>\n    <sitename>Vocaloid Lyrics Wiki</sitename>\n  </siteinfo>\n'
+CONST_DUMP_FOOTER = "</mediawiki>\n"
+
+def build_page_xml(title: str, page_id: int, text: str) -> str:
+  return (
+    f"  <page>\n    <title>{escape(title)}</title>\n    <ns>0</ns>\n    <id>{page_id}</id>\n"
+    f"    <revision>\n      <id>{page_id * 10}</id>\n      <timestamp>2024-01-01T00:00:00Z</timestamp>\n"
+    f"      <text bytes=\"{len(text.encode('utf-8'))}\" xml:space=\"preserve\">{escape(text)}</text>\n    </revision>\n  </page>\n"
+  )
+
+def write_dumps(directory: str, num_pages: int, num_files: int, rng: random.Random) -> List[str]:
+  paths = []
+  pages_per_file = (num_pages + num_files - 1) // num_files
+  for file_number in range(num_files):
+    path = os.path.join(directory, f"exported-vlw-songs-{file_number + 1}.xml")
+    with open(path, "w", encoding="utf-8") as f:
+      f.write(CONST_DUMP_HEADER)
+      for page_id in range(file_number * pages_per_file + 1, min(num_pages, (file_number + 1) * pages_per_file) + 1):
+        title = f"曲 {page_id} (Kyoku & \"{page_id}\" <{rng.randrange(100)}>)"
+        text = f"{{{{Infobox Song|title={title}}}}}\n" + "歌詞 lyrics\n" * rng.randint(10, 200) + f"[[Category:Producer {page_id % 97} songs list]]"
+        f.write(build_page_xml(title, page_id, text))
+      f.write(CONST_DUMP_FOOTER)
+    paths.append(path)
+  return paths
+
+def scan_for_page(paths: List[str], title: Optional[str] = None, page_id: Optional[int] = None) -> Optional[DumpPage]:
+  for page in iter_dump_pages(paths):
+    if page.title() == title or page.page_id == page_id:
+      return page
+  return None
+
+def is_same_page(a: Optional[DumpPage], b: Optional[DumpPage]) -> bool:
+  if a is None or b is None:
+    return a is b
+  return (a.title(), a.page_id, a.text) == (b.title(), b.page_id, b.text)
+
+def main() -> None:
+  options = {}
+  for arg in sys.argv[1:]:
+    arg, _, value = arg.partition(':')
+    options[arg] = value
+  num_pages = int(options.get("-pages", 20000))
+  num_files = int(options.get("-files", 10))
+  num_lookups = int(options.get("-lookups", 200))
+  rng = random.Random(int(options.get("-seed", 1)))
+
+  with tempfile.TemporaryDirectory() as directory:
+    paths = write_dumps(directory, num_pages, num_files, rng)
+    dump_size = sum(map(os.path.getsize, paths))
+    start_time = perf_counter()
+    index = DumpIndex.build(paths, os.path.join(directory, "dumps.idx"))
+    build_time = perf_counter() - start_time
+    print(f"{num_pages} pages in {num_files} dump files ({dump_size / 1024 / 1024:.1f} MiB)")
+    print(f"Index built in {build_time:.2f} s, {os.path.getsize(index.index_path) / 1024:.0f} KiB on disk")
+
+    page_ids = [rng.randint(1, num_pages) for _ in range(num_lookups)]
+    titles = [page.title() for page in map(index.get_page_by_id, page_ids)]
+    num_mismatches = 0
+    num_scans = min(num_lookups, 10)
+    start_time = perf_counter()
+    scanned_pages = [scan_for_page(paths, title=title) for title in titles[:num_scans]]
+    scan_time = (perf_counter() - start_time) / num_scans
+    start_time = perf_counter()
+    indexed_pages = [index.get_page(title) for title in titles]
+    index_time = (perf_counter() - start_time) / num_lookups
+    for scanned_page, indexed_page in zip(scanned_pages, indexed_pages):
+      num_mismatches += 0 if is_same_page(scanned_page, indexed_page) else 1
+    for page_id in page_ids[:num_scans]:
+      num_mismatches += 0 if is_same_page(scan_for_page(paths, page_id=page_id), index.get_page_by_id(page_id)) else 1
+    num_mismatches += 0 if index.get_page("Missing page") is None and index.get_page_by_id(num_pages + 1) is None else 1
+
+    print(f"Lookup by title: {scan_time * 1000:.1f} ms per page by scanning, {index_time * 1000:.3f} ms per page through the index")
+    print(f"{num_mismatches} lookups differ between the scan and the index")
+    index.close()
+  sys.exit(1 if num_mismatches > 0 else 0)
+
+if __name__ == "__main__":
+  main()
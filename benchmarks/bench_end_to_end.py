@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the bots against a local mock of api.php (mock_mediawiki_api.MockWiki).
+
+The mock wiki is seeded with synthetic producers, each with a producer page (pwt/awt tables, some songs and albums
+left out), a producer category with a {{Producer}} template, song and album subcategories, song and album pages,
+and a redirect to the producer category. Each bot is then run on the whole wiki in its own process, as it would be
+run on the live wiki:
+  producerpages       ProducerPageEditor (legacy/vlw_producerpages.py), adds the missing songs/albums to the tables
+  editlinks           LinkEditorBot (pywikibot/vlw_editlinks.py) with -movesingercat, on every song and album page
+  editlinksrenames    LinkEditorBot with a renames file (-renames) that moves every producer category (with
+                      -changelink) and the singer category in one run, each page should be saved once
+  editlinksasync      LinkEditorBot with -movesingercat -async (-workers:10), each page should be saved once
+  producerpageslinks  the producer-links editor (legacy/vlw_producerpageslinks.py), fills in {{Producer|2=...}}
+
+The wiki is seeded again before each bot. For each bot, the script reports the pages/sec (pages whose wikitext was
+read by the bot, over the run time), the API requests per page, the p50/p99 latency of the requests (as handled by
+the mock, including the configured latency) and the peak RSS of the bot process. For producerpages, the p50 time
+per page of each stage (fetch, transform, save) and the consumer busy ratio are read from the metrics snapshot
+written by AsyncBotWrapper. The wiki is then checked for the
+expected edits, and the script exits with status 1 if a bot failed or left any page unedited.
+
+vlw_producerpages.py requires Python 3.12+, run this script with the same interpreter as the bots.
+
+Usage:
+
+python benchmarks/bench_end_to_end.py [-producers:100] [-songs:20] [-albums:4] [-missing:0.2] [-latency:0.02]
+  [-jitter:0.5] [-pagesize:50] [-errors:0] [-maxlag:0] [-seed:1]
+  [-bots:producerpages,editlinks,editlinksrenames,editlinksasync,producerpageslinks]
+  [-localtables] [-categoryindex] [-editsperminute:<n>] [-shards:<n>] [-verbose]
+
+  -pagesize     Maximum number of results per list/generator request (the rest is returned on continuation)
+  -errors       Fraction of the requests that fail with HTTP 503
+  -maxlag       Fraction of the requests that fail with the maxlag error
+  -localtables, -categoryindex
+                Run ProducerPageEditor with these options
+  -editsperminute
+                Edit rate limit of ProducerPageEditor (unlimited by default, the mock wiki has no edit rate limit)
+  -shards       Run ProducerPageEditor in this many processes (shard_runner.run_sharded)
+  -verbose      Print the output of the bots
+
+"""
+
+import os
+import sys
+CONST_ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(CONST_ROOT_DIR, "pywikibot"))
+sys.path.insert(0, os.path.join(CONST_ROOT_DIR, "legacy"))
+os.environ["PYWIKIBOT_NO_USER_CONFIG"] = "2"
+
+import functools
+import json
+import random
+import resource
+import subprocess
+import tempfile
+from time import perf_counter
+
+import mwparserfromhell
+
+from typing import Dict, List, Optional, Tuple
+
+from mock_mediawiki_api import MockWiki, percentile
+
+CONST_BOTS = ["producerpages", "editlinks", "editlinksrenames", "editlinksasync", "producerpageslinks"]
+CONST_FAMILY_NAME = "vlwmock"
+CONST_SINGER = "Hatsune Miku"
+CONST_NEW_SINGER = "Hatsune Miku (VOCALOID)"
+CONST_SYLLABLES = ["ka", "ri", "mu", "to", "sa", "ne", "yo", "hi", "ru", "ko", "n", "ta", "mi", "zu", "ra"]
+
+CONST_PWT_HEAD = "{| class=\"sortable producer-table\"\n|- class=\"vcolor-default\"\n! {{pwt head}}\n"
+CONST_AWT_HEAD = "{| class=\"sortable producer-table\"\n|- class=\"vcolor-default\"\n! {{awt head}}\n"
+
+class SyntheticProducer:
+  name: str
+  songs: List[str]
+  albums: List[Tuple[str, bool]]
+  redirects: List[str]
+
+  def __init__(self, name: str):
+    self.name = name
+    self.songs = []
+    self.albums = []
+    self.redirects = []
+
+  @property
+  def category(self) -> str:
+    return f"Category:{self.name} songs list"
+
+def build_word(rng: random.Random) -> str:
+  return "".join(rng.choices(CONST_SYLLABLES, k=rng.randint(2, 5))).capitalize()
+
+def build_table(head: str, template: str, titles: List[str]) -> str:
+  return head + "\n".join("|-\n| {{" + template + " row|" + title + "}}" for title in sorted(titles)) + "\n|}"
+
+def seed_wiki(wiki: MockWiki, num_producers: int, songs_per_producer: int, albums_per_producer: int, missing_fraction: float, rng: random.Random) -> List[SyntheticProducer]:
+  wiki.clear()
+  producers = []
+  for i in range(num_producers):
+    producer = SyntheticProducer(f"{build_word(rng)} {build_word(rng)} {i}")
+    producers.append(producer)
+    for j in range(songs_per_producer):
+      title = f"{build_word(rng)} {build_word(rng)} ({producer.name} {j})"
+      # Every fifth song is only in a subcategory of the producer category
+      category = f"{producer.category}/Lyrics" if j % 5 == 4 else producer.category
+      wiki.add_page(title, (
+        f"{{{{Infobox Song\n|title = {title}\n|singer = [[{CONST_SINGER}]]\n|producer = [[{producer.name}]]\n}}}}\n"
+        f"''{title}'' is an original song by [[{producer.name}]]. It features [[{CONST_SINGER}]].\n\n"
+        f"[[Category:{category[len('Category:'):]}]]\n[[Category:Songs featuring {CONST_SINGER}]]"
+      ))
+      producer.songs.append(title)
+    for k in range(albums_per_producer):
+      title = f"{build_word(rng)} {k} ({producer.name}) (album)"
+      is_compilation_album = k % 4 == 3
+      wiki.add_page(title, (
+        f"{{{{Infobox Album\n|title = {title}\n}}}}\n''{title}'' is an album by [[{producer.name}]], featuring [[{CONST_SINGER}]].\n\n"
+        f"[[Category:{producer.name} songs list/Albums]]\n[[Category:Albums featuring {CONST_SINGER}]]"
+        + ("\n[[Category:Compilation albums]]" if is_compilation_album else "")
+      ))
+      producer.albums.append((title, is_compilation_album))
+
+    # Only half of the producer categories link back to the producer page
+    wiki.add_page(producer.category, f"{{{{Producer|{producer.name}" + (f"|{producer.name}" if i % 2 == 0 else "") + "}}\n[[Category:Producers by name]]")
+    wiki.add_page(f"{producer.category}/Lyrics", f"[[Category:{producer.name} songs list]]")
+    wiki.add_page(f"{producer.category}/Albums", f"[[Category:{producer.name} songs list]]")
+    if i % 3 == 0:
+      redirect = f"{producer.name} (producer)"
+      wiki.add_page(redirect, f"#REDIRECT [[:{producer.category}]]")
+      producer.redirects.append(redirect)
+
+    listed_songs = [title for title in producer.songs if rng.random() >= missing_fraction]
+    listed_albums = [title for title, _ in producer.albums if rng.random() >= missing_fraction]
+    page_text = f"'''{producer.name}''' is a producer.\n\n{{{{ProdLinks|{producer.name}}}}}\n\n==Songs==\n{build_table(CONST_PWT_HEAD, 'pwt', listed_songs)}\n"
+    # Every fourth producer page has no album table yet
+    if i % 4 != 3:
+      page_text += f"\n==Discography==\n{build_table(CONST_AWT_HEAD, 'awt', listed_albums)}\n"
+    page_text += "\n__NOTOC__\n[[Category:Producers]]"
+    wiki.add_page(producer.name, page_text)
+  return producers
+
+def check_producerpages(wiki: MockWiki, producers: List[SyntheticProducer]) -> int:
+  """Number of producer pages that are still missing songs/albums in their tables"""
+  num_failures = 0
+  for producer in producers:
+    linked_pages = set(wiki.pages[producer.name].templates)
+    if not linked_pages.issuperset(producer.songs) or not linked_pages.issuperset(title for title, _ in producer.albums):
+      num_failures += 1
+  return num_failures
+
+def check_editlinks(wiki: MockWiki, producers: List[SyntheticProducer]) -> int:
+  """Number of song/album pages that are still in the categories of the old singer name"""
+  return sum(len(wiki.category_members(f"Category:{kind} featuring {CONST_SINGER}")) for kind in ("Songs", "Albums"))
+
+def check_editlinksrenames(wiki: MockWiki, producers: List[SyntheticProducer]) -> int:
+  """Number of song/album pages that are still in the categories of an old name, or that were saved more than once"""
+  num_failures = check_editlinks(wiki, producers)
+  for producer in producers:
+    # The subcategories are not moved, as -cat only lists the pages of a category
+    num_failures += sum(
+      1 for item in ("", "/Lyrics", "/Albums") for page in wiki.category_members(f"{producer.category}{item}") if page.namespace != 14
+    )
+  return num_failures + sum(1 for num_edits in wiki.edits_by_title.values() if num_edits > 1)
+
+def check_editlinksasync(wiki: MockWiki, producers: List[SyntheticProducer]) -> int:
+  """Number of song/album pages that are still in the categories of the old singer name, or that were saved more than once"""
+  return check_editlinks(wiki, producers) + sum(1 for num_edits in wiki.edits_by_title.values() if num_edits > 1)
+
+def write_renames(path: str, producers: List[SyntheticProducer]) -> None:
+  renames = [{ "mode": "moveprodcat", "old": producer.name, "new": f"{producer.name} (renamed)", "changelink": True } for producer in producers]
+  renames.append({ "mode": "movesingercat", "old": CONST_SINGER, "new": CONST_NEW_SINGER })
+  with open(path, "w", encoding="utf-8") as f:
+    json.dump(renames, f)
+
+def check_producerpageslinks(wiki: MockWiki, producers: List[SyntheticProducer]) -> int:
+  """Number of producer categories (and their redirects) that do not link to the producer page"""
+  num_failures = 0
+  for producer in producers:
+    templates = [template for template in mwparserfromhell.parse(wiki.get_text(producer.category)).filter_templates() if template.name.matches("Producer")]
+    if len(templates) != 1 or not templates[0].has("2") or templates[0].get("2").value.strip() != producer.name:
+      num_failures += 1
+    num_failures += sum(1 for redirect in producer.redirects if wiki.get_text(redirect) != f"#REDIRECT[[{producer.name}]]")
+  return num_failures
+
+CONST_CHECKS = {
+  "producerpages": check_producerpages,
+  "editlinks": check_editlinks,
+  "editlinksrenames": check_editlinksrenames,
+  "editlinksasync": check_editlinksasync,
+  "producerpageslinks": check_producerpageslinks
+}
+
+def configure_pywikibot(api_url: str) -> None:
+  import pywikibot.config as config
+  config.family_files[CONST_FAMILY_NAME] = api_url
+  config.family = CONST_FAMILY_NAME
+  config.mylang = CONST_FAMILY_NAME
+  config.usernames[CONST_FAMILY_NAME][CONST_FAMILY_NAME] = "BenchBot"
+  config.put_throttle = 0
+  config.minthrottle = 0
+  config.maxthrottle = 0
+  config.max_retries = 20
+  config.retry_wait = 0.1
+  config.retry_max = 1
+
+def run_bot(bot: str, options: Dict[str, str]) -> None:
+  """Run one bot against the mock wiki (in the child process), then write its run time and peak RSS"""
+  configure_pywikibot(options["-api"])
+  start_time = perf_counter()
+  import pywikibot
+  if bot == "producerpages":
+    import vlw_producerpages
+    vlw_producerpages.CONST_WIKI_API_ENTRYPOINT = options["-api"]
+    edits_per_minute = options.get("-editsperminute", None)
+    vlw_producerpages.CONST_EDITS_PER_MINUTE = float(edits_per_minute) if edits_per_minute else None
+    create_editor = functools.partial(
+      vlw_producerpages.ProducerPageEditor,
+      use_local_tables="-localtables" in options, 
+      use_category_index="-categoryindex" in options,
+      metrics_path=vlw_producerpages.CONST_METRICS_FILE,
+      checkpoint_path=vlw_producerpages.CONST_CHECKPOINT_FILE if "-checkpoint" in options else None,
+      category_cache_path=vlw_producerpages.CONST_CATEGORY_CACHE_FILE if "-categorycache" in options else None,
+      watermark_path=vlw_producerpages.CONST_WATERMARK_FILE if "-incremental" in options else None
+    )
+    num_shards = int(options.get("-shards", 1))
+    if num_shards > 1:
+      vlw_producerpages.run_sharded(create_editor, num_shards, edits_per_minute=vlw_producerpages.CONST_EDITS_PER_MINUTE)
+    else:
+      create_editor().run()
+  elif bot == "editlinks":
+    import vlw_editlinks
+    vlw_editlinks.main("-movesingercat", f"-old:{CONST_SINGER}", f"-new:{CONST_NEW_SINGER}", "-always")
+  elif bot == "editlinksrenames":
+    import vlw_editlinks
+    vlw_editlinks.main(f"-renames:{options['-renames']}", "-always")
+  elif bot == "editlinksasync":
+    import vlw_editlinks
+    vlw_editlinks.main("-movesingercat", f"-old:{CONST_SINGER}", f"-new:{CONST_NEW_SINGER}", "-always", "-async", "-workers:10")
+  elif bot == "producerpageslinks":
+    import vlw_producerpageslinks
+    vlw_producerpageslinks.main()
+  # Wait for the asynchronous saves
+  pywikibot.stopme()
+  elapsed_time = perf_counter() - start_time
+  # Largest of the bot process and of its shard processes
+  max_rss_kib = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+  result = { "elapsed_time": elapsed_time, "max_rss_kib": max_rss_kib }
+  if bot == "producerpages" and os.path.exists(f"{vlw_producerpages.CONST_METRICS_FILE}.json"):
+    with open(f"{vlw_producerpages.CONST_METRICS_FILE}.json") as f:
+      result["metrics"] = json.load(f)
+  with open(options["-result"], "w") as f:
+    json.dump(result, f)
+
+def start_bot_process(bot: str, api_url: str, directory: str, options: Dict[str, str]) -> Tuple[int, Optional[dict], str]:
+  result_path = os.path.join(directory, f"{bot}.json")
+  log_path = os.path.join(directory, f"{bot}.log")
+  bot_directory = os.path.join(directory, bot)
+  os.makedirs(bot_directory)
+  args = [sys.executable, os.path.abspath(__file__), f"-run:{bot}", f"-api:{api_url}", f"-result:{result_path}"]
+  args += [f"{option}:{value}" if value != "" else option for option, value in options.items() if option in ("-localtables", "-categoryindex", "-editsperminute", "-shards", "-renames")]
+  with open(log_path, "w") as log:
+    # Run from a directory of its own, so that the pywikibot API cache and throttle files are not shared between runs
+    return_code = subprocess.run(args, cwd=bot_directory, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL).returncode
+  result = None
+  if return_code == 0 and os.path.exists(result_path):
+    with open(result_path) as f:
+      result = json.load(f)
+  with open(log_path) as f:
+    output = f.read()
+  return (return_code, result, output)
+
+def main() -> None:
+  options = {}
+  for arg in sys.argv[1:]:
+    arg, _, value = arg.partition(':')
+    options[arg] = value
+  if "-run" in options:
+    run_bot(options["-run"], options)
+    return
+
+  num_producers = int(options.get("-producers", 100))
+  songs_per_producer = int(options.get("-songs", 20))
+  albums_per_producer = int(options.get("-albums", 4))
+  missing_fraction = float(options.get("-missing", 0.2))
+  seed = int(options.get("-seed", 1))
+  bots = options["-bots"].split(",") if "-bots" in options else CONST_BOTS
+  wiki = MockWiki(
+    latency=float(options.get("-latency", 0.02)),
+    latency_jitter=float(options.get("-jitter", 0.5)),
+    page_size=int(options.get("-pagesize", 50)),
+    error_rate=float(options.get("-errors", 0)),
+    maxlag_rate=float(options.get("-maxlag", 0)),
+    seed=seed
+  )
+
+  num_failures = 0
+  print(f"{num_producers} producers, {songs_per_producer} songs and {albums_per_producer} albums per producer, latency {wiki.latency * 1000:.0f} ms, {wiki.page_size} results per list request")
+  print(f"{'bot':>20}{'pages':>8}{'edits':>8}{'time (s)':>10}{'pages/s':>10}{'requests':>10}{'req/page':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'RSS (MiB)':>11}{'check':>10}")
+  with wiki, tempfile.TemporaryDirectory() as directory:
+    for bot in bots:
+      producers = seed_wiki(wiki, num_producers, songs_per_producer, albums_per_producer, missing_fraction, random.Random(seed))
+      wiki.reset_stats()
+      bot_options = options
+      if bot == "editlinksrenames":
+        bot_options = { **options, "-renames": os.path.join(directory, "renames.json") }
+        write_renames(bot_options["-renames"], producers)
+      return_code, result, output = start_bot_process(bot, wiki.url, directory, bot_options)
+      if "-verbose" in options or result is None:
+        print(output)
+      if result is None:
+        print(f"{bot:>20}  failed with exit status {return_code}")
+        num_failures += 1
+        continue
+      num_pages = len(wiki.pages_read)
+      num_unedited = CONST_CHECKS[bot](wiki, producers)
+      num_failures += 1 if num_unedited > 0 else 0
+      print(
+        f"{bot:>20}{num_pages:>8}{wiki.num_edits:>8}{result['elapsed_time']:>10.2f}{num_pages / result['elapsed_time']:>10.1f}"
+        f"{wiki.num_requests:>10}{wiki.num_requests / max(num_pages, 1):>10.2f}"
+        f"{percentile(wiki.request_latencies, 0.5) * 1000:>10.1f}{percentile(wiki.request_latencies, 0.99) * 1000:>10.1f}"
+        f"{result['max_rss_kib'] / 1024:>11.1f}{'OK' if num_unedited == 0 else f'{num_unedited} left':>10}"
+      )
+      if "metrics" in result:
+        stages = result["metrics"]["stages"]
+        print(
+          f"{'':>20}p50 per page: fetch {stages['fetch']['p50'] * 1000:.0f} ms, transform {stages['transform']['p50'] * 1000:.1f} ms, "
+          f"save {stages['save']['p50'] * 1000:.0f} ms, consumers {result['metrics']['consumers']['busy_ratio']:.0%} busy, "
+          f"errors: {result['metrics']['errors']}"
+        )
+      if wiki.num_injected_errors > 0:
+        print(f"{'':>20}{wiki.num_injected_errors} injected errors, requests by module: {dict(wiki.requests_by_module.most_common(6))}")
+  sys.exit(1 if num_failures > 0 else 0)
+
+if __name__ == "__main__":
+  main()
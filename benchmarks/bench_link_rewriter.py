@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark and golden check for the rewriters of link_rewriter.py, which LinkEditorBot (vlw_editlinks.py)
+builds once per run, and which apply all their rewrites in a single pass over the page.
+
+The original LinkEditorBot methods (kept below as reference_*, which escape and compile their patterns on every
+page) and the rewriters are applied to a corpus of synthetic song pages, for every mode of the bot: -old/-new (with
+and without -linkcap), -chardisambig, -moveprodcat (with -changelink and -preserveoldname) and -movesingercat, and
+for a renames file (-renames), whose reference is the original methods applied one rename after the other. Both are
+timed per page.
+
+Links nested in the link text of another link are left out of the corpus: the original methods rewrite both links
+in turn, while the rewriters only rewrite the inner one, as MediaWiki only renders the inner one as a link.
+
+The script exits with status 1 if any page is rewritten differently from the reference.
+
+Usage:
+
+python benchmarks/bench_link_rewriter.py [-pages:10000] [-seed:1]
+
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pywikibot"))
+
+import random
+import re
+from time import perf_counter
+
+from typing import Callable, List, Tuple
+
+from link_rewriter import (
+  LinkRewriter,
+  MultiRenamer,
+  ProducerCategoryMover,
+  Rename,
+  SingerCategoryMover,
+  VocalistDisambigRewriter,
+)
+
+def reference_change_internal_link_address(str_page, orig_internal_link, new_internal_link, new_link_text):
+  orig_internal_link = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\\])", r"\\\1", orig_internal_link)
+  orig_internal_link = re.sub(r"[ _]", "[ _]", orig_internal_link)
+  orig_internal_link = re.sub(r"^(\w)",
+    lambda x: "[" + x.group(1).capitalize() + x.group(1).lower() + "]",
+    orig_internal_link)
+  search_regex_1 = re.compile(rf"\[\[\s*?{orig_internal_link}\s*\]\]")
+  search_regex_2 = re.compile(rf"\[\[\s*?{orig_internal_link}\s*\|(.+?)\]\]")
+  str_page = search_regex_1.sub(
+    "[[" + new_internal_link + "]]" if new_link_text.strip() == "" else
+    "[[" + new_internal_link + "|" + new_link_text + "]]",
+    str_page)
+  str_page = search_regex_2.sub(
+    lambda x: f"[[{new_internal_link}|{x.group(1)}]]"
+    if new_link_text.strip() == "" else
+    f"[[{new_internal_link}|{new_link_text}]]",
+    str_page)
+  return str_page
+
+def reference_change_vocalist_disambig(str_page, list_categories, base_voicebank, synth_family):
+  orig_internal_link = base_voicebank
+  new_internal_link = f"{base_voicebank} ({synth_family})"
+  str_find_category = f"Songs featuring {new_internal_link}"
+  if str_find_category in list_categories:
+    orig_internal_link = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\\])", r"\\\1", orig_internal_link)
+    orig_internal_link = re.sub(r"[ _]", "[ _]", orig_internal_link)
+    orig_internal_link = re.sub(r"^(\w)",
+      lambda x: f"[{x.group(1).capitalize()}{x.group(1).lower()}]",
+      orig_internal_link)
+    search_regex_1 = re.compile(rf"\[\[\s*?{orig_internal_link}\s*\]\]")
+    search_regex_2 = re.compile(rf"\[\[\s*?{orig_internal_link}\s*\|(.+?)\]\]")
+    str_page = search_regex_1.sub(
+      f"{{{{Singer|{new_internal_link}}}}}",
+      str_page)
+    str_page = search_regex_2.sub(
+      lambda x: f"{{{{Singer|{new_internal_link}|{x.group(1)}}}}}",
+      str_page)
+  return str_page
+
+def reference_move_producer_category(str_page, old_producer_alias, new_producer_alias, bool_changeredirect, bool_showoldlinkcap):
+  old_maincat = f"{old_producer_alias} songs list"
+  new_maincat = f"{new_producer_alias} songs list"
+  regex_pattern = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\\])", r"\\\1", old_maincat)
+  regex_pattern = re.sub(r"[ _]", "[ _]", regex_pattern)
+  regex_pattern = re.sub(r"^(\w)",
+    lambda x: "[" + x.group(1).capitalize() + x.group(1).lower() + "]",
+    regex_pattern)
+  regex_pattern = rf"\[\[Category:{regex_pattern}([^\[\]]*)\]\]"
+  search_regex = re.compile(regex_pattern, re.DOTALL)
+  str_page = search_regex.sub(lambda match: "[[Category:" + new_maincat + match.group(1) + "]]", str_page)
+  if bool_changeredirect:
+    str_page = reference_change_internal_link_address(
+      str_page, old_producer_alias, new_producer_alias,
+      old_producer_alias if bool_showoldlinkcap else "")
+    str_page = reference_change_internal_link_address(
+      str_page, f":Category:{old_maincat}", new_producer_alias,
+      old_producer_alias if bool_showoldlinkcap else "")
+  return str_page
+
+def reference_move_singer_category(str_page, old_singer_cat, new_singer_cat):
+  regex_pattern = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\\])", r"\\\1", f"featuring {old_singer_cat}")
+  regex_pattern = re.sub(r"[ _]", "[ _]", regex_pattern)
+  regex_pattern = re.sub(r"^(\w)",
+    lambda x: f"[{x.group(1).capitalize()}{x.group(1).lower()}]",
+    regex_pattern)
+  regex_pattern = rf"\[\[Category:(Songs|Albums)[ _]{regex_pattern}([^\[\]]*)\]\]"
+  search_regex = re.compile(regex_pattern, re.DOTALL)
+  str_page = search_regex.sub(lambda match: f"[[Category:{match.group(1)} featuring {new_singer_cat}{match.group(2)}]]", str_page)
+  regex_pattern = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\\])", r"\\\1", old_singer_cat)
+  regex_pattern = re.sub(r"[ _]", "[ _]", regex_pattern)
+  regex_pattern = re.sub(r"^(\w)",
+    lambda x: f"[{x.group(1).capitalize()}{x.group(1).lower()}]",
+    regex_pattern)
+  regex_pattern = rf"\[\[{regex_pattern}\s*\]\]"
+  search_regex = re.compile(regex_pattern, re.DOTALL)
+  singer_disambig_redirect = re.match(r"^(.*) \((.*?)\)$", new_singer_cat)
+  repl = f"[[{new_singer_cat}]]" if singer_disambig_redirect is None else f"[[{new_singer_cat}|{singer_disambig_redirect.group(1)}]]"
+  str_page = search_regex.sub(repl, str_page)
+  return str_page
+
+
+CONST_PRODUCER = "Kairiki bear"
+CONST_NEW_PRODUCER = "Kairikibear"
+CONST_OTHER_PRODUCER = "Deco*27"
+CONST_NEW_OTHER_PRODUCER = "DECO*27"
+CONST_SINGER = "Hatsune Miku"
+CONST_SYNTH = "VOCALOID"
+CONST_WORDS = ["sekai", "no", "owari", "hoshi", "uta", "koi", "yume", "sora", "hana", "kokoro", "tsuki", "ame"]
+# Spans that the patterns of the original methods handle in peculiar ways
+CONST_EDGE_CASES = [
+  "[[Kairiki bear|two\nlines]]", "[[Kairiki_bear\n]]", "[[Category:Kairiki bear songs list]x]]",
+  "[[Deco*27|]]]", "[[deco*27 |x|y]]", "[[Category:Songs Featuring Hatsune Miku]]", "[[Category:songs featuring Hatsune Miku]]",
+  "[[Category:Kairiki bear songs list2|[[x]]]]", "[[[[Kairiki bear]]", "[[:category:Kairiki bear songs list]]", "[[Category:Hatsune Miku]]"
+]
+CONST_FILLER_LINKS = ["[[Kagamine Rin]]", "[[Megurine Luka|Luka]]", "[[Category:Songs in Japanese]]", "[[File:Cover.png|thumb]]", "{{L|Other song}}"]
+
+def build_link(rng: random.Random, title: str) -> str:
+  title = rng.choice([title, title[0].lower() + title[1:], title.replace(" ", "_")])
+  kind = rng.randrange(4)
+  if kind == 0:
+    return f"[[{title}]]"
+  if kind == 1:
+    return f"[[{title}|{rng.choice(CONST_WORDS)}]]"
+  if kind == 2:
+    return f"[[ {title} ]]"
+  return f"[[{title}|{rng.choice(CONST_WORDS).capitalize()} {rng.choice(CONST_WORDS)}]]"
+
+def build_page(rng: random.Random) -> Tuple[str, List[str]]:
+  """A synthetic song page, and the categories it is tagged in"""
+  producer = rng.choice([CONST_PRODUCER, CONST_OTHER_PRODUCER])
+  singer_category = rng.choice([f"{CONST_SINGER}", f"{CONST_SINGER} ({CONST_SYNTH})"])
+  kind = rng.choice(["Songs", "Albums"])
+  lines = [
+    f"{{{{Infobox Song\n|title = {' '.join(rng.choices(CONST_WORDS, k=3))}\n|singer = {build_link(rng, CONST_SINGER)}\n|producer = {build_link(rng, producer)}\n}}}}",
+    f"''{' '.join(rng.choices(CONST_WORDS, k=4))}'' is a song by {build_link(rng, producer)}, featuring {build_link(rng, CONST_SINGER)}."
+  ]
+  for _ in range(rng.randint(5, 40)):
+    words = " ".join(rng.choices(CONST_WORDS, k=rng.randint(4, 12)))
+    lines.append(f"{words} {rng.choice(CONST_FILLER_LINKS)} {words}")
+  if rng.random() < 0.1:
+    lines.append(" ".join(rng.choices(CONST_EDGE_CASES, k=3)))
+  if rng.random() < 0.3:
+    lines.append(f"See also [[:Category:{producer} songs list]] and [[:Category:{producer.replace(' ', '_')} songs list|the songs]].")
+  categories = [f"{producer} songs list" + rng.choice(["", "/Albums", "/Lyrics"]), f"{kind} featuring {singer_category}"]
+  lines.append("")
+  lines.append(f"[[Category:{categories[0]}]]")
+  lines.append(f"[[Category:{kind} featuring {singer_category.replace(' ', rng.choice([' ', '_']))}|{rng.choice(CONST_WORDS)}]]")
+  return ("\n".join(lines), categories)
+
+def build_corpus(num_pages: int, seed: int) -> List[Tuple[str, List[str]]]:
+  rng = random.Random(seed)
+  return [build_page(rng) for _ in range(num_pages)]
+
+def main() -> None:
+  options = {}
+  for arg in sys.argv[1:]:
+    arg, _, value = arg.partition(':')
+    options[arg] = value
+  num_pages = int(options.get("-pages", 10000))
+  seed = int(options.get("-seed", 1))
+  corpus = build_corpus(num_pages, seed)
+
+  renames = [
+    Rename("moveprodcat", CONST_PRODUCER, CONST_NEW_PRODUCER, changelink=True, preserveoldname=True),
+    Rename("movesingercat", CONST_SINGER, f"{CONST_SINGER} ({CONST_SYNTH})"),
+    Rename("link", CONST_OTHER_PRODUCER, CONST_NEW_OTHER_PRODUCER)
+  ]
+  # The patterns of the rewriters are compiled once, as LinkEditorBot does when it is created
+  link_rewriter = LinkRewriter(CONST_PRODUCER, CONST_NEW_PRODUCER, "")
+  linkcap_rewriter = LinkRewriter(CONST_OTHER_PRODUCER, CONST_NEW_OTHER_PRODUCER, "DECO")
+  disambig_rewriter = VocalistDisambigRewriter(CONST_SINGER, CONST_SYNTH)
+  producer_category_mover = ProducerCategoryMover(CONST_PRODUCER, CONST_NEW_PRODUCER)
+  producer_category_link_mover = ProducerCategoryMover(CONST_PRODUCER, CONST_NEW_PRODUCER, True, True)
+  singer_category_mover = SingerCategoryMover(CONST_SINGER, f"{CONST_SINGER} ({CONST_SYNTH})")
+  renamer = MultiRenamer(renames)
+
+  def reference_renames(page: str) -> str:
+    page = reference_move_producer_category(page, CONST_PRODUCER, CONST_NEW_PRODUCER, True, True)
+    page = reference_move_singer_category(page, CONST_SINGER, f"{CONST_SINGER} ({CONST_SYNTH})")
+    return reference_change_internal_link_address(page, CONST_OTHER_PRODUCER, CONST_NEW_OTHER_PRODUCER, "")
+
+  # (mode, reference, rewriter), called with the page and its categories
+  modes: List[Tuple[str, Callable[[str, List[str]], str], Callable[[str, List[str]], str]]] = [
+    (
+      "-old -new",
+      lambda page, categories: reference_change_internal_link_address(page, CONST_PRODUCER, CONST_NEW_PRODUCER, ""),
+      lambda page, categories: link_rewriter.rewrite(page)
+    ),
+    (
+      "-old -new -linkcap",
+      lambda page, categories: reference_change_internal_link_address(page, CONST_OTHER_PRODUCER, CONST_NEW_OTHER_PRODUCER, "DECO"),
+      lambda page, categories: linkcap_rewriter.rewrite(page)
+    ),
+    (
+      "-chardisambig",
+      lambda page, categories: reference_change_vocalist_disambig(page, categories, CONST_SINGER, CONST_SYNTH),
+      disambig_rewriter.rewrite
+    ),
+    (
+      "-moveprodcat",
+      lambda page, categories: reference_move_producer_category(page, CONST_PRODUCER, CONST_NEW_PRODUCER, False, False),
+      lambda page, categories: producer_category_mover.rewrite(page)
+    ),
+    (
+      "-moveprodcat -changelink",
+      lambda page, categories: reference_move_producer_category(page, CONST_PRODUCER, CONST_NEW_PRODUCER, True, True),
+      lambda page, categories: producer_category_link_mover.rewrite(page)
+    ),
+    (
+      "-movesingercat",
+      lambda page, categories: reference_move_singer_category(page, CONST_SINGER, f"{CONST_SINGER} ({CONST_SYNTH})"),
+      lambda page, categories: singer_category_mover.rewrite(page)
+    ),
+    ("-renames", lambda page, categories: reference_renames(page), lambda page, categories: renamer.apply(page)[0]),
+  ]
+
+  num_mismatches = 0
+  print(f"{num_pages} pages, {sum(len(page) for page, _ in corpus) / num_pages / 1024:.1f} KiB per page on average")
+  print(f"{'mode':>26}{'reference (us/page)':>22}{'single pass (us/page)':>26}{'speedup':>10}{'changed':>10}{'check':>8}")
+  for mode, reference, rewrite in modes:
+    start_time = perf_counter()
+    expected_pages = [reference(page, categories) for page, categories in corpus]
+    reference_time = perf_counter() - start_time
+    start_time = perf_counter()
+    pages = [rewrite(page, categories) for page, categories in corpus]
+    rewriter_time = perf_counter() - start_time
+
+    mismatches = [i for i, (page, expected_page) in enumerate(zip(pages, expected_pages)) if page != expected_page]
+    num_mismatches += len(mismatches)
+    num_changed = sum(1 for (page, _), expected_page in zip(corpus, expected_pages) if page != expected_page)
+    print(
+      f"{mode:>26}{reference_time * 1e6 / num_pages:>22.1f}{rewriter_time * 1e6 / num_pages:>26.1f}"
+      f"{reference_time / rewriter_time:>9.2f}x{num_changed:>10}{'OK' if len(mismatches) == 0 else f'{len(mismatches)} differ':>8}"
+    )
+    for i in mismatches[:3]:
+      # Show the first difference only, the pages are long
+      start = next(j for j, (c, expected_c) in enumerate(zip(pages[i], expected_pages[i] + "\0")) if c != expected_c)
+      print(f"  page {i}: {pages[i][max(start - 40, 0):start + 60]!r}\n  != reference {expected_pages[i][max(start - 40, 0):start + 60]!r}")
+  sys.exit(1 if num_mismatches > 0 else 0)
+
+if __name__ == "__main__":
+  main()
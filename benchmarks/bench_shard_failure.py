@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Failure test of the sharded runs of AsyncBotWrapper (pywikibot/shard_runner.py), with vlw_producerpages.py run
+against the mock wiki of bench_end_to_end.py with -shards:2 -incremental -categorycache.
+
+The bot is started, and one of its shard processes is killed (SIGKILL) once the bot has saved a part of the producer
+pages. The bot is then run again (in a new directory) without killing anything. The script exits with status 1
+unless:
+  - the killed run exits with an error, saves a report marked as partial, and leaves the watermark file unchanged
+    (the next incremental run would otherwise skip the producer pages of the killed shard)
+  - the surviving shard of the killed run, and both shards of the second run, log the stats of their category cache
+  - the second run fixes every producer page and saves the watermark file
+
+vlw_producerpages.py requires Python 3.12+, run this script with the same interpreter as the bot. The shard
+processes are found through /proc, so the script only runs on Linux.
+
+Usage:
+
+python benchmarks/bench_shard_failure.py [-producers:100] [-songs:20] [-albums:4] [-killafter:0.2] [-latency:0.02] [-seed:1] [-verbose]
+
+  -killafter    Fraction of the producer pages saved before a shard is killed
+
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import random
+import signal
+import subprocess
+import tempfile
+from time import sleep
+
+from typing import Dict, List, Optional
+
+from mock_mediawiki_api import MockWiki
+import bench_end_to_end
+from bench_end_to_end import seed_wiki, check_producerpages
+
+CONST_REPORT_PAGE = "User:CcxBot/Missing PWT Entries"
+CONST_WATERMARK_FILE = "vlw_producerpages_lastrun.json"
+CONST_NUM_SHARDS = 2
+
+def start_bot(api_url: str, directory: str, log_path: str) -> subprocess.Popen:
+  args = [
+    sys.executable, bench_end_to_end.__file__, "-run:producerpages", f"-api:{api_url}", f"-result:{os.path.join(directory, 'result.json')}",
+    f"-shards:{CONST_NUM_SHARDS}", "-incremental", "-categorycache"
+  ]
+  with open(log_path, "w") as log:
+    return subprocess.Popen(args, cwd=directory, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+
+def child_pids(pid: int) -> List[int]:
+  try:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+      return [int(child) for child in f.read().split()]
+  except FileNotFoundError:
+    return []
+
+def kill_one_shard(wiki: MockWiki, process: subprocess.Popen, num_edits: int) -> Optional[int]:
+  """Wait until the bot has made num_edits edits, then kill one of its shard processes. Returns its pid."""
+  while process.poll() is None:
+    shards = child_pids(process.pid)
+    if wiki.num_edits >= num_edits and len(shards) == CONST_NUM_SHARDS:
+      os.kill(shards[0], signal.SIGKILL)
+      return shards[0]
+    sleep(0.01)
+  return None
+
+def read_file(path: str) -> Optional[str]:
+  if not os.path.exists(path):
+    return None
+  with open(path) as f:
+    return f.read()
+
+def main() -> None:
+  options: Dict[str, str] = {}
+  for arg in sys.argv[1:]:
+    arg, _, value = arg.partition(':')
+    options[arg] = value
+  num_producers = int(options.get("-producers", 100))
+  seed = int(options.get("-seed", 1))
+  wiki = MockWiki(latency=float(options.get("-latency", 0.02)), seed=seed)
+
+  failures = []
+  logs = []
+  with wiki, tempfile.TemporaryDirectory() as directory:
+    producers = seed_wiki(
+      wiki, num_producers, int(options.get("-songs", 20)), int(options.get("-albums", 4)), 0.2, random.Random(seed)
+    )
+
+    killed_directory = os.path.join(directory, "killed")
+    os.makedirs(killed_directory)
+    log_path = os.path.join(directory, "killed.log")
+    logs.append(log_path)
+    watermark_path = os.path.join(killed_directory, CONST_WATERMARK_FILE)
+    watermark_before = read_file(watermark_path)
+    process = start_bot(wiki.url, killed_directory, log_path)
+    killed_pid = kill_one_shard(wiki, process, max(1, int(num_producers * float(options.get("-killafter", 0.2)))))
+    return_code = process.wait()
+    print(f"killed run: shard process {killed_pid} killed after {wiki.num_edits} edits, exit status {return_code}")
+    if killed_pid is None:
+      failures.append("the bot finished before a shard could be killed, raise -producers")
+    else:
+      if return_code == 0:
+        failures.append("the killed run exited with status 0")
+      if read_file(watermark_path) != watermark_before:
+        failures.append("the killed run changed the watermark file")
+      if "This report is partial" not in (wiki.get_text(CONST_REPORT_PAGE) or ""):
+        failures.append("the report of the killed run is not marked as partial")
+      num_cache_stats = (read_file(log_path) or "").count("Category cache (")
+      if num_cache_stats != CONST_NUM_SHARDS - 1:
+        failures.append(f"the killed run logged {num_cache_stats} category cache stats, expected {CONST_NUM_SHARDS - 1}")
+
+    complete_directory = os.path.join(directory, "complete")
+    os.makedirs(complete_directory)
+    log_path = os.path.join(directory, "complete.log")
+    logs.append(log_path)
+    wiki.reset_stats()
+    return_code = start_bot(wiki.url, complete_directory, log_path).wait()
+    print(f"complete run: {wiki.num_edits} edits, exit status {return_code}")
+    if return_code != 0:
+      failures.append(f"the complete run exited with status {return_code}")
+    num_unedited = check_producerpages(wiki, producers)
+    if num_unedited > 0:
+      failures.append(f"{num_unedited} producer pages are still missing songs/albums")
+    if read_file(os.path.join(complete_directory, CONST_WATERMARK_FILE)) is None:
+      failures.append("the complete run did not save the watermark file")
+    num_cache_stats = (read_file(log_path) or "").count("Category cache (")
+    if num_cache_stats != CONST_NUM_SHARDS:
+      failures.append(f"the complete run logged {num_cache_stats} category cache stats, expected {CONST_NUM_SHARDS}")
+
+    if "-verbose" in options or len(failures) > 0:
+      for log_path in logs:
+        print(read_file(log_path))
+  for failure in failures:
+    print(f"FAILED: {failure}")
+  if len(failures) == 0:
+    print("OK")
+  sys.exit(1 if len(failures) > 0 else 0)
+
+if __name__ == "__main__":
+  main()
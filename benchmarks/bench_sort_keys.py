@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark and golden check for producer_sort_keys.get_sort_value.
+
+The sort keys are compared against the original ProducerPageEditor.__getSortValue (kept verbatim below as
+reference_sort_value) over a corpus of synthetic {{pwt row}}/{{awt row}} inputs, then both implementations are timed:
+once over distinct rows (cold cache) and once over rows repeated as they are on every run (warm cache).
+
+The script exits with status 1 if any sort key differs from the reference.
+
+Usage:
+
+python benchmarks/bench_sort_keys.py [-rows:20000] [-seed:1]
+
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "legacy"))
+
+import random
+import regex as re
+from time import perf_counter
+
+from typing import List
+
+from producer_sort_keys import get_sort_value
+
+def reference_sort_value(pwt_template_input: str) -> str:
+  def detone_pinyin(text, showUmlaut):
+    text = re.sub("[āáǎà]", "a", text)
+    text = re.sub("[ĀÁǍÀ]", "A", text)
+    text = re.sub("[īíǐì]", "i", text)
+    text = re.sub("[ĪÍǏÌ]", "I", text)
+    text = re.sub("[ūúǔù]", "u", text)
+    text = re.sub("[ŪÚǓÙ]", "U", text)
+    text = re.sub("[ēéěè]", "e", text)
+    text = re.sub("[ĒÉĚÈ]", "E", text)
+    text = re.sub("[ōóǒò]", "o", text)
+    text = re.sub("[ŌÓǑÒ]", "O", text)
+    if showUmlaut:
+      text = re.sub("[ǖǘǚǜ]", "ü", text)
+      text = re.sub("[ǕǗǙǛ]", "Ü", text)
+    else:
+      text = re.sub("[ǖǘǚǜ]", "v", text)
+      text = re.sub("[ǕǗǙǛ]", "V", text)
+    return text
+      
+  def get_romaji(wikipage_name):
+    extracted_romaji = wikipage_name
+    try_original_title = ""
+    try_find_regex = []
+    extracted_romaji = re.sub(r" \(album\)$", "", extracted_romaji)
+    extracted_romaji = re.sub(r"(?<=\))\/.*$", "", extracted_romaji)
+    try_find_regex = re.findall(r"(?<=\s\()[ -~ĀÁǍÀĒÉĚÈŌÓǑÒ].*(?=\)$)", extracted_romaji)
+    if not len(try_find_regex):
+      return wikipage_name
+      return "CASE: No match found"
+    extracted_romaji = try_find_regex[0]
+    while (re.search(r"^[^\(]*\)[^\(]*\(", extracted_romaji) is not None):
+      extracted_romaji = re.sub(r"^[^\(]*\)[^\(]*\(", "", extracted_romaji)
+    try_original_title = wikipage_name.replace(" (" + extracted_romaji + ")", "")
+    try_find_regex = re.search(r"[^ -~]", try_original_title)
+    if try_find_regex is None:
+      return wikipage_name
+      return "CASE: Title is already in English"
+    #Finally return the altered extractedRomaji
+    return extracted_romaji
+  
+  page_title = re.search(r"^[^\|]*", pwt_template_input).group(0)
+  page_title = re.sub(r"\{\{=\}\}", "=", re.sub(r"^\s*1\s*=\s*", "", page_title))
+
+  rom_title = get_romaji(page_title)
+
+  misc_params = pwt_template_input.replace(page_title, "")
+
+  #Deduce manual romanization
+  manual_kanji = re.search(r"\|kanji\s*=\s*([^\|]*)", misc_params)
+  manual_kanji = re.search(r"\|(?<!\s*\w+\s*=\s*)([^\|]*)", misc_params) if manual_kanji is None else manual_kanji
+  manual_kanji = manual_kanji.group(1) if not manual_kanji is None else ""
+  manual_rom = re.search(r"\|rom\s*=\s*([^\|]*)", misc_params)
+  manual_rom = manual_rom.group(1) if not manual_rom is None else ""
+  rom_title = manual_rom if manual_rom != "" else rom_title
+
+  #Finishing operations
+  rom_title = detone_pinyin(rom_title, False).lower()
+  rom_title = re.sub(r"[\[\(\)\]\"'¿\?『』「」:’]", "", rom_title)
+  rom_title += misc_params
+
+  return rom_title
+
+
+CONST_JAPANESE = "あいうえおかきくけこ初音ミク鏡音リン巡音ルカ夜空星月花"
+CONST_CHINESE = "洛天依言和乐正绫墨清弦心华"
+CONST_ROMAJI = ["Hatsune", "Kagami", "Yozora", "Hoshi no Uta", "Tsuki to Hana", "Sekai", "Koi wo Shite", "Saigo no Hi"]
+CONST_PINYIN = ["Luò Tiānyī", "Yuè Zhèng Líng", "Mò Qīngxián", "Nǚ Ér Qíng", "Lǜ Sè", "ǕǗǙǛ Shì", "Ā Á Ǎ À"]
+CONST_ENGLISH = ["Hello World", "Don't Stop", "Who? Me?", "[Re]Start", "Song: Part 2", "It’s Over", "A = B"]
+CONST_EXTRA_PARAMS = ["", "|kanji=初音", "|rom=Manual Romaji", "|rom=", "|kanji=x|rom=Zǎo Ān", "|other=1", "|Singer|2020"]
+
+def build_title(rng: random.Random) -> str:
+  kind = rng.randrange(7)
+  if kind == 0:
+    title = f"{''.join(rng.choices(CONST_JAPANESE, k=rng.randint(2, 6)))} ({rng.choice(CONST_ROMAJI)})"
+  elif kind == 1:
+    title = f"{''.join(rng.choices(CONST_CHINESE, k=rng.randint(2, 6)))} ({rng.choice(CONST_PINYIN)})"
+  elif kind == 2:
+    title = rng.choice(CONST_ENGLISH)
+  elif kind == 3:
+    title = f"{''.join(rng.choices(CONST_JAPANESE, k=3))} ({rng.choice(CONST_ROMAJI)}) (album)"
+  elif kind == 4:
+    title = f"{''.join(rng.choices(CONST_JAPANESE, k=3))} (A (B) C) ({rng.choice(CONST_ROMAJI)})"
+  elif kind == 5:
+    title = f"{''.join(rng.choices(CONST_JAPANESE, k=3))} ({rng.choice(CONST_ROMAJI)})/Subpage"
+  else:
+    title = f"{rng.choice(CONST_ENGLISH)} ({rng.choice(CONST_ROMAJI)})"
+  title = title.replace("=", "{{=}}")
+  return f"1={title}" if rng.random() < 0.1 else title
+
+def build_corpus(num_rows: int, seed: int) -> List[str]:
+  rng = random.Random(seed)
+  return [f"{build_title(rng)}{rng.choice(CONST_EXTRA_PARAMS)}" for _ in range(num_rows)]
+
+def main() -> None:
+  options = {}
+  for arg in sys.argv[1:]:
+    arg, _, value = arg.partition(':')
+    options[arg] = value
+  num_rows = int(options.get("-rows", 20000))
+  seed = int(options.get("-seed", 1))
+  corpus = build_corpus(num_rows, seed)
+
+  mismatches = [row for row in corpus if get_sort_value(row) != reference_sort_value(row)]
+  print(f"Golden check: {num_rows - len(mismatches)}/{num_rows} sort keys match the reference")
+  for row in mismatches[:10]:
+    print(f"  {row!r}: {get_sort_value(row)!r} != {reference_sort_value(row)!r}")
+
+  distinct_rows = list(dict.fromkeys(corpus))
+  get_sort_value.cache_clear()
+  start_time = perf_counter()
+  for row in distinct_rows:
+    reference_sort_value(row)
+  reference_time = perf_counter() - start_time
+  start_time = perf_counter()
+  for row in distinct_rows:
+    get_sort_value(row)
+  cold_time = perf_counter() - start_time
+  start_time = perf_counter()
+  for row in distinct_rows:
+    get_sort_value(row)
+  warm_time = perf_counter() - start_time
+  print(f"{len(distinct_rows)} distinct rows:")
+  print(f"  reference\t{reference_time * 1e6 / len(distinct_rows):8.2f} us/row")
+  print(f"  cold cache\t{cold_time * 1e6 / len(distinct_rows):8.2f} us/row")
+  print(f"  warm cache\t{warm_time * 1e6 / len(distinct_rows):8.2f} us/row")
+  sys.exit(1 if len(mismatches) > 0 else 0)
+
+if __name__ == "__main__":
+  main()
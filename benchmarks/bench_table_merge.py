@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark and equivalence check for producer_tables.merge_missing_rows.
+
+Missing rows are added to synthetic producer tables with the original linear insertion of ProducerPageEditor
+(kept below as reference_insert_rows) and with merge_missing_rows. The resulting row order must be identical, both
+for sorted tables and for tables that have been sorted by hand (some rows out of place).
+
+The script exits with status 1 if the two orders differ.
+
+Usage:
+
+python benchmarks/bench_table_merge.py [-rows:5000] [-missing:100,300,1000] [-seed:1]
+
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "legacy"))
+
+import random
+from time import perf_counter
+
+from typing import Callable, List
+
+from producer_sort_keys import get_sort_value
+from producer_tables import merge_missing_rows
+from bench_sort_keys import build_corpus
+
+# PERCENTAGE OF ROWS MOVED OUT OF PLACE IN THE "UNSORTED" TABLES
+CONST_UNSORTED_RATIO = 0.05
+
+def make_row(row_input: str) -> dict:
+  return dict(fullmatch="|-\n| {{pwt row|" + row_input + "}}", input=row_input, sort_value=get_sort_value(row_input))
+
+def get_row_sort_value(row: dict) -> str:
+  return row["sort_value"]
+
+def reference_insert_rows(rows: List[dict], missing_rows: List[dict]) -> List[dict]:
+  rows = list(rows)
+  for missing_row in missing_rows:
+    sort_value = missing_row["sort_value"]
+    add_to_index = 0
+    while add_to_index < len(rows):
+      if (rows[add_to_index]["sort_value"] > sort_value):
+        break
+      add_to_index += 1
+    rows.insert(add_to_index, missing_row)
+  return rows
+
+def build_table(num_rows: int, num_missing: int, sort_table: bool, rng: random.Random) -> tuple:
+  corpus = build_corpus(num_rows + num_missing, rng.randrange(1 << 30))
+  # A few missing songs share their title with a row already in the table, to check the tie-breaking
+  for i in range(0, num_missing, 10):
+    corpus[num_rows + i] = corpus[rng.randrange(num_rows)]
+  rows = sorted(map(make_row, corpus[:num_rows]), key=get_row_sort_value)
+  if not sort_table:
+    for _ in range(int(num_rows * CONST_UNSORTED_RATIO)):
+      rows.insert(rng.randrange(num_rows), rows.pop(rng.randrange(num_rows)))
+  missing_rows = list(map(make_row, corpus[num_rows:]))
+  return (rows, missing_rows)
+
+def time_call(func: Callable, *args) -> tuple:
+  start_time = perf_counter()
+  result = func(*args)
+  return (result, perf_counter() - start_time)
+
+def main() -> None:
+  options = {}
+  for arg in sys.argv[1:]:
+    arg, _, value = arg.partition(':')
+    options[arg] = value
+  num_rows = int(options.get("-rows", 5000))
+  missing_counts = [int(n) for n in options.get("-missing", "100,300,1000").split(",")]
+  rng = random.Random(int(options.get("-seed", 1)))
+
+  num_mismatches = 0
+  print(f"{num_rows} rows per table")
+  print(f"{'table':>10}{'missing':>10}{'linear insert (ms)':>22}{'merge (ms)':>14}{'same order':>12}")
+  for sort_table in (True, False):
+    for num_missing in missing_counts:
+      rows, missing_rows = build_table(num_rows, num_missing, sort_table, rng)
+      expected, reference_time = time_call(reference_insert_rows, rows, missing_rows)
+      merged, merge_time = time_call(merge_missing_rows, rows, missing_rows, get_row_sort_value)
+      is_same_order = [id(row) for row in expected] == [id(row) for row in merged]
+      num_mismatches += 0 if is_same_order else 1
+      label = "sorted" if sort_table else "unsorted"
+      print(f"{label:>10}{num_missing:>10}{reference_time * 1000:>22.2f}{merge_time * 1000:>14.2f}{str(is_same_order):>12}")
+  sys.exit(1 if num_mismatches > 0 else 0)
+
+if __name__ == "__main__":
+  main()
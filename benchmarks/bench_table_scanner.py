@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark and equivalence check for producer_tables.scan_producer_tables.
+
+The tables and rows found by the scanner are compared with those found by the original table regexes (kept below
+as REFERENCE_RX_PWT_TABLE/REFERENCE_RX_AWT_TABLE) on randomly assembled wikitext, then both are timed on:
+  - a large discography page (one table with many rows)
+  - a page with many table headers that are never closed with "|}"
+  - a page with many "|}}" (empty last template parameters) and unrelated "{|" tables
+
+The script exits with status 1 if the scanner and the regexes disagree on any page.
+
+Usage:
+
+python benchmarks/bench_table_scanner.py [-rows:20000] [-fuzz:2000] [-seed:1]
+
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "legacy"))
+
+import random
+import regex as re
+from time import perf_counter
+
+from typing import Callable, List
+
+from producer_tables import RX_PWT_ROW_TEMPLATE, RX_AWT_ROW_TEMPLATE, scan_producer_tables
+
+REFERENCE_RX_PWT_TABLE = re.compile(r"""(?#
+    )(?P<head>{\|\s*class=[\"']sortable\s+producer-table[\"']\s*\n(?#
+    )\|-[^\{\}\n]*?\n(?#
+    )!\s*\{\{\s*[Pp]wt[ _]head\s*\}\}\s*\n)(?#
+    )(.*?(?!\|\}\}))\|\}""", re.S)
+REFERENCE_RX_AWT_TABLE = re.compile(r"""(?#
+    )(?P<head>{\|\s*class=[\"']sortable\s+producer-table[\"']\s*\n(?#
+    )\|-[^\{\}\n]*?\n(?#
+    )!\s*\{\{\s*[Aa]wt[ _]head\s*\}\}\s*\n)(?#
+    )(.*?(?!\|\}\}))\|\}""", re.S)
+
+CONST_PWT_HEAD = "{| class=\"sortable producer-table\"\n|- class=\"vcolor-default\"\n! {{pwt head}}\n"
+CONST_AWT_HEAD = "{| class='sortable producer-table'\n|-\n!{{Awt_head}}\n\n"
+CONST_FRAGMENTS = [
+  CONST_PWT_HEAD, CONST_AWT_HEAD,
+  "|-\n| {{pwt row|Song (Romaji)|Singer}}\n", "|-\n|\u200B{{pht row|Song|}}\n", "|-\n| {{awt row|Album (album)}}\n",
+  "|-\n| {{awt row|1=A{{=}}B|}} \n", "|-\n\n|{{pwt row|x}} y}}\n",
+  "|}", "|}}", "|}}}", "{|", "{| class=\"wikitable\"\n", "\n", "Some text. ", "{{Template|a|}}\n", "[[Category:X]]\n"
+]
+
+def reference_scan(page_contents: str) -> List[tuple]:
+  tables = []
+  for kind, rx_table, rx_row in (("pwt", REFERENCE_RX_PWT_TABLE, RX_PWT_ROW_TEMPLATE), ("awt", REFERENCE_RX_AWT_TABLE, RX_AWT_ROW_TEMPLATE)):
+    for table in rx_table.finditer(page_contents):
+      rows = [(table.start() + row.start(), table.start() + row.end(), row.group(1)) for row in rx_row.finditer(table.group(0))]
+      tables.append((kind, table.span(), table.group("head"), table.group(0), rows))
+  return sorted(tables, key=lambda table: (table[1], table[0]))
+
+def scanner_scan(page_contents: str) -> List[tuple]:
+  tables = []
+  for table in scan_producer_tables(page_contents):
+    rows = [(row.start, row.end, row.template_input) for row in table.rows]
+    tables.append((table.kind, table.span(), table.head, table.wikitext, rows))
+  return sorted(tables, key=lambda table: (table[1], table[0]))
+
+def build_fuzz_page(rng: random.Random) -> str:
+  return "".join(rng.choices(CONST_FRAGMENTS, k=rng.randint(1, 40)))
+
+def build_discography_page(num_rows: int) -> str:
+  rows = "".join(f"|-\n| {{{{pwt row|Song {i} (Romaji {i})|Singer|}}}}\n" for i in range(num_rows))
+  albums = "".join(f"|-\n| {{{{awt row|Album {i} (album)}}}}\n" for i in range(num_rows // 20))
+  return f"Intro\n==Songs==\n{CONST_PWT_HEAD}{rows}|}}\n==Albums==\n{CONST_AWT_HEAD}{albums}|}}\n__NOTOC__"
+
+def build_unclosed_tables_page(num_rows: int) -> str:
+  return "".join(f"{CONST_PWT_HEAD}|-\n| {{{{pwt row|Song {i}|}}}}\n" for i in range(num_rows // 40))
+
+def build_empty_params_page(num_rows: int) -> str:
+  return "".join("{| class=\"wikitable\"\n|-\n| {{Template|a|}}\n" for i in range(num_rows)) + f"{CONST_PWT_HEAD}|}}"
+
+def time_call(func: Callable, *args) -> tuple:
+  start_time = perf_counter()
+  result = func(*args)
+  return (result, perf_counter() - start_time)
+
+def main() -> None:
+  options = {}
+  for arg in sys.argv[1:]:
+    arg, _, value = arg.partition(':')
+    options[arg] = value
+  num_rows = int(options.get("-rows", 20000))
+  num_fuzz = int(options.get("-fuzz", 2000))
+  rng = random.Random(int(options.get("-seed", 1)))
+
+  num_mismatches = 0
+  for _ in range(num_fuzz):
+    page_contents = build_fuzz_page(rng)
+    if reference_scan(page_contents) != scanner_scan(page_contents):
+      num_mismatches += 1
+      if num_mismatches <= 5:
+        print(f"Mismatch on {page_contents!r}")
+  print(f"Equivalence check: {num_fuzz - num_mismatches}/{num_fuzz} random pages give the same tables and rows")
+
+  print(f"{'page':>24}{'chars':>12}{'regexes (ms)':>16}{'scanner (ms)':>16}{'same result':>14}")
+  for label, build_page in (("large discography", build_discography_page), ("unclosed tables", build_unclosed_tables_page), ("empty last params", build_empty_params_page)):
+    page_contents = build_page(num_rows)
+    expected, reference_time = time_call(reference_scan, page_contents)
+    result, scanner_time = time_call(scanner_scan, page_contents)
+    is_same_result = expected == result
+    num_mismatches += 0 if is_same_result else 1
+    print(f"{label:>24}{len(page_contents):>12}{reference_time * 1000:>16.1f}{scanner_time * 1000:>16.1f}{str(is_same_result):>14}")
+  sys.exit(1 if num_mismatches > 0 else 0)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,610 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the MediaWiki api.php endpoint, used by the benchmark scripts in this folder.
+
+The server runs on its own event loop in a background thread, so that it can be used by both blocking
+clients (pywikibot-style page lookups) and asyncio clients (aiohttp) without competing with the bot under test.
+
+Every request is delayed by the configured latency to emulate the round-trip time to the live wiki.
+
+MockMediaWikiApi answers every request with an empty query result. MockWiki answers from an in-memory wiki (pages,
+categories, templates, redirects and edits), and can be used as the target of pywikibot and of the bots themselves.
+"""
+
+import asyncio
+import hashlib
+import random
+import regex as re
+import threading
+from aiohttp import web
+from collections import Counter
+from datetime import datetime, timezone
+from time import perf_counter
+
+from typing import Dict, List, Optional, Set, Tuple
+
+CONST_NS_TEMPLATE = 10
+CONST_NS_CATEGORY = 14
+CONST_MOCK_TOKEN = "0123456789abcdef+\\"
+CONST_ACTIONS = ["query", "edit", "paraminfo"]
+
+NAMESPACE_NAMES = {
+  -2: "Media", -1: "Special", 0: "", 1: "Talk", 2: "User", 3: "User talk", 4: "Project", 5: "Project talk", 6: "File",
+  7: "File talk", 8: "MediaWiki", 9: "MediaWiki talk", 10: "Template", 11: "Template talk", 12: "Help", 13: "Help talk",
+  14: "Category", 15: "Category talk"
+}
+NAMESPACE_IDS = { name: namespace for namespace, name in NAMESPACE_NAMES.items() if namespace != 0 }
+
+# QUERY MODULES OF THE MOCK, BY GROUP AND BY PARAMETER PREFIX
+MODULE_GROUPS = {
+  "revisions": "prop", "info": "prop", "categories": "prop", "templates": "prop", "redirects": "prop", "categoryinfo": "prop",
+  "categorymembers": "list", "allpages": "list", "siteinfo": "meta", "userinfo": "meta", "tokens": "meta"
+}
+MODULE_PREFIXES = {
+  "revisions": "rv", "info": "in", "categories": "cl", "templates": "tl", "redirects": "rd", "categoryinfo": "",
+  "categorymembers": "cm", "allpages": "ap", "siteinfo": "si", "userinfo": "ui", "tokens": ""
+}
+GENERATOR_MODULES = ("categorymembers", "allpages", "categories", "templates", "redirects")
+CONST_TOKEN_TYPES = ["csrf", "login", "patrol", "rollback", "watch"]
+
+RX_CATEGORY_TAG = re.compile(r"\[\[\s*[Cc]ategory\s*:\s*([^\[\]\|\n]+?)\s*(?:\|[^\[\]]*)?\]\]")
+RX_TEMPLATE = re.compile(r"\{\{\s*([^\{\}\|#:\n]+?)\s*[\|\}]")
+RX_ROW_TEMPLATE = re.compile(r"\{\{\s*[PpAa]wt[ _]row\s*\|\s*(?:1\s*=\s*)?([^\{\}\|\n]+?)\s*[\|\}]")
+RX_REDIRECT = re.compile(r"\s*#REDIRECT\s*\[\[\s*([^\[\]\|#\n]+)", re.I)
+
+class MockMediaWikiApi:
+  latency: float
+  num_requests: int
+
+  def __init__(self, latency: float = 0.05, host: str = "127.0.0.1", port: int = 0):
+    self.latency = latency
+    self.host = host
+    self.port = port
+    self.num_requests = 0
+    self._loop: Optional[asyncio.AbstractEventLoop] = None
+    self._runner: Optional[web.AppRunner] = None
+    self._thread: Optional[threading.Thread] = None
+    self._started = threading.Event()
+
+  @property
+  def url(self) -> str:
+    return f"http://{self.host}:{self.port}/api.php"
+
+  async def handle_api(self, request: web.Request) -> web.Response:
+    self.num_requests += 1
+    await asyncio.sleep(self.latency)
+    params = dict(request.query)
+    if request.method == "POST":
+      params.update(await request.post())
+    return web.json_response({ "batchcomplete": "", "query": { "pages": {} } })
+
+  def build_app(self) -> web.Application:
+    app = web.Application()
+    app.router.add_route("*", "/api.php", self.handle_api)
+    return app
+
+  def __run_server(self) -> None:
+    self._loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(self._loop)
+    self._runner = web.AppRunner(self.build_app())
+    self._loop.run_until_complete(self._runner.setup())
+    site = web.TCPSite(self._runner, self.host, self.port)
+    self._loop.run_until_complete(site.start())
+    self.port = site._server.sockets[0].getsockname()[1]
+    self._started.set()
+    self._loop.run_forever()
+    self._loop.run_until_complete(self._runner.cleanup())
+    self._loop.close()
+
+  def start(self) -> "MockMediaWikiApi":
+    self._thread = threading.Thread(target=self.__run_server, name="MockMediaWikiApi", daemon=True)
+    self._thread.start()
+    self._started.wait()
+    return self
+
+  def stop(self) -> None:
+    if self._loop is not None:
+      self._loop.call_soon_threadsafe(self._loop.stop)
+    if self._thread is not None:
+      self._thread.join()
+
+  def __enter__(self) -> "MockMediaWikiApi":
+    return self.start()
+
+  def __exit__(self, *exc) -> None:
+    self.stop()
+
+class MockWikiPage:
+  """A page of MockWiki. The categories, templates and redirect target are read from the wikitext on every edit."""
+  title: str
+  namespace: int
+  page_id: int
+  rev_id: int
+  timestamp: str
+  text: str
+  categories: List[str]
+  templates: List[str]
+  redirect_target: Optional[str]
+
+  def __init__(self, title: str, namespace: int, page_id: int):
+    self.title = title
+    self.namespace = namespace
+    self.page_id = page_id
+    self.rev_id = 0
+    self.timestamp = ""
+    self.text = ""
+    self.categories = []
+    self.templates = []
+    self.redirect_target = None
+
+class MockWiki(MockMediaWikiApi):
+  """
+  A mock api.php backed by an in-memory wiki.
+
+  Implements the parts of the Action API used by pywikibot and by the bots of this repository:
+    action=query with titles/pageids, list=categorymembers|allpages, prop=revisions|info|categories|templates|redirects|categoryinfo,
+      meta=siteinfo|userinfo|tokens, and the list modules (and categories/templates/redirects) as generators
+    action=edit
+    action=paraminfo (for pywikibot)
+  Both formatversion=1 and formatversion=2 responses are supported.
+
+  Lists and generators return at most page_size results per request, followed by continuation parameters.
+  A fraction of the requests (other than meta queries) fail with HTTP 503 (error_rate) or with the maxlag error
+  (maxlag_rate), so that the retry logic of the clients is exercised.
+
+  The handling time of each request (including the injected latency) is recorded in request_latencies.
+
+  The categories of a page are read from its [[Category:...]] tags, and its templates from its {{...}} tags and the
+  pages in its {{pwt row}}/{{awt row}} templates (which transclude the song/album page on the wiki).
+  """
+  user_name: str
+  page_size: int
+  latency_jitter: float
+  error_rate: float
+  maxlag_rate: float
+  pages: Dict[str, MockWikiPage]
+  pages_by_id: Dict[int, MockWikiPage]
+  request_latencies: List[float]
+  num_edits: int
+  edits_by_title: Counter
+  num_injected_errors: int
+  requests_by_module: Counter
+  pages_read: Set[str]
+
+  def __init__(
+    self,
+    latency: float = 0.05,
+    latency_jitter: float = 0.0,
+    page_size: int = 500,
+    error_rate: float = 0.0,
+    maxlag_rate: float = 0.0,
+    seed: int = 1,
+    user_name: str = "BenchBot",
+    host: str = "127.0.0.1",
+    port: int = 0
+  ):
+    super().__init__(latency=latency, host=host, port=port)
+    self.user_name = user_name
+    self.latency_jitter = latency_jitter
+    self.page_size = page_size
+    self.error_rate = error_rate
+    self.maxlag_rate = maxlag_rate
+    self.rng = random.Random(seed)
+    self.clear()
+    self.reset_stats()
+
+  def clear(self) -> None:
+    self.pages = {}
+    self.pages_by_id = {}
+    self.__members = {}
+    self.__sorted_members = {}
+    self.__redirects = {}
+    self.__next_page_id = 1
+    self.__next_rev_id = 1
+
+  def reset_stats(self) -> None:
+    self.num_requests = 0
+    self.request_latencies = []
+    self.num_edits = 0
+    self.edits_by_title = Counter()
+    self.num_injected_errors = 0
+    self.requests_by_module = Counter()
+    self.pages_read = set()
+
+  # ---- Page data model ----
+
+  def add_page(self, title: str, text: str) -> MockWikiPage:
+    """Create or overwrite a page. Should only be called from another thread while no request is being handled."""
+    title, namespace = normalize_title(title)
+    page = self.pages.get(title, None)
+    if page is None:
+      page = MockWikiPage(title, namespace, self.__next_page_id)
+      self.__next_page_id += 1
+      self.pages[title] = page
+      self.pages_by_id[page.page_id] = page
+    self.__set_text(page, text)
+    return page
+
+  def get_text(self, title: str) -> Optional[str]:
+    page = self.pages.get(normalize_title(title)[0], None)
+    return page.text if page is not None else None
+
+  def category_members(self, category: str) -> List[MockWikiPage]:
+    """Members of a category, sorted by title (the mock has no sort keys)"""
+    category = normalize_title(category)[0]
+    if category not in self.__sorted_members:
+      self.__sorted_members[category] = sorted(self.__members.get(category, ()))
+    return [self.pages[title] for title in self.__sorted_members[category]]
+
+  def __set_text(self, page: MockWikiPage, text: str) -> None:
+    for category in page.categories:
+      self.__members[category].discard(page.title)
+      self.__sorted_members.pop(category, None)
+    if page.redirect_target is not None:
+      self.__redirects[page.redirect_target].discard(page.title)
+    page.text = text
+    page.rev_id = self.__next_rev_id
+    self.__next_rev_id += 1
+    page.timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    page.categories = list(dict.fromkeys(normalize_title(f"Category:{match.group(1)}")[0] for match in RX_CATEGORY_TAG.finditer(text)))
+    templates = [normalize_title(match.group(1), CONST_NS_TEMPLATE)[0] for match in RX_TEMPLATE.finditer(text)]
+    # The pwt/awt row templates transclude the song/album page given as their first parameter
+    templates += [normalize_title(match.group(1))[0] for match in RX_ROW_TEMPLATE.finditer(text)]
+    page.templates = list(dict.fromkeys(templates))
+    redirect = RX_REDIRECT.match(text)
+    page.redirect_target = normalize_title(redirect.group(1))[0] if redirect is not None else None
+    for category in page.categories:
+      self.__members.setdefault(category, set()).add(page.title)
+      self.__sorted_members.pop(category, None)
+    if page.redirect_target is not None:
+      self.__redirects.setdefault(page.redirect_target, set()).add(page.title)
+
+  # ---- Request handling ----
+
+  async def handle_api(self, request: web.Request) -> web.Response:
+    start_time = perf_counter()
+    self.num_requests += 1
+    params = dict(request.query)
+    if request.method == "POST":
+      params.update(await request.post())
+    action = params.get("action", "")
+    module = action
+    if action == "query":
+      module = "query:" + "|".join(filter(None, (params.get(key, "") for key in ("prop", "list", "generator", "meta"))))
+    self.requests_by_module[module] += 1
+    await asyncio.sleep(self.latency * (1 + self.latency_jitter * (2 * self.rng.random() - 1)) if self.latency_jitter > 0 else self.latency)
+
+    is_meta_query = action != "edit" and (action != "query" or all(key not in params for key in ("prop", "list", "generator", "titles", "pageids")))
+    if not is_meta_query and self.rng.random() < self.error_rate:
+      self.num_injected_errors += 1
+      response = web.Response(status=503, text="Service Unavailable", headers={ "Retry-After": "0" })
+    elif not is_meta_query and "maxlag" in params and self.rng.random() < self.maxlag_rate:
+      self.num_injected_errors += 1
+      response = web.json_response(
+        { "error": { "code": "maxlag", "info": "Waiting for a database server: 1 seconds lagged.", "lag": 1 } },
+        headers={ "Retry-After": "0", "X-Database-Lag": "1" }
+      )
+    else:
+      formatversion = 2 if params.get("formatversion", "1") in ("2", "latest") else 1
+      try:
+        if action == "query":
+          data = self.query(params, formatversion)
+        elif action == "edit":
+          data = self.edit(params, formatversion)
+        elif action == "paraminfo":
+          data = self.paraminfo(params)
+        else:
+          data = { "error": { "code": "badvalue", "info": f"Unrecognized value for parameter \"action\": {action}." } }
+      except MockApiError as e:
+        data = { "error": { "code": e.code, "info": e.info } }
+      response = web.json_response(data)
+    self.request_latencies.append(perf_counter() - start_time)
+    return response
+
+  def __page_entry(self, page: Optional[MockWikiPage], title: str, formatversion: int) -> dict:
+    if page is None:
+      return { "ns": normalize_title(title)[1], "title": title, "missing": True if formatversion == 2 else "" }
+    return { "pageid": page.page_id, "ns": page.namespace, "title": page.title }
+
+  def __paginate(self, pages: List[MockWikiPage], params: Dict[str, str], prefix: str, continue_key: str, continued: Dict[str, str]) -> List[MockWikiPage]:
+    """
+    Get the next batch of a list of pages sorted by title. Like the sort key of categorymembers, the continuation
+    parameter is the title of the next page (not an offset), so that the pages that leave the list between two
+    requests (e.g. pages removed from a category by the bot) do not cause other pages to be skipped.
+    """
+    limit = params.get(f"{prefix}limit", "10")
+    limit = self.page_size if limit == "max" else min(int(limit), self.page_size)
+    next_title = params.get(f"{prefix}continue", None)
+    start = 0
+    if next_title is not None:
+      is_descending = params.get(f"{prefix}dir", "ascending") in ("descending", "desc")
+      start = next((i for i, page in enumerate(pages) if (page.title <= next_title if is_descending else page.title >= next_title)), len(pages))
+    if start + limit < len(pages):
+      continued[f"{prefix}continue"] = pages[start + limit].title
+      continued["continue"] = continue_key
+    return pages[start:start + limit]
+
+  def __list_pages(self, module: str, params: Dict[str, str], prefix: str) -> List[MockWikiPage]:
+    namespaces = parse_namespaces(params.get(f"{prefix}namespace", None))
+    if module == "categorymembers":
+      members = self.category_members(params[f"{prefix}title"])
+      if f"{prefix}pageid" in params:
+        members = self.category_members(self.pages_by_id[int(params[f"{prefix}pageid"])].title)
+      start = params.get(f"{prefix}startsortkeyprefix", params.get(f"{prefix}starthexsortkey", None))
+      if start:
+        members = [page for page in members if page.title.split(":", 1)[-1] >= start]
+      if params.get(f"{prefix}dir", "ascending") in ("descending", "desc"):
+        members = members[::-1]
+      page_types = params.get(f"{prefix}type", "page|subcat|file").split("|")
+      members = [page for page in members if ("subcat" if page.namespace == CONST_NS_CATEGORY else "file" if page.namespace == 6 else "page") in page_types]
+    elif module == "allpages":
+      namespace = int(params.get(f"{prefix}namespace", "0"))
+      namespaces = None
+      start = params.get(f"{prefix}from", "")
+      members = sorted((page for page in self.pages.values() if page.namespace == namespace and page.title.split(":", 1)[-1] >= start), key=lambda page: page.title)
+      if params.get(f"{prefix}filterredir", "all") != "all":
+        members = [page for page in members if (page.redirect_target is not None) == (params[f"{prefix}filterredir"] == "redirects")]
+    else:
+      raise MockApiError("badvalue", f"Unrecognized value for parameter \"list\": {module}.")
+    return [page for page in members if namespaces is None or page.namespace in namespaces]
+
+  def __linked_pages(self, module: str, pages: List[MockWikiPage], params: Dict[str, str], prefix: str) -> List[MockWikiPage]:
+    namespaces = parse_namespaces(params.get(f"{prefix}namespace", None))
+    titles = []
+    for page in pages:
+      if module == "templates":
+        titles += page.templates
+      elif module == "categories":
+        titles += page.categories
+      elif module == "redirects":
+        titles += sorted(self.__redirects.get(page.title, ()))
+    linked_pages = [self.pages[title] for title in sorted(set(titles)) if title in self.pages]
+    return [page for page in linked_pages if namespaces is None or page.namespace in namespaces]
+
+  def query(self, params: Dict[str, str], formatversion: int) -> dict:
+    result = {}
+    continued = {}
+    # Page set: titles, pageids or a generator
+    page_set = None
+    normalized = []
+    if "titles" in params:
+      page_set = []
+      for title in params["titles"].split("|"):
+        normalized_title = normalize_title(title)[0]
+        if normalized_title != title:
+          normalized.append({ "from": title, "to": normalized_title })
+        page_set.append((normalized_title, self.pages.get(normalized_title, None)))
+    elif "pageids" in params:
+      page_set = [(page.title, page) for page in (self.pages_by_id.get(int(page_id), None) for page_id in params["pageids"].split("|")) if page is not None]
+    if "generator" in params:
+      generator = params["generator"]
+      prefix = f"g{MODULE_PREFIXES.get(generator, '')}"
+      if MODULE_GROUPS.get(generator, None) == "prop":
+        # Prop generators (e.g. generator=templates&titles=...) list the linked pages of the given pages
+        pages = self.__linked_pages(generator, [page for _, page in page_set or [] if page is not None], params, prefix)
+      else:
+        pages = self.__list_pages(generator, params, prefix)
+      page_set = [(page.title, page) for page in self.__paginate(pages, params, prefix, f"{prefix}continue||", continued)]
+
+    if "list" in params:
+      for module in params["list"].split("|"):
+        prefix = MODULE_PREFIXES.get(module, "")
+        pages = self.__paginate(self.__list_pages(module, params, prefix), params, prefix, "-||", continued)
+        result[module] = [self.__page_entry(page, page.title, formatversion) for page in pages]
+
+    if page_set is not None:
+      props = params.get("prop", "").split("|") if params.get("prop", "") != "" else []
+      page_entries = []
+      for title, page in page_set:
+        entry = self.__page_entry(page, title, formatversion)
+        if page is not None:
+          for prop in props:
+            self.__add_prop(entry, page, prop, params, formatversion)
+        page_entries.append(entry)
+      if formatversion == 2:
+        result["pages"] = page_entries
+      else:
+        result["pages"] = { str(entry.get("pageid", -(i + 1))): entry for i, entry in enumerate(page_entries) }
+      if len(normalized) > 0:
+        result["normalized"] = normalized
+
+    for meta in params.get("meta", "").split("|"):
+      if meta == "siteinfo":
+        result.update(self.siteinfo(params))
+      elif meta == "userinfo":
+        result["userinfo"] = self.userinfo(formatversion)
+      elif meta == "tokens":
+        result["tokens"] = { f"{token_type}token": CONST_MOCK_TOKEN for token_type in params.get("type", "csrf").split("|") }
+
+    data = { "batchcomplete": True if formatversion == 2 else "" } if len(continued) == 0 else { "continue": continued }
+    if len(result) > 0:
+      data["query"] = result
+    return data
+
+  def __add_prop(self, entry: dict, page: MockWikiPage, prop: str, params: Dict[str, str], formatversion: int) -> None:
+    if prop == "info":
+      entry.update({
+        "contentmodel": "wikitext", "pagelanguage": "en", "pagelanguagehtmlcode": "en", "pagelanguagedir": "ltr",
+        "touched": page.timestamp, "lastrevid": page.rev_id, "length": len(page.text.encode("utf-8"))
+      })
+      if page.redirect_target is not None:
+        entry["redirect"] = True if formatversion == 2 else ""
+      if "protection" in params.get("inprop", ""):
+        entry["protection"] = []
+        entry["restrictiontypes"] = ["edit", "move"]
+    elif prop == "revisions":
+      revision = {
+        "revid": page.rev_id, "parentid": 0, "minor": False if formatversion == 2 else None, "user": "MockUser", "userid": 1,
+        "timestamp": page.timestamp, "comment": "", "sha1": hashlib.sha1(page.text.encode("utf-8")).hexdigest(),
+        "size": len(page.text.encode("utf-8")), "contentmodel": "wikitext"
+      }
+      if revision["minor"] is None:
+        del revision["minor"]
+      if "content" in params.get("rvprop", "ids|timestamp|flags|comment|user"):
+        self.pages_read.add(page.title)
+        content = { "contentmodel": "wikitext", "contentformat": "text/x-wiki" }
+        content["content" if formatversion == 2 else "*"] = page.text
+        if "rvslots" in params:
+          revision["slots"] = { "main": content }
+        else:
+          revision.update(content)
+      entry["revisions"] = [revision]
+    elif prop == "categories":
+      categories = page.categories
+      if "clcategories" in params:
+        wanted = set(normalize_title(category)[0] for category in params["clcategories"].split("|"))
+        categories = [category for category in categories if category in wanted]
+      if len(categories) > 0:
+        entry["categories"] = [{ "ns": CONST_NS_CATEGORY, "title": category, "sortkey": "", "sortkeyprefix": "", "hidden": False } for category in categories]
+    elif prop == "templates":
+      namespaces = parse_namespaces(params.get("tlnamespace", None))
+      templates = [normalize_title(template) for template in page.templates]
+      if "tltemplates" in params:
+        wanted = set(normalize_title(template)[0] for template in params["tltemplates"].split("|"))
+        templates = [template for template in templates if template[0] in wanted]
+      templates = [{ "ns": namespace, "title": title } for title, namespace in templates if namespaces is None or namespace in namespaces]
+      if len(templates) > 0:
+        entry["templates"] = templates
+    elif prop == "redirects":
+      namespaces = parse_namespaces(params.get("rdnamespace", None))
+      redirects = [self.pages[title] for title in sorted(self.__redirects.get(page.title, ()))]
+      redirects = [{ "pageid": redirect.page_id, "ns": redirect.namespace, "title": redirect.title } for redirect in redirects if namespaces is None or redirect.namespace in namespaces]
+      if len(redirects) > 0:
+        entry["redirects"] = redirects
+    elif prop == "categoryinfo" and page.namespace == CONST_NS_CATEGORY:
+      members = self.category_members(page.title)
+      num_subcats = sum(1 for member in members if member.namespace == CONST_NS_CATEGORY)
+      entry["categoryinfo"] = { "size": len(members), "pages": len(members) - num_subcats, "files": 0, "subcats": num_subcats }
+
+  def siteinfo(self, params: Dict[str, str]) -> dict:
+    result = {}
+    siprop = params.get("siprop", "general").split("|")
+    if "general" in siprop:
+      result["general"] = {
+        "mainpage": "Main Page", "base": f"http://{self.host}:{self.port}/wiki/Main_Page", "sitename": "Vocaloid Lyrics Wiki",
+        "generator": "MediaWiki 1.39.3", "phpversion": "8.1.0", "dbtype": "mysql", "case": "first-letter", "lang": "en",
+        "fallback": [], "rtl": False, "fallback8bitEncoding": "windows-1252", "writeapi": True, "timezone": "UTC", "timeoffset": 0,
+        "articlepath": "/wiki/$1", "scriptpath": "", "script": "/index.php", "server": f"http://{self.host}:{self.port}",
+        "servername": self.host, "wikiid": "vlwmock", "time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "maxarticlesize": 2097152, "legaltitlechars": " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+",
+        "invalidusernamechars": "@:>=", "linktrail": "/^([a-z]+)(.*)$/sD", "categorycollation": "uppercase",
+        "thumblimits": { "0": 120, "1": 150, "2": 180 }, "imagelimits": { "0": { "width": 640, "height": 480 } }, "magiclinks": {}
+      }
+    if "namespaces" in siprop:
+      result["namespaces"] = {
+        str(namespace): {
+          "id": namespace, "case": "first-letter", "name": name, "canonical": name, "subpages": namespace not in (0, 6, 14),
+          "content": namespace == 0, "nonincludable": False
+        } for namespace, name in NAMESPACE_NAMES.items()
+      }
+    # The mock has no extensions, aliases, interwikis, etc.
+    for prop in siprop:
+      if prop not in result:
+        result[prop] = []
+    return result
+
+  def userinfo(self, formatversion: int) -> dict:
+    # Every client is treated as already logged in as user_name (pywikibot only edits when logged in)
+    return {
+      "id": 1, "name": self.user_name, "groups": ["*", "user", "bot"],
+      "rights": ["read", "edit", "createpage", "writeapi", "bot", "apihighlimits", "noratelimit"], "ratelimits": {}
+    }
+
+  def edit(self, params: Dict[str, str], formatversion: int) -> dict:
+    if params.get("token", "") != CONST_MOCK_TOKEN:
+      raise MockApiError("badtoken", "Invalid CSRF token.")
+    if "title" in params:
+      title = normalize_title(params["title"])[0]
+    elif "pageid" in params and int(params["pageid"]) in self.pages_by_id:
+      title = self.pages_by_id[int(params["pageid"])].title
+    else:
+      raise MockApiError("missingtitle", "The page you specified doesn't exist.")
+    page = self.pages.get(title, None)
+    if page is None and "nocreate" in params:
+      raise MockApiError("missingtitle", "The page you specified doesn't exist.")
+    if page is not None and "createonly" in params:
+      raise MockApiError("articleexists", "The article you tried to create has been created already.")
+    old_text = page.text if page is not None else ""
+    text = params.get("prependtext", "") + params.get("text", old_text) + params.get("appendtext", "")
+    result = { "result": "Success", "title": title, "contentmodel": "wikitext" }
+    if page is not None and text == old_text:
+      result.update({ "pageid": page.page_id, "nochange": True if formatversion == 2 else "" })
+      return { "edit": result }
+    old_rev_id = page.rev_id if page is not None else 0
+    page = self.add_page(title, text)
+    self.num_edits += 1
+    self.edits_by_title[title] += 1
+    result.update({ "pageid": page.page_id, "oldrevid": old_rev_id, "newrevid": page.rev_id, "newtimestamp": page.timestamp })
+    if old_rev_id == 0:
+      result["new"] = True if formatversion == 2 else ""
+    return { "edit": result }
+
+  def paraminfo(self, params: Dict[str, str]) -> dict:
+    modules = []
+    for path in params.get("modules", "").split("|") + [f"query+{module}" for module in params.get("querymodules", "").split("|") if module != ""]:
+      if path == "":
+        continue
+      name = path.split("+")[-1]
+      if path == "main":
+        parameters = [
+          { "name": "action", "type": CONST_ACTIONS, "submodules": { action: action for action in CONST_ACTIONS } },
+          { "name": "format", "type": ["json"], "default": "json" },
+          { "name": "maxlag", "type": "integer" }, { "name": "assert", "type": ["anon", "bot", "user"] }
+        ]
+        modules.append({ "name": "main", "classname": "ApiMain", "path": "main", "group": "action", "prefix": "", "parameters": parameters })
+      elif path == "query":
+        parameters = []
+        for group in ("prop", "list", "meta"):
+          names = [module for module, module_group in MODULE_GROUPS.items() if module_group == group]
+          parameters.append({ "name": group, "type": names, "multi": True, "limit": 50, "highlimit": 500, "submodules": { module: f"query+{module}" for module in names } })
+        generators = [module for module, module_group in MODULE_GROUPS.items() if module_group in ("list", "prop") and module in GENERATOR_MODULES]
+        parameters.append({ "name": "generator", "type": generators, "submodules": { module: f"query+{module}" for module in generators } })
+        parameters += [{ "name": "titles", "type": "string", "multi": True, "limit": 50, "highlimit": 500 }, { "name": "pageids", "type": "integer", "multi": True, "limit": 50, "highlimit": 500 }]
+        modules.append({ "name": "query", "classname": "ApiQuery", "path": "query", "group": "action", "prefix": "", "parameters": parameters })
+      elif path.startswith("query+") and name in MODULE_GROUPS:
+        parameters = [
+          { "name": "limit", "type": "limit", "default": 10, "min": 1, "max": 500, "highmax": 5000 },
+          { "name": "prop", "type": [], "multi": True, "limit": 50, "highlimit": 500 }
+        ]
+        if name in ("categorymembers", "allpages", "templates", "redirects"):
+          parameters.append({ "name": "namespace", "type": "namespace", "multi": name != "allpages" })
+        if name == "tokens":
+          parameters = [{ "name": "type", "type": CONST_TOKEN_TYPES, "multi": True, "default": "csrf" }]
+        modules.append({
+          "name": name, "classname": f"ApiQuery{name.capitalize()}", "path": path, "group": MODULE_GROUPS[name],
+          "prefix": MODULE_PREFIXES.get(name, ""), "parameters": parameters, "generator": name in GENERATOR_MODULES
+        })
+      else:
+        modules.append({ "name": name, "classname": f"Api{name.capitalize()}", "path": path, "group": "action", "prefix": "", "parameters": [] })
+    return { "paraminfo": { "modules": modules } }
+
+class MockApiError(Exception):
+  code: str
+  info: str
+
+  def __init__(self, code: str, info: str):
+    super().__init__(info)
+    self.code = code
+    self.info = info
+
+def normalize_title(title: str, default_namespace: int = 0) -> Tuple[str, int]:
+  """Normalize a title like MediaWiki does (underscores, spaces, namespace name, first letter) and get its namespace"""
+  title = " ".join(title.replace("_", " ").split()).lstrip(":")
+  namespace = default_namespace
+  prefix, separator, name = title.partition(":")
+  if separator != "" and prefix.strip().capitalize() in NAMESPACE_IDS:
+    namespace = NAMESPACE_IDS[prefix.strip().capitalize()]
+    title = name.strip()
+  title = title[:1].upper() + title[1:]
+  return (f"{NAMESPACE_NAMES[namespace]}:{title}" if namespace != 0 else title, namespace)
+
+def parse_namespaces(namespaces: Optional[str]) -> Optional[Set[int]]:
+  if namespaces is None or namespaces in ("", "*"):
+    return None
+  return set(int(namespace) for namespace in namespaces.split("|"))
+
+def percentile(values: List[float], fraction: float) -> float:
+  if len(values) == 0:
+    return 0
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
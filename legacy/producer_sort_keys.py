@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+
+Sort keys for ordering the rows of the producer works tables ({{pwt row}}/{{pht row}}) and album works tables
+({{awt row}}) in the producer pages of the Vocaloid Lyrics Wiki.
+
+The rows are sorted by the romanized title of each song/album: the manual romanization given in |rom=, or else
+the romanization in the brackets of the page title (e.g. "曲名 (Kyokumei)"), with tone marks removed.
+
+Requires Python 3.10+
+
+"""
+
+import functools
+import regex as re
+
+# NUMBER OF SORT KEYS KEPT IN MEMORY (ONE PER DISTINCT ROW)
+CONST_SORT_KEY_CACHE_SIZE = 65536
+
+TRANSLATE_DETONE_PINYIN = str.maketrans({
+  **dict.fromkeys("āáǎà", "a"), **dict.fromkeys("ĀÁǍÀ", "A"),
+  **dict.fromkeys("īíǐì", "i"), **dict.fromkeys("ĪÍǏÌ", "I"),
+  **dict.fromkeys("ūúǔù", "u"), **dict.fromkeys("ŪÚǓÙ", "U"),
+  **dict.fromkeys("ēéěè", "e"), **dict.fromkeys("ĒÉĚÈ", "E"),
+  **dict.fromkeys("ōóǒò", "o"), **dict.fromkeys("ŌÓǑÒ", "O"),
+})
+TRANSLATE_UMLAUT = str.maketrans({ **dict.fromkeys("ǖǘǚǜ", "ü"), **dict.fromkeys("ǕǗǙǛ", "Ü") })
+TRANSLATE_UMLAUT_TO_V = str.maketrans({ **dict.fromkeys("ǖǘǚǜ", "v"), **dict.fromkeys("ǕǗǙǛ", "V") })
+TRANSLATE_STRIP_PUNCTUATION = str.maketrans(dict.fromkeys("[()]\"'¿?『』「」:’"))
+
+RX_ALBUM_SUFFIX = re.compile(r" \(album\)$")
+RX_SUBPAGE_SUFFIX = re.compile(r"(?<=\))\/.*$")
+RX_ROMANIZATION = re.compile(r"(?<=\s\()[ -~ĀÁǍÀĒÉĚÈŌÓǑÒ].*(?=\)$)")
+RX_NESTED_BRACKETS = re.compile(r"^[^\(]*\)[^\(]*\(")
+RX_NON_ASCII = re.compile(r"[^ -~]")
+RX_ROW_TITLE = re.compile(r"^[^\|]*")
+RX_ROW_TITLE_PARAM = re.compile(r"^\s*1\s*=\s*")
+RX_ESCAPED_EQUALS = re.compile(r"\{\{=\}\}")
+RX_MANUAL_ROMANIZATION = re.compile(r"\|rom\s*=\s*([^\|]*)")
+
+def detone_pinyin(text: str, show_umlaut: bool) -> str:
+  text = text.translate(TRANSLATE_DETONE_PINYIN)
+  return text.translate(TRANSLATE_UMLAUT if show_umlaut else TRANSLATE_UMLAUT_TO_V)
+
+def get_romaji(wikipage_name: str) -> str:
+  extracted_romaji = RX_ALBUM_SUFFIX.sub("", wikipage_name)
+  extracted_romaji = RX_SUBPAGE_SUFFIX.sub("", extracted_romaji)
+  try_find_regex = RX_ROMANIZATION.search(extracted_romaji)
+  if try_find_regex is None:
+    return wikipage_name
+  extracted_romaji = try_find_regex.group(0)
+  while True:
+    extracted_romaji, num_subs = RX_NESTED_BRACKETS.subn("", extracted_romaji)
+    if num_subs == 0:
+      break
+  try_original_title = wikipage_name.replace(" (" + extracted_romaji + ")", "")
+  if RX_NON_ASCII.search(try_original_title) is None:
+    # Title is already in English
+    return wikipage_name
+  return extracted_romaji
+
+@functools.lru_cache(maxsize=CONST_SORT_KEY_CACHE_SIZE)
+def get_sort_value(pwt_template_input: str) -> str:
+  """
+  Get the sort key of a table row, given the parameters of its {{pwt row}}/{{pht row}}/{{awt row}} template
+  (or only the page title, for rows that are not in the table yet).
+  """
+  page_title = RX_ROW_TITLE.search(pwt_template_input).group(0)
+  page_title = RX_ESCAPED_EQUALS.sub("=", RX_ROW_TITLE_PARAM.sub("", page_title))
+
+  rom_title = get_romaji(page_title)
+
+  misc_params = pwt_template_input.replace(page_title, "")
+
+  #Deduce manual romanization
+  manual_rom = RX_MANUAL_ROMANIZATION.search(misc_params)
+  manual_rom = manual_rom.group(1) if not manual_rom is None else ""
+  rom_title = manual_rom if manual_rom != "" else rom_title
+
+  #Finishing operations
+  rom_title = detone_pinyin(rom_title, False).lower()
+  rom_title = rom_title.translate(TRANSLATE_STRIP_PUNCTUATION)
+  rom_title += misc_params
+
+  return rom_title
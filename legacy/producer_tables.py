@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+"""
+
+Helpers for reading the producer works tables ({{pwt head}}/{{pwt row}}/{{pht row}}) and album works tables
+({{awt head}}/{{awt row}}) in the producer pages of the Vocaloid Lyrics Wiki.
+
+Requires Python 3.10+
+
+"""
+
+import regex as re
+
+from typing import Callable, Iterable, List, Set, Tuple, TypeVar
+
+SpanEdit = Tuple[int, int, str]
+
+Row = TypeVar("Row")
+
+RX_TABLE_HEAD = re.compile(r"""(?#
+    )\{\|\s*class=[\"']sortable\s+producer-table[\"']\s*\n(?#
+    )\|-[^\{\}\n]*?\n(?#
+    )!\s*\{\{\s*(?P<kind>[PpAa])wt[ _]head\s*\}\}\s*\n""")
+RX_PWT_ROW_TEMPLATE = re.compile(r"""(?#
+    individual pwt row header
+    )(?:\|-[^\n]*\n[\s\u200B]*\|[\s\u200B]*)(?#
+    individual pwt/pht row template
+    )\{\{\s*[Pp][wh]t[ _]row\s*\|([^\n]*)\}\}(?#
+    followed by new row
+    )(?=[\s\u200B]*\n)""", re.S)
+RX_AWT_ROW_TEMPLATE = re.compile(r"""(?#
+    individual awt row header
+    )(?:\|-[^\n]*\n[\s\u200B]*\|[\s\u200B]*)(?#
+    individual awt row template
+    )\{\{\s*[Aa]wt[ _]row\s*\|([^\n]*)\}\}(?#
+    followed by new row
+    )(?=[\s\u200B]*\n)""", re.S)
+
+RX_ALBUM_TITLE = re.compile(r" \((album|E\.?P\.?)\)$")
+RX_ROW_TITLE = re.compile(r"^[^\|]*")
+RX_ROW_TITLE_PARAM = re.compile(r"^\s*1\s*=\s*")
+RX_ESCAPED_EQUALS = re.compile(r"\{\{=\}\}")
+RX_WHITESPACE = re.compile(r"[\s_]+")
+
+class OverlappingSpansException(Exception):
+  pass
+
+class TableRow:
+  """A {{pwt row}}/{{pht row}}/{{awt row}} of a producer table, with its "|-" row header"""
+  template_input: str
+  wikitext: str
+  start: int
+  end: int
+
+  def __init__(self, match):
+    self.template_input = match.group(1)
+    self.wikitext = match.group(0)
+    self.start, self.end = match.span()
+
+  @property
+  def title(self) -> str:
+    return get_row_title(self.template_input)
+
+class ProducerTable:
+  """A producer works table ("pwt") or album works table ("awt") of a producer page, with its rows"""
+  kind: str
+  head: str
+  wikitext: str
+  rows: List[TableRow]
+  start: int
+  end: int
+
+  def __init__(self, kind: str, page_contents: str, start: int, head_end: int, end: int):
+    self.kind = kind
+    self.head = page_contents[start:head_end]
+    self.wikitext = page_contents[start:end]
+    self.start = start
+    self.end = end
+    rx_row = RX_PWT_ROW_TEMPLATE if kind == "pwt" else RX_AWT_ROW_TEMPLATE
+    self.rows = [TableRow(m) for m in rx_row.finditer(page_contents, start, end)]
+
+  def span(self) -> Tuple[int, int]:
+    return (self.start, self.end)
+
+def normalize_title(title: str) -> str:
+  """Normalize a page title the same way MediaWiki does (underscores, repeated spaces and the first letter)"""
+  title = RX_WHITESPACE.sub(" ", title).strip()
+  return title[:1].upper() + title[1:]
+
+def get_row_title(row_input: str) -> str:
+  """Get the page title (the first parameter) from the parameters of a {{pwt row}}/{{pht row}}/{{awt row}}"""
+  page_title = RX_ROW_TITLE.search(row_input).group(0)
+  return RX_ESCAPED_EQUALS.sub("=", RX_ROW_TITLE_PARAM.sub("", page_title))
+
+def split_songs_and_albums(titles: Iterable[str]) -> Tuple[Set[str], Set[str]]:
+  set_linked_songs = set()
+  set_linked_albums = set()
+  for title in titles:
+    if RX_ALBUM_TITLE.search(title) is not None:
+      set_linked_albums.add(title)
+    else:
+      set_linked_songs.add(title)
+  return (set_linked_songs, set_linked_albums)
+
+def find_table_end(page_contents: str, position: int) -> int:
+  """Get the position after the first "|}" (that is not part of "|}}") from the given position, or -1"""
+  while True:
+    position = page_contents.find("|}", position)
+    if position == -1:
+      return -1
+    if not page_contents.startswith("}", position + 2):
+      return position + 2
+    position += 1
+
+def scan_producer_tables(page_contents: str) -> List[ProducerTable]:
+  """
+  Find the pwt and awt tables of a producer page, and their rows, in one forward pass over the wikitext.
+
+  A table starts at a "{|" with a producer-table class and a {{pwt head}}/{{awt head}} header, and ends at the first
+  "|}" after the header that is not followed by another "}".
+  """
+  tables = []
+  next_start = { "pwt": 0, "awt": 0 }
+  head = RX_TABLE_HEAD.search(page_contents)
+  while head is not None:
+    kind = head.group("kind").lower() + "wt"
+    if head.start() >= next_start[kind]:
+      end = find_table_end(page_contents, head.end())
+      if end == -1:
+        # There is no "|}" left for this table, or for any table after it
+        break
+      tables.append(ProducerTable(kind, page_contents, head.start(), head.end(), end))
+      next_start[kind] = end
+    head = RX_TABLE_HEAD.search(page_contents, head.start() + 2)
+  return tables
+
+def find_producer_tables(page_contents: str, kind: str) -> List[ProducerTable]:
+  """Get the tables of the given kind ("pwt" or "awt") of a producer page"""
+  return [table for table in scan_producer_tables(page_contents) if table.kind == kind]
+
+def is_table_overlapping(page_contents: str, table: ProducerTable) -> bool:
+  """
+  Whether another producer table starts inside the given table. A table missing its closing "|}" ends at the "|}" of
+  the next table, and then overlaps it.
+  """
+  return RX_TABLE_HEAD.search(page_contents, table.start + 1, table.end) is not None
+
+def extract_linked_pages_in_tables(page_contents: str) -> Tuple[Set[str], Set[str]]:
+  """
+  Get the song pages and album pages listed in the pwt/awt tables of a producer page, straight from the wikitext.
+
+  This is the local equivalent of querying the pages transcluded by the producer page (prop=templates).
+  """
+  titles = set()
+  for table in scan_producer_tables(page_contents):
+    for row in table.rows:
+      title = normalize_title(row.title)
+      if title != "":
+        titles.add(title)
+  return split_songs_and_albums(titles)
+
+def merge_missing_rows(rows: List[Row], missing_rows: List[Row], key: Callable[[Row], str]) -> List[Row]:
+  """
+  Insert the missing rows into the rows of a table, in a single merge pass.
+
+  Gives the same order as inserting each missing row (in the given order) before the first row with a greater sort
+  key, even if the existing rows are not sorted: a missing row goes before the first existing row whose sort key,
+  or the sort key of any existing row above it, is greater than its own. Missing rows with equal sort keys keep
+  their given order.
+  """
+  missing_rows = sorted(missing_rows, key=key)
+  merged_rows = []
+  next_missing = 0
+  max_key = None
+  for row in rows:
+    row_key = key(row)
+    if max_key is None or row_key > max_key:
+      max_key = row_key
+    while next_missing < len(missing_rows) and key(missing_rows[next_missing]) < max_key:
+      merged_rows.append(missing_rows[next_missing])
+      next_missing += 1
+    merged_rows.append(row)
+  merged_rows.extend(missing_rows[next_missing:])
+  return merged_rows
+
+def splice_spans(text: str, edits: Iterable[SpanEdit]) -> str:
+  """
+  Replace each (start, end) span of the text with the given replacement, in a single pass over the text.
+
+  The spans come from the matches the replacements were built from (match.span()), so that only that exact
+  occurrence is replaced. Spans may be given in any order but must not overlap.
+  """
+  pieces = []
+  position = 0
+  for start, end, replacement in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+    if start < position:
+      raise OverlappingSpansException(f"Span ({start}, {end}) overlaps an earlier edit ending at {position}.")
+    pieces.append(text[position:start])
+    pieces.append(replacement)
+    position = end
+  pieces.append(text[position:])
+  return "".join(pieces)
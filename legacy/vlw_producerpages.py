@@ -4,7 +4,7 @@
 This is a custom bot for bulk updating of producer pages in the Vocaloid Lyrics Wiki.
 
 Requires Python 3.10+
-Requires the file async_bot_wrapper.py to be saved in the same folder as this script
+Requires the files async_bot_wrapper.py, api_client.py, category_index.py, category_cache.py, recent_changes.py, rate_limiter.py, bot_metrics.py, run_checkpoint.py, shard_runner.py, result_sink.py, report_builder.py, xml_dump.py, producer_sort_keys.py and producer_tables.py to be saved in the same folder as this script
 
 It uses the pywikibot wrapper to query the contents of the producer pages in batches, then proceeds to 
 asynchronously edit each producer page. As a result, total execution time is in a few minutes rather than hours.
@@ -20,6 +20,53 @@ python pwb.py vlw_producerpages -from:<page_title>
 python pwb.py vlw_producerpages -page:<page_title>
   To edit only the given page.
 
+python pwb.py vlw_producerpages [options] -localtables
+  Read the songs and albums already in the pwt/awt tables from the producer page wikitext, 
+  instead of querying the API for the pages transcluded by the producer page.
+
+python pwb.py vlw_producerpages [options] -verifytables
+  Same as -localtables, but also query the API and log any difference between the two results.
+
+python pwb.py vlw_producerpages [options] -categoryindex
+  Before editing, enumerate the categories of all song/album pages (and category pages) once, 
+  instead of querying the producer categories of each producer page.
+
+python pwb.py vlw_producerpages [options] -categorycache[:<file>]
+  Keep the members of the producer categories in a local SQLite file between runs. On each run, only the 
+  categories that have changed since the last run (according to the recent changes and the deletion/move logs) 
+  are downloaded again.
+
+python pwb.py vlw_producerpages [options] -incremental[:<file>]
+  Only edit the producer pages whose producer categories had songs/albums added or recategorized since the last 
+  successful run. The time of the last successful run is kept in a local file. If no previous run is found, 
+  all producer pages are edited. A run under -simulate, where a producer page could not be saved, or where a 
+  shard failed (-shards), does not count as a successful run.
+
+python pwb.py vlw_producerpages [options] -dump:<file>[,<file>...] [-report:<file>] [-patch:<file>]
+  Audit the producer pages offline, from MediaWiki XML dumps (e.g. -dump:"exported-vlw-*.xml"), without any 
+  network access. The dumps should include the producer pages, the song and album pages and the category pages. 
+  The category members are read from the [[Category:...]] tags in the dumped wikitext. Nothing is saved to the 
+  wiki: the missing songs/albums of each producer are written to the report file, and the table edits are 
+  written to the patch file as unified diffs.
+
+python pwb.py vlw_producerpages [options] -checkpoint[:<file>]
+  Keep a journal of the completed producer pages in a local file. If the run crashes or is interrupted, run the 
+  same command again to resume it: the completed pages are skipped (their contents are not downloaded again), 
+  and their errors and missing songs/albums are kept for the final report. The journal is deleted at the end 
+  of a complete run.
+
+python pwb.py vlw_producerpages [options] -shards:<n>
+  Split the producer pages into n disjoint shards (by a hash of their titles), and edit each shard in its own 
+  process, so that the parsing and editing of the wikitext uses n CPU cores. The edits of all shards share the 
+  same edit rate limit, and the API request rate is split between the shards. The results of all shards are 
+  merged into a single report. The checkpoint, category cache, metrics and patch files get one file per shard. If 
+  a shard fails, the report is still saved with the results of the other shards, and is marked as partial.
+
+python pwb.py vlw_producerpages [options] -metrics[:<file prefix>]
+  At the end of the run, write the metrics of the run (time spent per page fetching, transforming and saving, 
+  queue depths over time, API requests and bytes per page, errors by type) to <file prefix>.json and to 
+  <file prefix>.prom (for the textfile collector of the Prometheus node exporter).
+
 python pwb.py vlw_producerpages [options] -simulate
   For testing of the bot. -simulate blocks all changes from being saved to the real wiki.
 
@@ -28,27 +75,85 @@ python pwb.py vlw_producerpages [options] -simulate
 import pywikibot
 from pywikibot import pagegenerators
 from async_bot_wrapper import AsyncBotWrapper, ENUM_LOGGER_STATES, ENUM_ANSI_COLOURS
+from api_client import ApiClient, BatchedPropQuery
+from rate_limiter import AdaptiveRateLimiter
+from category_index import CategoryIndex
+from category_cache import CategoryMembersCache
+from recent_changes import RunWatermark, get_recently_categorized
+from run_checkpoint import RunCheckpoint
+from shard_runner import run_sharded, is_in_shard, shard_path
+from report_builder import ReportBuilder
+from xml_dump import DumpPage, iter_dump_pages, expand_dump_paths
+from producer_sort_keys import get_sort_value
+from producer_tables import (
+  find_producer_tables, scan_producer_tables, is_table_overlapping, extract_linked_pages_in_tables, split_songs_and_albums,
+  merge_missing_rows, splice_spans, SpanEdit
+)
 import asyncio
-import aiohttp
-import urllib.parse
+import difflib
+import functools
+import os
+import threading
 import regex as re
+import mwparserfromhell
 
-from typing import List, Tuple, Set, Any, Optional
+from typing import List, Tuple, Set, Any, Optional, Iterator, Dict
 
-from datetime import datetime
+from datetime import datetime, timezone
 
 import pywikibot.pagegenerators
 
 # If using your own bot, edit this to save the report to another page
 CONST_WIKI_REPORT_BLOG = "User:CcxBot/Missing PWT Entries"
+# REPORTS LARGER THAN THIS (IN BYTES) ARE SPLIT INTO NUMBERED SUBPAGES OF THE REPORT PAGE ($wgMaxArticleSize IS 2048 KIB BY DEFAULT)
+CONST_WIKI_MAX_PAGE_SIZE = 2000 * 1024
+CONST_WIKI_REPORT_UNUSED_SUBPAGE = "''This part of the report is no longer used.''"
 
 # This will prolly not change in the future
 CONST_WIKI_API_ENTRYPOINT = "https://vocaloidlyrics.fandom.com/api.php"
 
+CONST_CATEGORY_PRODUCERS = "Category:Producers"
+CONST_CATEGORY_COMPILATION_ALBUMS = "Category:Compilation_albums"
+
+# DEFAULT LOCATION OF THE CATEGORY MEMBERS CACHE (-categorycache)
+CONST_CATEGORY_CACHE_FILE = "vlw_producerpages_categories.sqlite3"
+# DEFAULT LOCATION OF THE TIMESTAMP OF THE LAST SUCCESSFUL RUN (-incremental)
+CONST_WATERMARK_FILE = "vlw_producerpages_lastrun.json"
+# DEFAULT LOCATIONS OF THE REPORT AND THE PATCH FILE OF AN OFFLINE AUDIT (-dump)
+CONST_AUDIT_REPORT_FILE = "vlw_producerpages_audit.txt"
+CONST_AUDIT_PATCH_FILE = "vlw_producerpages_audit.patch"
+# DEFAULT LOCATION OF THE JOURNAL OF COMPLETED PAGES (-checkpoint)
+CONST_CHECKPOINT_FILE = "vlw_producerpages_checkpoint.jsonl"
+# RESULTS OF THE PAGES, WRITTEN AS EACH PAGE IS COMPLETED (ONE JSON ARRAY PER LINE), THEN READ BACK FOR THE REPORT AND DELETED
+CONST_RESULTS_FILE = "vlw_producerpages_results.jsonl"
+# DEFAULT PREFIX OF THE METRICS FILES (-metrics)
+CONST_METRICS_FILE = "vlw_producerpages_metrics"
+# NUMBER OF SECONDS BETWEEN TWO PROGRESS LINES
+CONST_PROGRESS_INTERVAL = 30
+
 # MAXIMUM SIZE OF QUEUE OF TASKS
 CONST_QUEUE_SIZE = 500
 # NUMBER OF ASYNCHRONOUS THREADS RUNNING AT A SINGLE TIME (ONE THREAD PROCESSES AND SAVES EACH PAGE)
 CONST_NUM_TASK_CONSUMERS = 100
+# NUMBER OF WORKER THREADS FOR BLOCKING PYWIKIBOT CALLS (PAGE LOOKUPS AND SAVES)
+CONST_NUM_WORKER_THREADS = 20
+# NUMBER OF PAGES SAVED AT A SINGLE TIME, AND THE NUMBER OF EDITED PAGES THAT CAN WAIT TO BE SAVED
+CONST_NUM_SAVE_WORKERS = 5
+CONST_SAVE_QUEUE_SIZE = 50
+# MAXIMUM NUMBER OF EDITS PER MINUTE
+CONST_EDITS_PER_MINUTE = 120
+# MAXIMUM NUMBER OF OPEN CONNECTIONS TO THE WIKI API (IN TOTAL, AND PER HOST)
+CONST_API_CONNECTION_LIMIT = 100
+CONST_API_CONNECTION_LIMIT_PER_HOST = 30
+# NUMBER OF SECONDS TO CACHE DNS LOOKUPS OF THE WIKI API
+CONST_API_DNS_CACHE_TTL = 600
+# INITIAL AND MAXIMUM NUMBER OF API REQUESTS PER SECOND (THE RATE IS LOWERED AUTOMATICALLY WHEN THE WIKI IS LAGGING OR THROTTLES THE BOT)
+CONST_API_INITIAL_RATE = 10
+CONST_API_MAX_RATE = 40
+# SEND maxlag=... WITH EVERY API REQUEST, SO THAT THE BOT BACKS OFF WHEN THE WIKI'S DATABASE REPLICAS ARE LAGGING
+CONST_API_MAXLAG = 5
+# NUMBER OF PRODUCER PAGES WHOSE TRANSCLUDED PAGES ARE LOOKED UP IN ONE API REQUEST (UP TO 500 IF THE BOT HAS APIHIGHLIMITS)
+CONST_TEMPLATE_QUERY_BATCH_SIZE = 50
 
 class PageNotFoundException(Exception):
   pass
@@ -60,56 +165,132 @@ class FailedToUpdateAwtTables(Exception):
 class ProducerPageEditor(AsyncBotWrapper):
   CONST_EDIT_SUMMARY = "Bot: Auto-adding songs and albums to the producer page tables"
   mode_onepageonly: bool
+  use_local_tables: bool
+  verify_local_tables: bool
+  use_category_index: bool
+  category_index: Optional[CategoryIndex]
+  category_cache_path: Optional[str]
+  category_cache: Optional[CategoryMembersCache]
+  watermark: Optional[RunWatermark]
+  run_started_at: Optional[datetime]
+  dump_paths: Optional[List[str]]
+  report_path: Optional[str]
+  patch_path: Optional[str]
+  shard: Optional[Tuple[int, int]]
 
   __rxProdCat = re.compile(r"\{\{\s*[Pp]rodLinks\s*\|([^\}\|]*)")
   __rxProdCatParam = re.compile(r"\s*\b(catname|1)\b\s*=\s*")
-  __rxPwtTable = re.compile(r"""(?#
-      )(?P<head>{\|\s*class=[\"']sortable\s+producer-table[\"']\s*\n(?#
-      )\|-[^\{\}\n]*?\n(?#
-      )!\s*\{\{\s*[Pp]wt[ _]head\s*\}\}\s*\n)(?#
-      )(.*?(?!\|\}\}))\|\}""", re.S)
-  __rxAwtTable = re.compile(r"""(?#
-      )(?P<head>{\|\s*class=[\"']sortable\s+producer-table[\"']\s*\n(?#
-      )\|-[^\{\}\n]*?\n(?#
-      )!\s*\{\{\s*[Aa]wt[ _]head\s*\}\}\s*\n)(?#
-      )(.*?(?!\|\}\}))\|\}""", re.S)
-  __rxPwtRowTemplate = re.compile(r"""(?#
-      individual pwt row header
-      )(?:\|-[^\n]*\n[\s\u200B]*\|[\s\u200B]*)(?#
-      individual pwt/pht row template
-      )\{\{\s*[Pp][wh]t[ _]row\s*\|([^\n]*)\}\}(?#
-      followed by new row
-      )(?=[\s\u200B]*\n)""", re.S)
-  __rxAwtRowTemplate = re.compile(r"""(?#
-      individual awt row header
-      )(?:\|-[^\n]*\n[\s\u200B]*\|[\s\u200B]*)(?#
-      individual awt row template
-      )\{\{\s*[Aa]wt[ _]row\s*\|([^\n]*)\}\}(?#
-      followed by new row
-      )(?=[\s\u200B]*\n)""", re.S)
-
-  def __init__(self, from_page: Optional[str] = None, only_page: Optional[str] = None):    
+  __rxProdSongsCategory = re.compile(r"^Category:(.+?) songs list(?:/.*)?$")
+
+  def __init__(
+    self, 
+    from_page: Optional[str] = None, 
+    only_page: Optional[str] = None, 
+    use_local_tables: bool = False, 
+    verify_local_tables: bool = False,
+    use_category_index: bool = False,
+    category_cache_path: Optional[str] = None,
+    watermark_path: Optional[str] = None,
+    dump_paths: Optional[List[str]] = None,
+    report_path: Optional[str] = None,
+    patch_path: Optional[str] = None,
+    metrics_path: Optional[str] = None,
+    checkpoint_path: Optional[str] = None,
+    shard: Optional[Tuple[int, int]] = None
+  ):    
+    self.dump_paths = dump_paths
+    self.report_path = report_path or CONST_AUDIT_REPORT_FILE
+    self.patch_path = patch_path or CONST_AUDIT_PATCH_FILE
+    self.__num_merged_patches = 0
+    # Titles of the producer pages that could not be saved (appended from the save threads)
+    self.__failed_saves: List[str] = []
+    results_path = CONST_RESULTS_FILE
+    if shard is not None:
+      # Each shard has files of its own, the patch files are merged by the parent process
+      self.patch_path = shard_path(self.patch_path, shard)
+      category_cache_path = shard_path(category_cache_path, shard) if category_cache_path is not None else None
+      metrics_path = shard_path(metrics_path, shard) if metrics_path is not None else None
+      checkpoint_path = shard_path(checkpoint_path, shard) if checkpoint_path is not None else None
+      results_path = shard_path(results_path, shard)
+    self.__patch_lock = threading.Lock()
+    if self.dump_paths is not None:
+      # Offline audit: the tables are read from the wikitext, and the category members from the dumps
+      use_local_tables, verify_local_tables, use_category_index = True, False, True
+      category_cache_path, watermark_path = None, None
     self.mode_onepageonly = only_page is not None
-    if self.mode_onepageonly:
+    self.use_local_tables = use_local_tables or verify_local_tables
+    self.verify_local_tables = verify_local_tables
+    self.use_category_index = use_category_index
+    self.category_index = None
+    self.category_cache_path = category_cache_path
+    self.category_cache = None
+    self.watermark = RunWatermark(watermark_path) if watermark_path is not None else None
+    self.run_started_at = None
+    checkpoint = RunCheckpoint(checkpoint_path) if checkpoint_path is not None else None
+    if self.dump_paths is not None:
+      gen = self.__get_producer_pages_in_dumps(from_page, only_page)
+    elif self.mode_onepageonly:
       # producer_page = pywikibot.Page(self.site, only_page)
       gen = pagegenerators.PagesFromTitlesGenerator([only_page], pywikibot.Site())
     else:
-      producer_category = pywikibot.Category(pywikibot.Site(), 'Category:Producers')
+      producer_category = pywikibot.Category(pywikibot.Site(), CONST_CATEGORY_PRODUCERS)
+      is_resumed = checkpoint is not None and checkpoint.is_resumed
       gen = pagegenerators.CategorizedPageGenerator(
         producer_category, 
-        content=True,
+        content=not is_resumed and shard is None,
         start=from_page,
         recurse=False, namespaces=0
       )
+      if is_resumed or shard is not None:
+        # Only list the producer pages completed before the run was interrupted, or those of the other shards, 
+        # without downloading their contents
+        gen = (
+          page for page in gen
+          if (not is_resumed or not checkpoint.is_completed(page.title())) and (shard is None or is_in_shard(page.title(), shard))
+        )
       gen = pagegenerators.PreloadingGenerator(gen, groupsize=50)
+    num_shards = shard[1] if shard is not None else 1
     super().__init__(
       generator=gen, 
       queue_size=CONST_QUEUE_SIZE, 
-      num_consumers=CONST_NUM_TASK_CONSUMERS
+      num_consumers=CONST_NUM_TASK_CONSUMERS,
+      num_workers=CONST_NUM_WORKER_THREADS,
+      threaded_producer=True,
+      save_queue_size=CONST_SAVE_QUEUE_SIZE,
+      num_savers=CONST_NUM_SAVE_WORKERS,
+      edits_per_minute=CONST_EDITS_PER_MINUTE if self.dump_paths is None else None,
+      progress_interval=CONST_PROGRESS_INTERVAL,
+      metrics_path=metrics_path,
+      checkpoint=checkpoint,
+      shard=shard,
+      results_path=results_path,
+      api=None if self.dump_paths is not None else ApiClient(
+        CONST_WIKI_API_ENTRYPOINT,
+        connection_limit=CONST_API_CONNECTION_LIMIT,
+        connection_limit_per_host=CONST_API_CONNECTION_LIMIT_PER_HOST,
+        dns_cache_ttl=CONST_API_DNS_CACHE_TTL,
+        rate_limiter=AdaptiveRateLimiter(rate=CONST_API_INITIAL_RATE / num_shards, max_rate=CONST_API_MAX_RATE / num_shards),
+        maxlag=CONST_API_MAXLAG
+      )
+    )
+    self.__template_query = BatchedPropQuery(
+      self.api,
+      {
+        "action": "query",
+        "format": "json",
+        "prop": "templates",
+        "tlnamespace": 0,
+        "tllimit": "max",
+        "tldir": "ascending",
+        "origin": "*",
+      },
+      prop="templates",
+      batch_size=CONST_TEMPLATE_QUERY_BATCH_SIZE
     )
 
   async def treat_one_page(self, page: pywikibot.Page) -> Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]:
     is_edited = False
+    table_edits = []
     failed_to_add = None
     err_message = None
     page_title = None
@@ -117,12 +298,7 @@ class ProducerPageEditor(AsyncBotWrapper):
       return (None, None, None, None, None)
     try:
       page_title = page.title()
-      if not page.exists():
-        raise PageNotFoundException("Page doesn't exist")
-      elif page.isRedirectPage():
-        raise PageNotFoundException("Page is a redirect")
-      
-      page_contents = page.text
+      page_contents = await self.fetch_blocking(self.__load_page_contents, page)
       prod_category = self.__get_producer_category(page_contents)
       
       #self.log(f"[{page_title}]\t{ENUM_ANSI_COLOURS.magenta.value}Main category page is: {prod_category} songs list{ENUM_ANSI_COLOURS.default.value}")
@@ -130,6 +306,8 @@ class ProducerPageEditor(AsyncBotWrapper):
       (song_pages_in_category, album_pages_in_category, (song_pages_in_table, album_pages_in_table)) = await asyncio.gather(
         self.__get_song_pages_in_producer_category(prod_category),
         self.__get_album_pages_in_producer_category(prod_category),
+        self.__get_linked_pages_in_tables(page_title, page_contents)
+        if self.use_local_tables else
         self.__get_linked_pages_in_templates(page_title)
       )
 
@@ -156,7 +334,7 @@ class ProducerPageEditor(AsyncBotWrapper):
         self.log(f"[{page_title}]\t{ENUM_ANSI_COLOURS.magenta.value}Found {num_missing_songs} missing songs:{
           ENUM_ANSI_COLOURS.default.value
         } {', '.join(missing_song_pages)}")
-        page_contents = self.__update_pwt(page_contents, missing_song_pages)
+        table_edits += self.__update_pwt(page_contents, missing_song_pages)
         is_edited = True
       if num_missing_albums > 0:
         self.log(f"[{page_title}]\t{ENUM_ANSI_COLOURS.magenta.value}Found {num_missing_albums} missing albums:{
@@ -164,33 +342,42 @@ class ProducerPageEditor(AsyncBotWrapper):
         } {
           ', '.join([page for page, _ in missing_album_pages])
         }")
-        page_contents = self.__update_awt(page_contents, missing_album_pages)
+        table_edits += self.__update_awt(page_contents, missing_album_pages)
         is_edited = True
 
     except FailedToUpdatePwtTables as e:
+      self.metrics.record_error(e)
       err_message = str(e)
       self.log(f"[{page_title}]\t{err_message}", ENUM_LOGGER_STATES.error)
-      failed_to_add = [*missing_song_pages, *missing_album_pages]
+      failed_to_add = [*missing_song_pages, *[page for page, _ in missing_album_pages]]
     except FailedToUpdateAwtTables as e:
+      self.metrics.record_error(e)
       err_message = str(e)
       self.log(f"[{page_title}]\t{err_message}", ENUM_LOGGER_STATES.error)
-      failed_to_add = missing_album_pages
+      failed_to_add = [page for page, _ in missing_album_pages]
     except Exception as e:
+      self.metrics.record_error(e)
       err_message = str(e)
       self.log(f"[{page_title}]\t{err_message}", ENUM_LOGGER_STATES.error)
     
     finally:
       if not is_edited:
         return (is_edited, page_title, err_message, None, failed_to_add)
-      page.text = page_contents
-      page.save(
-        summary=self.CONST_EDIT_SUMMARY, 
-        watch="nochange", 
-        minor=False, 
-        bot=False,
-        asynchronous=True
-      )
-      return (True, page_title, err_message, None, failed_to_add)
+      # All table edits are spliced into the page at once, including those made before a failed table update
+      page.text = splice_spans(page_contents, table_edits)
+      added_pages = None
+      if self.dump_paths is not None:
+        # Only the offline audit reports the pages added to the tables
+        not_added_pages = set(failed_to_add or [])
+        added_pages = [title for title in [*missing_song_pages, *[album for album, _ in missing_album_pages]] if title not in not_added_pages]
+      return (True, page_title, err_message, added_pages, failed_to_add)
+
+  def __load_page_contents(self, page: pywikibot.Page) -> str:
+    if not page.exists():
+      raise PageNotFoundException("Page doesn't exist")
+    elif page.isRedirectPage():
+      raise PageNotFoundException("Page is a redirect")
+    return page.text
     
   def __get_producer_category(self, page_contents: str) -> str:
     prod_category = self.__rxProdCat.search(page_contents, re.S)
@@ -200,287 +387,375 @@ class ProducerPageEditor(AsyncBotWrapper):
     prod_category = self.__rxProdCatParam.sub("", prod_category)
     return prod_category
   
+  def __get_producer_pages_in_dumps(self, from_page: Optional[str], only_page: Optional[str]) -> Iterator[DumpPage]:
+    # Runs once run_on_startup has indexed the categories of the dumped pages
+    producer_pages = self.category_index.pages_in_category(CONST_CATEGORY_PRODUCERS)
+    for page in iter_dump_pages(self.dump_paths, namespaces=(0,)):
+      page_title = page.title()
+      if page_title not in producer_pages:
+        continue
+      if (only_page is not None and page_title != only_page) or (from_page is not None and page_title < from_page):
+        continue
+      yield page
+
+  def save_page(self, page: pywikibot.Page) -> None:
+    if self.dump_paths is None:
+      try:
+        return super().save_page(page)
+      except Exception:
+        self.__failed_saves.append(page.title())
+        raise
+    diff = difflib.unified_diff(
+      page.original_text.splitlines(), page.text.splitlines(),
+      fromfile=f"a/{page.title()}", tofile=f"b/{page.title()}", lineterm=""
+    )
+    with self.__patch_lock:
+      with open(self.patch_path, "a", encoding="utf-8") as f:
+        f.write("\n".join(diff) + "\n")
+
+  async def run_on_startup(self) -> None:
+    if self.dump_paths is not None:
+      self.log(f"Building the category index from {len(self.dump_paths)} dump files...")
+      self.category_index = await self.run_blocking(CategoryIndex().build_from_dump, self.dump_paths)
+      self.log(self.category_index.stats(), ENUM_LOGGER_STATES.output)
+      if self.checkpoint is None or not self.checkpoint.is_resumed:
+        open(self.patch_path, "w", encoding="utf-8").close()
+    elif self.use_category_index:
+      self.log("Building the category index...")
+      self.category_index = await CategoryIndex().build(self.api)
+      self.log(self.category_index.stats(), ENUM_LOGGER_STATES.output)
+    elif self.category_cache_path is not None:
+      self.category_cache = CategoryMembersCache(self.category_cache_path, flag_category=CONST_CATEGORY_COMPILATION_ALBUMS)
+      changed_categories = await self.category_cache.sync(self.api)
+      self.log(f"Category cache: {len(changed_categories)} categories changed since the last sync", ENUM_LOGGER_STATES.output)
+    if self.watermark is not None and not self.mode_onepageonly:
+      # A resumed run only counts as a run from the time it was first started
+      self.run_started_at = self.checkpoint.started_at if self.checkpoint is not None else datetime.now(timezone.utc)
+      last_run = self.watermark.load()
+      if last_run is None:
+        self.log("No previous run was found, editing all producer pages", ENUM_LOGGER_STATES.warn)
+      else:
+        producer_pages = await self.__get_changed_producer_pages(last_run)
+        self.log(f"{len(producer_pages)} producer pages have new or recategorized songs/albums since {last_run}", ENUM_LOGGER_STATES.output)
+        if self.checkpoint is not None:
+          producer_pages = [page_title for page_title in producer_pages if not self.checkpoint.is_completed(page_title)]
+        if self.shard is not None:
+          producer_pages = [page_title for page_title in producer_pages if is_in_shard(page_title, self.shard)]
+        gen = pagegenerators.PagesFromTitlesGenerator(sorted(producer_pages), pywikibot.Site())
+        self.generator = pagegenerators.PreloadingGenerator(gen, groupsize=50)
+
+  async def __get_changed_producer_pages(self, since: datetime) -> Set[str]:
+    """
+    Map the producer categories that had pages added or removed since the given time to their producer pages.
+    """
+    prod_categories = set()
+    for category in await get_recently_categorized(self.api, since):
+      match = self.__rxProdSongsCategory.match(category)
+      if match is not None:
+        prod_categories.add(match.group(1))
+    if len(prod_categories) == 0:
+      return set()
+
+    # The producer page is given in the {{Producer}} template of the producer category, else it is assumed to have the same name as the category
+    revisions_query = BatchedPropQuery(self.api, {
+      "action": "query",
+      "format": "json",
+      "prop": "revisions",
+      "rvprop": "content",
+      "rvslots": "main",
+      "origin": "*"
+    }, prop="revisions")
+    prod_categories = sorted(prod_categories)
+    revisions = await asyncio.gather(
+      *(revisions_query.fetch(f"Category:{prod_category} songs list") for prod_category in prod_categories), 
+      return_exceptions=True
+    )
+    candidate_pages = set()
+    for prod_category, category_revisions in zip(prod_categories, revisions):
+      producer_page = prod_category
+      if not isinstance(category_revisions, Exception) and len(category_revisions) > 0:
+        for template in mwparserfromhell.parse(category_revisions[0]["slots"]["main"]["*"]).filter_templates():
+          if template.name.matches("Producer") and template.has("2") and template.get("2").value.strip() != "":
+            producer_page = template.get("2").value.strip()
+            break
+      candidate_pages.add(producer_page)
+
+    # Only keep the pages that are in Category:Producers
+    categories_query = BatchedPropQuery(self.api, {
+      "action": "query",
+      "format": "json",
+      "prop": "categories",
+      "clcategories": CONST_CATEGORY_PRODUCERS,
+      "origin": "*"
+    }, prop="categories")
+    candidate_pages = sorted(candidate_pages)
+    categories = await asyncio.gather(*map(categories_query.fetch, candidate_pages), return_exceptions=True)
+    return set(
+      producer_page for producer_page, page_categories in zip(candidate_pages, categories)
+      if not isinstance(page_categories, Exception) and len(page_categories) > 0
+    )
+
+  def shard_results(self) -> Dict[str, Any]:
+    return { 
+      **super().shard_results(), 
+      "run_started_at": self.run_started_at, 
+      "patch_path": self.patch_path, 
+      "failed_saves": self.__failed_saves 
+    }
+
+  def merge_shard_results(self, results: Dict[str, Any]) -> None:
+    super().merge_shard_results(results)
+    self.__failed_saves += results["failed_saves"]
+    if results["run_started_at"] is not None:
+      # The next incremental run looks for changes since the start of the earliest shard
+      self.run_started_at = min(self.run_started_at or results["run_started_at"], results["run_started_at"])
+    if self.dump_paths is not None and os.path.exists(results["patch_path"]):
+      with open(results["patch_path"], "r", encoding="utf-8") as f:
+        patch = f.read()
+      with open(self.patch_path, "a" if self.__num_merged_patches > 0 else "w", encoding="utf-8") as f:
+        f.write(patch)
+      os.remove(results["patch_path"])
+      self.__num_merged_patches += 1
+
+  async def close_resources(self) -> None:
+    if self.category_cache is not None:
+      self.log(self.category_cache.stats(), ENUM_LOGGER_STATES.output)
+      self.category_cache.close()
+
   async def run_on_termination(self) -> None:
     if self.mode_onepageonly:
       return
     
     cur_time = datetime.now().strftime("%B %d, %Y")
-    edit_report = "Report generated " + cur_time
-    edit_report += "\n\n'''''This is a bot-generated report, iterating through the producer pages in [[:Category:Producers]]'''''\n\n''Pages with errors:''\n<categorytree namespaces=0 hideroot=on>Error/Producer pages/PWT</categorytree>\n\n\n"
-
-    if len(self.error_pages) > 0:
-      edit_report += "'''''The bot was not able to update the producer works tables for the following pages''''':\n\n"
-      for page_title, error_message in self.error_pages:
-        edit_report += f"*[[{page_title}]], {error_message}\n"
-
-    if len(self.collected_results_on_failure) > 0:
-      edit_report += "\n\n''The following producer pages are missing these song/album pages:''\n\n"
-      for page_title, missing_entries in self.collected_results_on_failure:
-        edit_report += f"=='''[[{page_title}]]'''==\n"
-        edit_report += "\n".join(
-          map(lambda page: f"*[[{page}]]", missing_entries)
-        )
-        edit_report += "\n\n"
-    else:
-      edit_report += "\n\n''All song/album pages in the respective producer categories have been included in the producer pages.''"
-    
-    edit_report += "\n[[Category:Error/Producer pages/PWT|!]]"
+    report = ReportBuilder(
+      header="Report generated " + cur_time + "\n\n'''''This is a bot-generated report, iterating through the producer pages in [[:Category:Producers]]'''''\n\n''Pages with errors:''\n<categorytree namespaces=0 hideroot=on>Error/Producer pages/PWT</categorytree>\n\n\n",
+      footer="\n[[Category:Error/Producer pages/PWT|!]]"
+    )
+
+    if len(self.shard_failures) > 0:
+      report.section("'''''This report is partial, the producer pages of the following shards of the run were not checked''''':\n\n")
+      for err_message in self.shard_failures:
+        report.add(f"*{err_message}\n")
+
+    if self.results.num_errors > 0:
+      report.section("'''''The bot was not able to update the producer works tables for the following pages''''':\n\n")
+      for page_title, error_message in self.results.error_pages():
+        report.add(f"*[[{page_title}]], {error_message}\n")
+
+    if self.dump_paths is not None and self.results.num_results_on_success > 0:
+      report.section(f"\n\n''The following song/album pages are missing from the producer pages, and have been added to the tables in {self.patch_path}:''\n\n")
+      for page_title, missing_entries in sorted(self.results.results_on_success()):
+        report.add(f"=='''[[{page_title}]]'''==\n" + "\n".join(map(lambda page: f"*[[{page}]]", sorted(missing_entries))) + "\n\n")
+
+    if self.results.num_results_on_failure > 0:
+      report.section("\n\n''The following producer pages are missing these song/album pages:''\n\n")
+      for page_title, missing_entries in self.results.results_on_failure():
+        report.add(f"=='''[[{page_title}]]'''==\n" + "\n".join(map(lambda page: f"*[[{page}]]", missing_entries)) + "\n\n")
+    elif self.dump_paths is None or self.results.num_results_on_success == 0:
+      report.section("\n\n''All song/album pages in the respective producer categories have been included in the producer pages.''")
+
+    if self.dump_paths is not None:
+      with open(self.report_path, "w", encoding="utf-8") as f:
+        f.write(report.build())
+      self.log(f"Saved the audit report to {self.report_path} and the table edits to {self.patch_path}", ENUM_LOGGER_STATES.output)
+      return
 
-    report_wikipage = pywikibot.Page(pywikibot.Site(), CONST_WIKI_REPORT_BLOG)
-    report_wikipage.text = edit_report
-    report_wikipage.save("PWT Report", watch="nochange", minor=False, bot=False)
+    await self.__save_report(report.build_pages(CONST_WIKI_MAX_PAGE_SIZE))
+
+    if self.watermark is not None and self.run_started_at is not None:
+      # The changes since the last run are looked up again by the next run if this run did not update every producer page
+      if pywikibot.config.simulate:
+        self.log("The run watermark is not updated under -simulate", ENUM_LOGGER_STATES.warn)
+      elif len(self.__failed_saves) > 0:
+        self.log(f"The run watermark is not updated, {len(self.__failed_saves)} producer pages could not be saved", ENUM_LOGGER_STATES.warn)
+      elif len(self.shard_failures) > 0:
+        self.log(f"The run watermark is not updated, {len(self.shard_failures)} shards failed", ENUM_LOGGER_STATES.warn)
+      else:
+        self.watermark.save(self.run_started_at)
+
+  async def __save_report(self, report_pages: List[str]) -> None:
+    """
+    Save the report page and its numbered subpages (if the report was split) at the same time, then mark the 
+    subpages left over from a longer report as unused.
+    """
+    site = pywikibot.Site()
+    titles = [CONST_WIKI_REPORT_BLOG, *(f"{CONST_WIKI_REPORT_BLOG}/{number}" for number in range(1, len(report_pages)))]
+
+    async def save_report_page(title: str, text: str) -> None:
+      report_wikipage = pywikibot.Page(site, title)
+      report_wikipage.text = text
+      await self.run_blocking(report_wikipage.save, "PWT Report", watch="nochange", minor=False, bot=False)
+
+    await asyncio.gather(*(save_report_page(title, text) for title, text in zip(titles, report_pages)))
+    if len(report_pages) > 1:
+      self.log(f"The report was split into {len(report_pages) - 1} subpages", ENUM_LOGGER_STATES.output)
+
+    def is_leftover_subpage(wikipage: pywikibot.Page) -> bool:
+      return wikipage.exists() and wikipage.text != CONST_WIKI_REPORT_UNUSED_SUBPAGE
+
+    number = len(report_pages)
+    while True:
+      leftover_wikipage = pywikibot.Page(site, f"{CONST_WIKI_REPORT_BLOG}/{number}")
+      if not await self.run_blocking(is_leftover_subpage, leftover_wikipage):
+        break
+      await save_report_page(leftover_wikipage.title(), CONST_WIKI_REPORT_UNUSED_SUBPAGE)
+      number += 1
 
   async def __get_song_pages_in_producer_category(self, prod_category: str) -> Set[str]:
-    async def fetch_from_category(category: str, get_subcats: bool = False):
+    async def fetch_from_category(category: str, get_subcats: bool = False) -> List[str]:
+      if self.category_cache is not None:
+        members = await self.category_cache.get_or_fetch(
+          category, 14 if get_subcats else 0, 
+          lambda: download_from_category(category, get_subcats)
+        )
+        return [title for title, _ in members]
+      return [title for title, _ in await download_from_category(category, get_subcats)]
+
+    async def download_from_category(category: str, get_subcats: bool = False) -> List[Tuple[str, bool]]:
       all_data = []
-      async with aiohttp.ClientSession() as session:
-        continue_id = None
-        params = {
-          "action": "query",
-          "format": "json",
-          "list": "categorymembers",
-          "cmtitle": category,
-          "cmprop": "title",
-          "cmnamespace": 14 if get_subcats else 0,
-          "cmlimit": 500,
-          "cmsort": "sortkey",
-          "cmdir": "ascending",
-          "origin": "*"
-        }
-        while True:
-          if continue_id is not None:
-            params["cmcontinue"] = continue_id
-          async with session.get(CONST_WIKI_API_ENTRYPOINT, params=params) as response:
-            data = await response.json()
-            all_data.extend(data["query"]["categorymembers"])
-            if "continue" in data:
-              continue_id = data["continue"]["cmcontinue"]
-            else:
-              break
-      return all_data
+      params = {
+        "action": "query",
+        "format": "json",
+        "list": "categorymembers",
+        "cmtitle": category,
+        "cmprop": "title",
+        "cmnamespace": 14 if get_subcats else 0,
+        "cmlimit": 500,
+        "cmsort": "sortkey",
+        "cmdir": "ascending",
+        "origin": "*"
+      }
+      async for data in self.api.continued_query(params):
+        all_data.extend(data["query"]["categorymembers"])
+      return [(member["title"], False) for member in all_data]
     prod_category = f"Category:{prod_category}_songs_list"
+    if self.category_index is not None:
+      distinct_songs = set(self.category_index.pages_in_category(prod_category))
+      for subcat in self.category_index.subcategories_of(prod_category):
+        if not subcat.endswith("/Albums"):
+          distinct_songs.update(self.category_index.pages_in_category(subcat))
+      return distinct_songs
     subcategories = await fetch_from_category(prod_category, True)
-    song_subcategories = [subcat["title"] for subcat in subcategories if not subcat["title"].endswith("/Albums")]
+    song_subcategories = [subcat for subcat in subcategories if not subcat.endswith("/Albums")]
     songs = await asyncio.gather(
       fetch_from_category(prod_category),
       *map(lambda subcat: fetch_from_category(subcat), song_subcategories)
     )
     distinct_songs = set()
     for arr in songs:
-      for song in arr:
-        distinct_songs.add(song["title"])
+      distinct_songs.update(arr)
     #print("In category:", len(distinct_songs))
     return distinct_songs
 
   async def __get_album_pages_in_producer_category(self, prod_category: str) -> List[Tuple[str, bool]]:
+    if self.category_index is not None:
+      albums = []
+      compilation_albums = self.category_index.pages_in_category(CONST_CATEGORY_COMPILATION_ALBUMS)
+      for album in sorted(self.category_index.pages_in_category(f"Category:{prod_category}_songs_list/Albums")):
+        albums.append((album, album in compilation_albums))
+      return albums
+    if self.category_cache is not None:
+      return await self.category_cache.get_or_fetch(
+        f"Category:{prod_category}_songs_list/Albums", 0,
+        lambda: self.__download_album_pages_in_producer_category(prod_category),
+        has_flags=True
+      )
+    return await self.__download_album_pages_in_producer_category(prod_category)
+
+  async def __download_album_pages_in_producer_category(self, prod_category: str) -> List[Tuple[str, bool]]:
     albums = []
-    async with aiohttp.ClientSession() as session:
-      continue_id = None
-      params = {
-        "action": "query",
-        "format": "json",
-        "generator": "categorymembers",
-        "gcmtitle": f"Category:{prod_category}_songs_list/Albums",
-        "prop": "categories",
-        "gcmlimit": 500,
-        "cllimit": 500,
-        "clcategories": "Category:Compilation_albums",
-        "gcmnamespace": 0,
-        "gcmsort": "sortkey",
-        "gcmdir": "ascending",
-        "origin": "*"
-      }
-      while True:
-        if continue_id is not None:
-          params["gcmcontinue"] = continue_id
-        async with session.get(CONST_WIKI_API_ENTRYPOINT, params=params) as response:
-          data = await response.json()
-          if not "query" in data:
-            break
-          for page in data["query"]["pages"].values():
-            albums.append((page["title"], "categories" in page))
-          if "continue" in data:
-            continue_id = data["continue"]["gcmcontinue"]
-          else:
-            break
+    params = {
+      "action": "query",
+      "format": "json",
+      "generator": "categorymembers",
+      "gcmtitle": f"Category:{prod_category}_songs_list/Albums",
+      "prop": "categories",
+      "gcmlimit": 500,
+      "cllimit": 500,
+      "clcategories": CONST_CATEGORY_COMPILATION_ALBUMS,
+      "gcmnamespace": 0,
+      "gcmsort": "sortkey",
+      "gcmdir": "ascending",
+      "origin": "*"
+    }
+    async for data in self.api.continued_query(params):
+      if not "query" in data:
+        break
+      for page in data["query"]["pages"].values():
+        albums.append((page["title"], "categories" in page))
     return albums
 
   async def __get_linked_pages_in_templates(self, page_title: str) -> Tuple[Set[str], Set[str]]:
-    async def fetch_from_url(page_title: str):
-      all_data = []
-      params = {
-        "action": "query",
-        "format": "json", 
-        "indexpageids": "true",
-        "prop": "templates",
-        "titles": page_title,
-        "tlnamespace": 0,
-        "tllimit": 500,
-        "tldir": "ascending",
-        "origin": "*",
-      }
-      async with aiohttp.ClientSession() as session:
-        continue_id = None
-        while True:
-          if continue_id is not None:
-            params["tlcontinue"] = continue_id
-          async with session.get(CONST_WIKI_API_ENTRYPOINT, params=params) as response:
-            data = await response.json()
-            all_data.extend(data["query"]["pages"][str(data["query"]["pageids"][0])]["templates"])
-            if "continue" in data:
-              continue_id = data["continue"]["tlcontinue"]
-            else:
-              break
-      return all_data
-    pages = await fetch_from_url(page_title)
-    set_linked_songs = set()
-    set_linked_albums = set()
-    for page in pages:
-      if page["ns"] != 0:
-        continue
-      if re.search(r" \((album|E\.?P\.?)\)$", page["title"]) is not None:
-        set_linked_albums.add(page["title"])
-      else:
-        set_linked_songs.add(page["title"])
-    #print("In links:", len(set_linked_songs), len(set_linked_albums))
+    pages = await self.__template_query.fetch(page_title)
+    titles = [page["title"] for page in pages if page["ns"] == 0]
+    return split_songs_and_albums(titles)
+
+  async def __get_linked_pages_in_tables(self, page_title: str, page_contents: str) -> Tuple[Set[str], Set[str]]:
+    """Read the song/album pages in the pwt/awt tables from the page contents, instead of querying the API"""
+    set_linked_songs, set_linked_albums = extract_linked_pages_in_tables(page_contents)
+    if self.verify_local_tables:
+      api_linked_songs, api_linked_albums = await self.__get_linked_pages_in_templates(page_title)
+      for label, local_set, api_set in (("songs", set_linked_songs, api_linked_songs), ("albums", set_linked_albums, api_linked_albums)):
+        if local_set != api_set:
+          self.log(f"[{page_title}]\tLocally extracted {label} differ from the API result. Only in tables: {sorted(local_set - api_set)}, only in API: {sorted(api_set - local_set)}", ENUM_LOGGER_STATES.warn)
     return (set_linked_songs, set_linked_albums)
 
-  def __getSortValue(self, pwt_template_input: str) -> str:
-    def detone_pinyin(text, showUmlaut):
-      text = re.sub("[āáǎà]", "a", text)
-      text = re.sub("[ĀÁǍÀ]", "A", text)
-      text = re.sub("[īíǐì]", "i", text)
-      text = re.sub("[ĪÍǏÌ]", "I", text)
-      text = re.sub("[ūúǔù]", "u", text)
-      text = re.sub("[ŪÚǓÙ]", "U", text)
-      text = re.sub("[ēéěè]", "e", text)
-      text = re.sub("[ĒÉĚÈ]", "E", text)
-      text = re.sub("[ōóǒò]", "o", text)
-      text = re.sub("[ŌÓǑÒ]", "O", text)
-      if showUmlaut:
-        text = re.sub("[ǖǘǚǜ]", "ü", text)
-        text = re.sub("[ǕǗǙǛ]", "Ü", text)
-      else:
-        text = re.sub("[ǖǘǚǜ]", "v", text)
-        text = re.sub("[ǕǗǙǛ]", "V", text)
-      return text
-        
-    def get_romaji(wikipage_name):
-      extracted_romaji = wikipage_name
-      try_original_title = ""
-      try_find_regex = []
-      extracted_romaji = re.sub(r" \(album\)$", "", extracted_romaji)
-      extracted_romaji = re.sub(r"(?<=\))\/.*$", "", extracted_romaji)
-      try_find_regex = re.findall(r"(?<=\s\()[ -~ĀÁǍÀĒÉĚÈŌÓǑÒ].*(?=\)$)", extracted_romaji)
-      if not len(try_find_regex):
-        return wikipage_name
-        return "CASE: No match found"
-      extracted_romaji = try_find_regex[0]
-      while (re.search(r"^[^\(]*\)[^\(]*\(", extracted_romaji) is not None):
-        extracted_romaji = re.sub(r"^[^\(]*\)[^\(]*\(", "", extracted_romaji)
-      try_original_title = wikipage_name.replace(" (" + extracted_romaji + ")", "")
-      try_find_regex = re.search(r"[^ -~]", try_original_title)
-      if try_find_regex is None:
-        return wikipage_name
-        return "CASE: Title is already in English"
-      #Finally return the altered extractedRomaji
-      return extracted_romaji
-    
-    page_title = re.search(r"^[^\|]*", pwt_template_input).group(0)
-    page_title = re.sub(r"\{\{=\}\}", "=", re.sub(r"^\s*1\s*=\s*", "", page_title))
-
-    rom_title = get_romaji(page_title)
-
-    misc_params = pwt_template_input.replace(page_title, "")
-
-    #Deduce manual romanization
-    manual_kanji = re.search(r"\|kanji\s*=\s*([^\|]*)", misc_params)
-    manual_kanji = re.search(r"\|(?<!\s*\w+\s*=\s*)([^\|]*)", misc_params) if manual_kanji is None else manual_kanji
-    manual_kanji = manual_kanji.group(1) if not manual_kanji is None else ""
-    manual_rom = re.search(r"\|rom\s*=\s*([^\|]*)", misc_params)
-    manual_rom = manual_rom.group(1) if not manual_rom is None else ""
-    rom_title = manual_rom if manual_rom != "" else rom_title
+  def __new_row(self, template: str, page_title: str) -> dict:
+    return dict(fullmatch="|-\n| {{" + template + " row|" + page_title + "}}", input=page_title, sort_value=get_sort_value(page_title))
 
-    #Finishing operations
-    rom_title = detone_pinyin(rom_title, False).lower()
-    rom_title = re.sub(r"[\[\(\)\]\"'¿\?『』「」:’]", "", rom_title)
-    rom_title += misc_params
-
-    return rom_title
-
-  def __update_pwt(self, page_contents: str, missing_songs: List[str]) -> str:
-    pwt_tables = list(self.__rxPwtTable.finditer(page_contents))
+  def __update_pwt(self, page_contents: str, missing_songs: List[str]) -> List[SpanEdit]:
+    pwt_tables = find_producer_tables(page_contents, "pwt")
     if len(pwt_tables) > 1:
       raise FailedToUpdatePwtTables("More than one pwt row table found.")
     if len(pwt_tables) == 0:
       raise FailedToUpdatePwtTables("Cannot find pwt row table.")
-    pwt_table_wikitext = pwt_tables[0].group(0)
-
-    extract_match_properties = lambda m: dict(fullmatch=m.group(0), input=m.group(1), sort_value=self.__getSortValue(m.group(1)))
-    pwt_songs = list(map(extract_match_properties, self.__rxPwtRowTemplate.finditer(pwt_table_wikitext)))
-    for missing_song in missing_songs:
-        sort_value = self.__getSortValue(missing_song)
-        pwt_template = "|-\n| {{pwt row|" + missing_song + "}}"
-        add_to_index = 0
-        while add_to_index < len(pwt_songs):
-          if (pwt_songs[add_to_index]["sort_value"] > sort_value):
-            break
-          add_to_index += 1
-        pwt_songs.insert(add_to_index, dict(fullmatch=pwt_template, input=missing_song, sort_value=sort_value))
-    
-    new_pwt_table_wikitext = pwt_tables[0].group("head") + "\n".join(map(lambda m: m["fullmatch"], pwt_songs)) + "\n|}"
-    return page_contents.replace(pwt_table_wikitext, new_pwt_table_wikitext)
+    if is_table_overlapping(page_contents, pwt_tables[0]):
+      raise FailedToUpdatePwtTables("The pwt row table overlaps another table, one of them may be missing its closing |}.")
+    extract_match_properties = lambda row: dict(fullmatch=row.wikitext, input=row.template_input, sort_value=get_sort_value(row.template_input))
+    get_row_sort_value = lambda row: row["sort_value"]
+    pwt_songs = list(map(extract_match_properties, pwt_tables[0].rows))
+    pwt_songs = merge_missing_rows(pwt_songs, [self.__new_row("pwt", missing_song) for missing_song in missing_songs], get_row_sort_value)
 
-  def __update_awt(self, page_contents: str, missing_albums: List[Tuple[str, bool]]) -> str:
+    new_pwt_table_wikitext = pwt_tables[0].head + "\n".join(map(lambda m: m["fullmatch"], pwt_songs)) + "\n|}"
+    return [(*pwt_tables[0].span(), new_pwt_table_wikitext)]
+
+  def __update_awt(self, page_contents: str, missing_albums: List[Tuple[str, bool]]) -> List[SpanEdit]:
     if len(missing_albums) == 0: 
-      return page_contents
-    awt_tables = awt_tables = list(self.__rxAwtTable.finditer(page_contents))
-    extract_match_properties = lambda m: dict(fullmatch=m.group(0), input=m.group(1), sort_value=self.__getSortValue(m.group(1)))
+      return []
+    tables = scan_producer_tables(page_contents)
+    awt_tables = [table for table in tables if table.kind == "awt"]
+    if any(is_table_overlapping(page_contents, awt_table) for awt_table in awt_tables[:2]):
+      raise FailedToUpdateAwtTables("The awt row table overlaps another table, one of them may be missing its closing |}.")
+    extract_match_properties = lambda row: dict(fullmatch=row.wikitext, input=row.template_input, sort_value=get_sort_value(row.template_input))
+    get_row_sort_value = lambda row: row["sort_value"]
     if len(awt_tables) > 1:
-      awt_table_wikitext, awt_table_wikitext_compilations = awt_tables[0].group(0), awt_tables[1].group(0)
-
-      awt_albums = list(map(extract_match_properties, self.__rxAwtRowTemplate.finditer( awt_table_wikitext )))
-      awt_albums_compilations = list(map(extract_match_properties, self.__rxAwtRowTemplate.finditer( awt_table_wikitext_compilations )))
-      for missing_album, is_compilation_album in missing_albums:
-        sort_value = self.__getSortValue(missing_album)
-        awt_template = "|-\n| {{awt row|" + missing_album + "}}"
-        add_to_index = 0
-        search_in_table = awt_albums_compilations if is_compilation_album else awt_albums
-        while add_to_index < len(search_in_table):
-          if (search_in_table[add_to_index]["sort_value"] > sort_value):
-            break
-          add_to_index += 1
-        search_in_table.insert(add_to_index, dict(fullmatch=awt_template, input=missing_album, sort_value=sort_value))
-        
-      new_awt_table_wikitext = awt_tables[0].group("head") + "\n".join(map(lambda m: m["fullmatch"], awt_albums)) + "\n|}"
-      new_awt_table_wikitext_compilations = awt_tables[1].group("head") + "\n".join(map(lambda m: m["fullmatch"], awt_albums_compilations)) + "\n|}"
-      page_contents = page_contents.replace(awt_table_wikitext, new_awt_table_wikitext)
-      page_contents = page_contents.replace(awt_table_wikitext_compilations, new_awt_table_wikitext_compilations)
-      return page_contents
+      awt_albums = list(map(extract_match_properties, awt_tables[0].rows))
+      awt_albums_compilations = list(map(extract_match_properties, awt_tables[1].rows))
+      awt_albums = merge_missing_rows(awt_albums, [self.__new_row("awt", missing_album) for missing_album, is_compilation_album in missing_albums if not is_compilation_album], get_row_sort_value)
+      awt_albums_compilations = merge_missing_rows(awt_albums_compilations, [self.__new_row("awt", missing_album) for missing_album, is_compilation_album in missing_albums if is_compilation_album], get_row_sort_value)
+
+      new_awt_table_wikitext = awt_tables[0].head + "\n".join(map(lambda m: m["fullmatch"], awt_albums)) + "\n|}"
+      new_awt_table_wikitext_compilations = awt_tables[1].head + "\n".join(map(lambda m: m["fullmatch"], awt_albums_compilations)) + "\n|}"
+      return [(*awt_tables[0].span(), new_awt_table_wikitext), (*awt_tables[1].span(), new_awt_table_wikitext_compilations)]
     
     if len(awt_tables) == 1:
-      awt_table_wikitext = awt_tables[0].group(0)
-
-      awt_albums = list(map(extract_match_properties, self.__rxAwtRowTemplate.finditer( awt_table_wikitext)))
-      for missing_album, _ in missing_albums:
-        sort_value = self.__getSortValue(missing_album)
-        awt_template = "|-\n| {{awt row|" + missing_album + "}}"
-        add_to_index = 0
-        while add_to_index < len(awt_albums):
-          if (awt_albums[add_to_index]["sort_value"] > sort_value):
-            break
-          add_to_index += 1
-        awt_albums.insert(add_to_index, dict(fullmatch=awt_template, input=missing_album, sort_value=sort_value))
-        
-      new_awt_table_wikitext = awt_tables[0].group("head") + "\n".join(map(lambda m: m["fullmatch"], awt_albums)) + "\n|}"
-      return page_contents.replace(awt_table_wikitext, new_awt_table_wikitext)
+      awt_albums = list(map(extract_match_properties, awt_tables[0].rows))
+      awt_albums = merge_missing_rows(awt_albums, [self.__new_row("awt", missing_album) for missing_album, _ in missing_albums], get_row_sort_value)
+
+      new_awt_table_wikitext = awt_tables[0].head + "\n".join(map(lambda m: m["fullmatch"], awt_albums)) + "\n|}"
+      return [(*awt_tables[0].span(), new_awt_table_wikitext)]
 
     else:
       missing_albums = [page for page, _ in missing_albums]
-      missing_albums = sorted(missing_albums, key=self.__getSortValue)
+      missing_albums = sorted(missing_albums, key=get_sort_value)
       new_awt_table_wikitext = "==Discography==\n{| class=\"sortable producer-table\"\n|- class=\"vcolor-default\"\n! {{awt head}}\n"
       new_awt_table_wikitext += "\n".join(map(lambda str: "|-\n| {{awt row|" + str + "}}", missing_albums)) + "\n|}\n\n__NOTOC__"
-      return page_contents.replace("__NOTOC__", new_awt_table_wikitext)
+      notoc_index = page_contents.find("__NOTOC__")
+      if notoc_index == -1:
+        return []
+      if any(table.start <= notoc_index < table.end for table in tables):
+        raise FailedToUpdateAwtTables("Cannot add the awt row table, __NOTOC__ is inside another table.")
+      return [(notoc_index, notoc_index + len("__NOTOC__"), new_awt_table_wikitext)]
 
 if __name__ == "__main__":
   options = {}
@@ -490,5 +765,20 @@ if __name__ == "__main__":
     options[arg] = value
   fromPage = options.get("-from", None)
   onlyPage = options.get("-page", None)
-  bot = ProducerPageEditor(fromPage, onlyPage)
-  bot.run()
\ No newline at end of file
+  useLocalTables = "-localtables" in options
+  verifyLocalTables = "-verifytables" in options
+  useCategoryIndex = "-categoryindex" in options
+  categoryCachePath = (options["-categorycache"] or CONST_CATEGORY_CACHE_FILE) if "-categorycache" in options else None
+  watermarkPath = (options["-incremental"] or CONST_WATERMARK_FILE) if "-incremental" in options else None
+  dumpPaths = expand_dump_paths(options["-dump"].split(",")) if "-dump" in options else None
+  reportPath = options.get("-report", None)
+  patchPath = options.get("-patch", None)
+  metricsPath = (options["-metrics"] or CONST_METRICS_FILE) if "-metrics" in options else None
+  checkpointPath = (options["-checkpoint"] or CONST_CHECKPOINT_FILE) if "-checkpoint" in options else None
+  numShards = int(options["-shards"]) if "-shards" in options else 1
+  createEditor = functools.partial(ProducerPageEditor, fromPage, onlyPage, useLocalTables, verifyLocalTables, useCategoryIndex, categoryCachePath, watermarkPath, dumpPaths, reportPath, patchPath, metricsPath, checkpointPath)
+  if numShards > 1:
+    run_sharded(createEditor, numShards, edits_per_minute=CONST_EDITS_PER_MINUTE if dumpPaths is None else None)
+  else:
+    bot = createEditor()
+    bot.run()
\ No newline at end of file
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Pooled aiohttp client for raw queries to the MediaWiki Action API.
+
+A single ApiClient (and hence a single aiohttp.ClientSession) is meant to be shared by all consumers of a bot for
+the lifetime of the bot, so that TLS handshakes are only made when the connection pool needs to grow, and idle
+connections are kept alive between requests.
+
+Every request is paced by the (optional) shared AdaptiveRateLimiter and sent with the maxlag parameter. Throttled
+requests (HTTP 429/503, or the maxlag/ratelimited API errors) slow down the rate limiter and are retried. Any other
+API error is raised as an ApiErrorException.
+"""
+
+import asyncio
+import aiohttp
+import json
+
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from rate_limiter import AdaptiveRateLimiter
+from bot_metrics import measure_fetch
+
+CONST_THROTTLED_HTTP_STATUSES = (429, 503)
+CONST_THROTTLED_API_ERRORS = ("maxlag", "ratelimited")
+
+class ApiThrottledException(Exception):
+  pass
+
+class ApiErrorException(Exception):
+  """Error returned by the API (other than maxlag/ratelimited), with its code and info"""
+  code: str
+  info: str
+
+  def __init__(self, code: str, info: str):
+    super().__init__(f"API error {code}: {info}")
+    self.code = code
+    self.info = info
+
+class ApiClient:
+  api_entrypoint: str
+  session: Optional[aiohttp.ClientSession]
+  rate_limiter: Optional[AdaptiveRateLimiter]
+  maxlag: Optional[int]
+  max_retries: int
+  num_requests: int
+  num_bytes_received: int
+  num_connections_opened: int
+  num_connections_reused: int
+
+  def __init__(
+    self,
+    api_entrypoint: str,
+    connection_limit: int = 100,
+    connection_limit_per_host: int = 20,
+    dns_cache_ttl: int = 300,
+    rate_limiter: Optional[AdaptiveRateLimiter] = None,
+    maxlag: Optional[int] = 5,
+    max_retries: int = 5
+  ):
+    self.api_entrypoint = api_entrypoint
+    self.connection_limit = connection_limit
+    self.connection_limit_per_host = connection_limit_per_host
+    self.dns_cache_ttl = dns_cache_ttl
+    self.rate_limiter = rate_limiter
+    self.maxlag = maxlag
+    self.max_retries = max_retries
+    self.session = None
+    self.num_requests = 0
+    self.num_bytes_received = 0
+    self.num_connections_opened = 0
+    self.num_connections_reused = 0
+
+  async def __on_connection_create_end(self, session, context, params) -> None:
+    self.num_connections_opened += 1
+
+  async def __on_connection_reuseconn(self, session, context, params) -> None:
+    self.num_connections_reused += 1
+
+  async def open(self) -> None:
+    if self.session is not None:
+      return
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(self.__on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(self.__on_connection_reuseconn)
+    connector = aiohttp.TCPConnector(
+      limit=self.connection_limit,
+      limit_per_host=self.connection_limit_per_host,
+      use_dns_cache=True,
+      ttl_dns_cache=self.dns_cache_ttl
+    )
+    self.session = aiohttp.ClientSession(
+      connector=connector,
+      headers={ "Accept-Encoding": "gzip" },
+      auto_decompress=True,
+      trace_configs=[trace_config]
+    )
+
+  async def close(self) -> None:
+    if self.session is None:
+      return
+    await self.session.close()
+    self.session = None
+
+  async def __aenter__(self) -> "ApiClient":
+    await self.open()
+    return self
+
+  async def __aexit__(self, *exc) -> None:
+    await self.close()
+
+  async def get(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    return await self.request(params)
+
+  async def post(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    return await self.request(params, method="POST")
+
+  async def request(self, params: Dict[str, Any], method: str = "GET") -> Dict[str, Any]:
+    with measure_fetch():
+      return await self.__request(params, method)
+
+  async def __request(self, params: Dict[str, Any], method: str) -> Dict[str, Any]:
+    if self.session is None:
+      await self.open()
+    if self.maxlag is not None:
+      params = { **params, "maxlag": self.maxlag }
+    for attempt in range(self.max_retries + 1):
+      if self.rate_limiter is not None:
+        await self.rate_limiter.acquire()
+      self.num_requests += 1
+      if method == "POST":
+        request = self.session.post(self.api_entrypoint, data=params)
+      else:
+        request = self.session.get(self.api_entrypoint, params=params)
+      async with request as response:
+        retry_after = response.headers.get("Retry-After", None)
+        retry_after = float(retry_after) if retry_after is not None and retry_after.isnumeric() else None
+        data = None
+        if response.status not in CONST_THROTTLED_HTTP_STATUSES:
+          body = await response.read()
+          self.num_bytes_received += len(body)
+          data = json.loads(body) if len(body.strip()) > 0 else None
+      is_throttled = data is None or data.get("error", {}).get("code", None) in CONST_THROTTLED_API_ERRORS
+      if not is_throttled:
+        if self.rate_limiter is not None:
+          self.rate_limiter.on_success()
+        if "error" in data:
+          raise ApiErrorException(data["error"].get("code", "unknown"), data["error"].get("info", ""))
+        return data
+      if self.rate_limiter is not None:
+        self.rate_limiter.on_throttled(retry_after)
+      await asyncio.sleep(retry_after if retry_after is not None else 2 ** attempt)
+    raise ApiThrottledException(f"API request was throttled {self.max_retries + 1} times in a row")
+
+  async def continued_query(self, params: Dict[str, Any], method: str = "GET") -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield every batch of a query, following the continuation parameters returned by the API.
+    """
+    params = dict(params)
+    while True:
+      data = await self.request(params, method)
+      yield data
+      if "continue" not in data:
+        break
+      params.update(data["continue"])
+
+  def stats(self) -> str:
+    stats = f"{self.num_requests} API requests ({self.num_bytes_received / 2 ** 20:.1f} MiB received), {self.num_connections_opened} connections opened, {self.num_connections_reused} connections reused"
+    if self.rate_limiter is not None:
+      stats += f", rate limit at {self.rate_limiter.stats()}"
+    return stats
+
+class BatchedPropQuery:
+  """
+  Resolve a prop=... query for many pages in combined requests (titles=A|B|C|...).
+
+  Concurrent callers of fetch(title) are collected until batch_size titles are pending, or until linger seconds 
+  have passed since the first pending title. The combined result is then split back into the results of each 
+  individual page.
+
+  The API accepts up to 50 titles per request (500 with the apihighlimits user right).
+  """
+  api: ApiClient
+  params: Dict[str, Any]
+  prop: str
+  batch_size: int
+  linger: float
+  num_batches: int
+
+  def __init__(self, api: ApiClient, params: Dict[str, Any], prop: str, batch_size: int = 50, linger: float = 0.05):
+    self.api = api
+    self.params = params
+    self.prop = prop
+    self.batch_size = batch_size
+    self.linger = linger
+    self.num_batches = 0
+    self.__pending: Dict[str, List[asyncio.Future]] = {}
+    self.__flush_handle: Optional[asyncio.TimerHandle] = None
+    self.__tasks = set()
+
+  async def fetch(self, title: str) -> List[Dict[str, Any]]:
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    self.__pending.setdefault(title, []).append(future)
+    if len(self.__pending) >= self.batch_size:
+      self.__flush()
+    elif self.__flush_handle is None:
+      self.__flush_handle = loop.call_later(self.linger, self.__flush)
+    with measure_fetch():
+      return await future
+
+  def __flush(self) -> None:
+    if self.__flush_handle is not None:
+      self.__flush_handle.cancel()
+      self.__flush_handle = None
+    while len(self.__pending) > 0:
+      titles = list(self.__pending.keys())[:self.batch_size]
+      batch = { title: self.__pending.pop(title) for title in titles }
+      task = asyncio.create_task(self.__run_batch(batch))
+      self.__tasks.add(task)
+      task.add_done_callback(self.__tasks.discard)
+
+  async def __run_batch(self, batch: Dict[str, List[asyncio.Future]]) -> None:
+    self.num_batches += 1
+    try:
+      results = await self.__query(list(batch.keys()))
+    except Exception as e:
+      for futures in batch.values():
+        for future in futures:
+          if not future.done():
+            future.set_exception(e)
+      return
+    for title, futures in batch.items():
+      for future in futures:
+        if future.done():
+          continue
+        if isinstance(results[title], Exception):
+          future.set_exception(results[title])
+        else:
+          future.set_result(results[title])
+
+  async def __query(self, titles: List[str]) -> Dict[str, Any]:
+    params = { **self.params, "titles": "|".join(titles) }
+    normalized_titles = {}
+    pages = {}
+    async for data in self.api.continued_query(params, method="POST"):
+      if "query" not in data:
+        raise Exception(f"Unexpected API response: {data}")
+      for normalized in data["query"].get("normalized", []):
+        normalized_titles[normalized["from"]] = normalized["to"]
+      for page in data["query"]["pages"].values():
+        merged_page = pages.setdefault(page["title"], { "missing": "missing" in page or "invalid" in page, self.prop: [] })
+        merged_page[self.prop].extend(page.get(self.prop, []))
+    results = {}
+    for title in titles:
+      page = pages.get(normalized_titles.get(title, title), None)
+      if page is None or page["missing"]:
+        results[title] = Exception(f"Page {title} is not found")
+      else:
+        results[title] = page[self.prop]
+    return results
@@ -4,90 +4,60 @@
 This is not a complete bot; rather, it is a template from which simple
 bots can be made. You can rename it to mybot.py, then edit it in
 whatever way you want.
+
+Requires the file async_bot_wrapper.py (and the modules it imports) to be
+saved in the same folder as this script.
 """
 
 import pywikibot
 from pywikibot import pagegenerators
-import asyncio
-
-from typing import Callable, List, Tuple, Optional
-from enum import Enum
+from async_bot_wrapper import AsyncBotWrapper, ENUM_LOGGER_STATES
 
-from time import time
+from typing import Any, Tuple, Optional
 
 # MAXIMUM SIZE OF QUEUE OF TASKS
 CONST_QUEUE_SIZE = 500
-# NUMBER OF ASYNCHRONOUS THREADS RUNNING AT A SINGLE TIME (ONE THREAD PROCESSES AND SAVES EACH PAGE)
+# NUMBER OF ASYNCHRONOUS THREADS RUNNING AT A SINGLE TIME (ONE THREAD PROCESSES EACH PAGE)
 CONST_NUM_TASK_CONSUMERS = 50
-
-def countElapsedTime(func: Callable) -> Callable:
-  def wrapped(*args, **kwargs):
-    funcName = func.__name__
-    startTime = time()
-    res = func(*args, **kwargs)
-    endTime = time()
-    print(f"{funcName} executed in {endTime-startTime} s")
-    return res
-  return wrapped
-
-class ENUM_LOGGER_STATES(Enum):
-  log = 1
-  output = 2
-  warn = 3
-  error = 4
-
-class ENUM_ANSI_COLOURS(Enum):
-  yellow = "\033[33m"
-  red = "\033[31m"
-  green = "\033[32m"
-  magenta = "\033[95m"
-  bold = "\033[1m"
-  default = "\033[0m"
+# NUMBER OF WORKER THREADS FOR BLOCKING PYWIKIBOT CALLS (PAGE LOOKUPS AND SAVES)
+CONST_NUM_WORKER_THREADS = 10
+# NUMBER OF PAGES SAVED AT A SINGLE TIME
+CONST_NUM_SAVE_WORKERS = 5
+# MAXIMUM NUMBER OF EDITS PER MINUTE
+CONST_EDITS_PER_MINUTE = 60
 
 class PageNotFoundException(Exception):
   pass
 
-class AsyncBot:
-  site: pywikibot._BaseSite
-  lock: asyncio.Lock
-  edited_pages: List[str]
-  error_pages: List[str]
-  queue: asyncio.Queue
-
+class AsyncBot(AsyncBotWrapper):
   CONST_EDIT_SUMMARY = "BOT: Save Summary"
 
   def __init__(self, generator: pagegenerators.Generator, **kwargs):
-    self.generator = generator
-    self.lock = asyncio.Lock()
-    self.edited_pages = []
-    self.error_pages = []
-    self.queue = asyncio.Queue(CONST_QUEUE_SIZE)
-
-  def log(self, message: str, status: ENUM_LOGGER_STATES = ENUM_LOGGER_STATES.log) -> None:
-    if status == ENUM_LOGGER_STATES.log:
-      print(message)
-    elif status == ENUM_LOGGER_STATES.output:
-      print(f"{ENUM_ANSI_COLOURS.green.value}{message}{ENUM_ANSI_COLOURS.default.value}")
-    elif status == ENUM_LOGGER_STATES.warn:
-      print(f"{ENUM_ANSI_COLOURS.yellow.value}{message}{ENUM_ANSI_COLOURS.default.value}")
-    elif status == ENUM_LOGGER_STATES.error:
-      print(f"{ENUM_ANSI_COLOURS.red.value}{message}{ENUM_ANSI_COLOURS.default.value}")
-    else:
-      print(message)
-
-  async def treat_one_page(self, page: pywikibot.Page) -> Tuple[Optional[bool], Optional[str], Optional[str]]:
+    super().__init__(
+      generator=generator,
+      queue_size=CONST_QUEUE_SIZE,
+      num_consumers=CONST_NUM_TASK_CONSUMERS,
+      num_workers=CONST_NUM_WORKER_THREADS,
+      num_savers=CONST_NUM_SAVE_WORKERS,
+      edits_per_minute=CONST_EDITS_PER_MINUTE
+    )
+
+  def load_page_contents(self, page: pywikibot.Page) -> str:
+    if not page.exists():
+      raise PageNotFoundException("Page doesn't exist")
+    elif page.isRedirectPage():
+      raise PageNotFoundException("Page is a redirect")
+    return page.text
+
+  async def treat_one_page(self, page: pywikibot.Page) -> Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]:
     if page is None: 
-      return (None, None, None)
+      return (None, None, None, None, None)
     is_edited = False
     err_message = None
     page_title = None
     try:
       page_title = page.title()
-      if not page.exists():
-        raise PageNotFoundException("Page doesn't exist")
-      elif page.isRedirectPage():
-        raise PageNotFoundException("Page is a redirect")
-      page_contents = page.text
+      page_contents = await self.fetch_blocking(self.load_page_contents, page)
 
       #Process page contents/redirects/etc.
       
@@ -98,56 +68,13 @@ class AsyncBot:
     
     finally:
       if not is_edited:
-        return (is_edited, page_title, err_message)
+        return (is_edited, page_title, err_message, None, None)
+      # The page is saved by the save stage of AsyncBotWrapper
       page.text = page_contents
-      page.save(
-        summary=self.CONST_EDIT_SUMMARY, 
-        watch="nochange", 
-        minor=False, 
-        botflag=False,
-        asynchronous=True
-      )
-      return (True, page_title, err_message)
-  
-  async def run_task_producer(self):
-    while True:
-      try:
-        cur = next(self.generator)
-        await self.queue.put(cur)
-      except StopIteration:
-        break
-  
-  async def run_task_consumer(self):
-    while True:
-      page: pywikibot.Page
-      page = await self.queue.get()
-      results = await self.treat_one_page(page)
-      is_edited, page_title, err_message = results
-      if is_edited is not None:
-        async with self.lock:
-          if is_edited:
-            self.edited_pages.append(page_title)
-          if err_message is not None:
-            self.error_pages.append((page_title, err_message))
-      self.queue.task_done()
-
-  async def run_async(self):
-    producer = asyncio.create_task(self.run_task_producer())
-    consumers = [asyncio.create_task(self.run_task_consumer()) for _ in range(CONST_NUM_TASK_CONSUMERS)]
-    await producer
-    await self.queue.join()
-    for consumer in consumers:
-      consumer.cancel()
-    if (len(self.error_pages) > 0):
-      self.log(f"The following pages need intervention", ENUM_LOGGER_STATES.error)
-      self.log("\n".join(self.error_pages))
-    if (len(self.edited_pages) > 0):
-      self.log(f"{ENUM_ANSI_COLOURS.magenta.value}Finished editing the following pages:{ENUM_ANSI_COLOURS.default.value}")
-      self.log("\n".join(self.edited_pages))
-
-  @countElapsedTime
-  def run(self):
-    asyncio.run(self.run_async())
+      return (True, page_title, err_message, None, None)
+
+  async def run_on_termination(self):
+    pass
 
 if __name__ == "__main__":
   options = {}
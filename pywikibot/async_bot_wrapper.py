@@ -2,12 +2,23 @@
 import pywikibot
 from pywikibot import pagegenerators
 import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from typing import Callable, Tuple, List, Any, Optional
+from typing import Callable, Tuple, List, Any, Optional, Dict
 from enum import Enum
 
 import abc
-from time import time
+from time import time, perf_counter
+
+from api_client import ApiClient
+from rate_limiter import AdaptiveRateLimiter, SharedRateLimiter
+from bot_metrics import BotMetrics, measure_fetch
+from run_checkpoint import RunCheckpoint
+from shard_runner import is_in_shard
+from result_sink import ResultSink
 
 def countElapsedTime(func: Callable) -> Callable:
   def wrapped(*args, **kwargs):
@@ -36,25 +47,81 @@ class ENUM_ANSI_COLOURS(Enum):
 class AsyncBotWrapper:
   __metaclass__ = abc.ABCMeta
 
+  CONST_EDIT_SUMMARY = "Bot: Automated edit"
+  # INTERVAL BETWEEN TWO SAMPLES OF THE QUEUE DEPTHS, IN SECONDS
+  CONST_QUEUE_SAMPLE_INTERVAL = 1
+
   lock: asyncio.Lock
-  edited_pages: List[str]
-  error_pages: List[Tuple[str, str]]
-  collected_results_on_success: List[Tuple[str, Any]]
-  collected_results_on_failure: List[Tuple[str, Any]]
+  # Results of the completed pages: edited pages, error pages, payloads on success and on failure
+  results: ResultSink
   queue: asyncio.Queue
   num_consumers: int
+  num_workers: int
+  executor: ThreadPoolExecutor
+  threaded_producer: bool
+  api: Optional[ApiClient]
+  save_queue: asyncio.Queue
+  num_savers: int
+  edit_limiter: Optional[AdaptiveRateLimiter | SharedRateLimiter]
+  save_latencies: List[float]
+  metrics: BotMetrics
+  progress_interval: Optional[float]
+  metrics_path: Optional[str]
+  checkpoint: Optional[RunCheckpoint]
+  # (index, number of shards) when the bot is run as one of several processes (see shard_runner.py)
+  shard: Optional[Tuple[int, int]]
+  # Errors of the shards that failed, set in the parent process before the merged results are reported
+  shard_failures: List[str]
 
-  def __init__(self, generator: pagegenerators.Generator, queue_size: int | None, num_consumers: int = 50):
+  def __init__(
+    self, 
+    generator: pagegenerators.Generator, 
+    queue_size: int | None, 
+    num_consumers: int = 50, 
+    num_workers: int = 10, 
+    threaded_producer: bool = False,
+    api: Optional[ApiClient] = None,
+    save_queue_size: int = 50,
+    num_savers: int = 5,
+    edits_per_minute: Optional[float] = None,
+    progress_interval: Optional[float] = None,
+    metrics_path: Optional[str] = None,
+    checkpoint: Optional[RunCheckpoint] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    results_path: Optional[str] = None
+  ):
     self.generator = generator
     self.lock = asyncio.Lock()
-    self.edited_pages = []
-    self.error_pages = []
-    self.collected_results_on_success = []
-    self.collected_results_on_failure = []
+    # Streamed to results_path (JSON Lines) as each page is completed, if given
+    self.results = ResultSink(results_path)
     self.queue = asyncio.Queue(queue_size)
     self.num_consumers = num_consumers
+    self.num_workers = num_workers
+    self.executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="AsyncBotWrapper")
+    self.threaded_producer = threaded_producer
+    self.api = api
+    self.save_queue = asyncio.Queue(save_queue_size)
+    self.num_savers = num_savers
+    self.edit_limiter = None
+    if edits_per_minute is not None:
+      edit_rate = edits_per_minute / 60
+      self.edit_limiter = AdaptiveRateLimiter(rate=edit_rate, min_rate=edit_rate, max_rate=edit_rate, burst=1)
+    self.save_latencies = []
+    self.metrics = BotMetrics(type(self).__name__, num_consumers, api)
+    self.progress_interval = progress_interval
+    self.metrics_path = metrics_path
+    self.checkpoint = checkpoint
+    self.shard = shard
+    self.shard_failures = []
+    if self.checkpoint is not None:
+      # Restore the results of the pages completed before the run was interrupted
+      for results in self.checkpoint.results:
+        if results[0] is not None:
+          self.results.append(results)
 
   def log(self, message: str, status: ENUM_LOGGER_STATES = ENUM_LOGGER_STATES.log) -> None:
+    if self.shard is not None:
+      message = f"[shard {self.shard[0] + 1}/{self.shard[1]}] {message}"
     if status == ENUM_LOGGER_STATES.log:
       print(message)
     elif status == ENUM_LOGGER_STATES.output:
@@ -66,65 +133,283 @@ class AsyncBotWrapper:
     else:
       print(message)
 
+  async def run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking call (e.g. page.exists(), page.text, page.save(...)) on the bot's thread pool, so that it does not stall the event loop.
+
+    At most num_workers blocking calls run at the same time, the remaining calls wait for a free worker.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+  async def fetch_blocking(self, func: Callable, *args, **kwargs) -> Any:
+    """
+    Same as run_blocking, for the calls that load a page from the wiki: their time is counted as fetch time of the
+    page being treated. Saves and user prompts should go through run_blocking, so that they are not counted as fetches.
+    """
+    with measure_fetch():
+      return await self.run_blocking(func, *args, **kwargs)
+
   @abc.abstractmethod
   async def treat_one_page(self, page: pywikibot.Page) -> Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]:
     """
     Override this method to determine how to process each page. 
     
-    Set the new page contents to page.text, then use page.save(summary) to save the changes.
+    Set the new page contents to page.text and return is_page_edited = True. The page is then queued to be saved 
+    by the save stage (see save_page), and is only reported as edited once the save has completed.
+    Blocking pywikibot calls should be awaited through self.run_blocking(...) (self.fetch_blocking(...) for the calls
+    that load pages) so that the consumers can overlap.
 
     This method should return a tuple of five values: is_page_edited (bool), page_title (str), error_message (str), optional payload on success, optional payload on failure
     """
     return
 
+  def save_page(self, page: pywikibot.Page) -> None:
+    """
+    Override this method to change how each edited page is saved. This method is run on the bot's thread pool.
+    """
+    page.save(
+      summary=self.CONST_EDIT_SUMMARY, 
+      watch="nochange", 
+      minor=False, 
+      bot=False
+    )
+
+  async def run_on_startup(self):
+    """
+    Override this method to set the callback to run before the first page is processed.
+    """
+
   @abc.abstractmethod
   async def run_on_termination(self):
     """
     Override this method to set the callback to run just before bot termination.
+
+    In a sharded run, this method is only run by the parent process, once the results of the shards have been 
+    merged. self.shard_failures then lists the shards that failed, whose pages are missing from the results.
+    """
+
+  async def close_resources(self):
+    """
+    Override this method to release the resources opened by the bot (e.g. in run_on_startup) and log their stats.
+    Unlike run_on_termination, this method is run by every process of a sharded run.
     """
   
+  async def enqueue_page(self, page: pywikibot.Page) -> None:
+    if self.shard is not None and page is not None and not is_in_shard(page.title(), self.shard):
+      return
+    if self.checkpoint is not None and page is not None:
+      if self.checkpoint.should_skip(page.title()):
+        return
+      self.checkpoint.dispatch(page.title())
+    await self.queue.put(page)
+
   async def run_task_producer(self):
     while True:
       try:
         cur = next(self.generator)
-        await self.queue.put(cur)
+        await self.enqueue_page(cur)
       except StopIteration:
         break
+
+  def __drive_generator(self, loop: asyncio.AbstractEventLoop, stop_event: threading.Event) -> None:
+    for cur in self.generator:
+      if stop_event.is_set():
+        break
+      # Blocks this thread (and hence the generator) while the queue is full
+      asyncio.run_coroutine_threadsafe(self.enqueue_page(cur), loop).result()
+
+  async def run_task_producer_threaded(self):
+    """
+    Iterate through the generator in a background thread, so that the batch requests made by the generator 
+    (e.g. PreloadingGenerator) do not stall the event loop. The next batch is downloaded while the consumers 
+    process the current batch, up to queue_size pages ahead.
+    """
+    loop = asyncio.get_running_loop()
+    stop_event = threading.Event()
+    try:
+      await asyncio.to_thread(self.__drive_generator, loop, stop_event)
+    except asyncio.CancelledError:
+      stop_event.set()
+      raise
+  
+  async def record_results(self, results: Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]) -> None:
+    is_edited, _, err_message, _, _ = results
+    if is_edited is None:
+      return
+    self.metrics.record_result(is_edited, err_message is not None)
+    async with self.lock:
+      self.results.append(results)
   
   async def run_task_consumer(self):
     while True:
       page: pywikibot.Page
       page = await self.queue.get()
-      results = await self.treat_one_page(page)
-      is_edited, page_title, err_message, payload_on_success, payload_on_failure = results
-      if is_edited is not None:
-        async with self.lock:
-          if is_edited:
-            self.edited_pages.append(page_title)
-          if err_message is not None:
-            self.error_pages.append((page_title, err_message))
-          if payload_on_success is not None:
-            self.collected_results_on_success.append((page_title, payload_on_success))
-          if payload_on_failure is not None:
-            self.collected_results_on_failure.append((page_title, payload_on_failure))
+      page_metrics = self.metrics.start_page()
+      try:
+        results = await self.treat_one_page(page)
+      except Exception as e:
+        self.metrics.record_error(e)
+        page_title = page.title() if page is not None else None
+        err_message = f"Unhandled {type(e).__name__}: {e}"
+        self.log(f"[{page_title}]\t{err_message}", ENUM_LOGGER_STATES.error)
+        results = (False, page_title, err_message, None, None)
+      self.metrics.end_page(page_metrics)
+      if results[0]:
+        # Wait here while the save queue is full, so that reads never run too far ahead of writes
+        await self.save_queue.put((page, results))
+      else:
+        await self.complete_page(page, results)
       self.queue.task_done()
 
+  async def run_task_saver(self):
+    while True:
+      page: pywikibot.Page
+      page, results = await self.save_queue.get()
+      is_edited, page_title, err_message, payload_on_success, payload_on_failure = results
+      if self.edit_limiter is not None:
+        await self.edit_limiter.acquire()
+      start_time = perf_counter()
+      try:
+        await self.run_blocking(self.save_page, page)
+        self.save_latencies.append(perf_counter() - start_time)
+        self.metrics.observe("save", perf_counter() - start_time)
+      except Exception as e:
+        self.metrics.record_error(e)
+        is_edited = False
+        err_message = f"Failed to save page: {e}"
+        self.log(f"[{page_title}]\t{err_message}", ENUM_LOGGER_STATES.error)
+      await self.complete_page(page, (is_edited, page_title, err_message, payload_on_success, payload_on_failure))
+      self.save_queue.task_done()
+
+  async def complete_page(self, page: pywikibot.Page, results: Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]) -> None:
+    """Record the results of a page that has been treated and, if edited, saved"""
+    await self.record_results(results)
+    if self.checkpoint is not None and page is not None:
+      self.checkpoint.complete(page.title(), results)
+
+  def throughput_stats(self, elapsed_time: float) -> str:
+    num_pages_treated = self.metrics.num_pages_treated
+    stats = f"Read stage: {num_pages_treated} pages treated ({num_pages_treated / elapsed_time:.2f} pages/s"
+    if num_pages_treated > 0:
+      treat_stage = self.metrics.stages["treat"]
+      fetch_stage = self.metrics.stages["fetch"]
+      stats += f", {treat_stage.sum / treat_stage.count:.2f} s per page of which {fetch_stage.sum / fetch_stage.count:.2f} s fetching"
+      stats += f", consumers {self.metrics.busy_ratio():.0%} busy"
+    stats += ")"
+    num_saves = len(self.save_latencies)
+    stats += f"\nWrite stage: {num_saves} pages saved ({num_saves / elapsed_time * 60:.1f} edits/min)"
+    if num_saves > 0:
+      latencies = sorted(self.save_latencies)
+      stats += f", save latency p50 {latencies[num_saves // 2]:.2f} s, p90 {latencies[int(num_saves * 0.9)]:.2f} s, max {latencies[-1]:.2f} s"
+    if len(self.metrics.errors) > 0:
+      stats += "\nErrors: " + ", ".join(f"{count} {error_type}" for error_type, count in self.metrics.errors.most_common())
+    return stats
+
+  def log_throughput(self, elapsed_time: float) -> None:
+    """
+    Override this method to change how the throughput of the read and write stages is reported at the end of the run.
+    """
+    self.log(self.throughput_stats(elapsed_time))
+
+  async def run_task_monitor(self):
+    """
+    Sample the queue depths every CONST_QUEUE_SAMPLE_INTERVAL seconds, and print a progress line every progress_interval seconds.
+    """
+    last_progress_time = perf_counter()
+    while True:
+      self.metrics.sample_queues(self.queue.qsize(), self.save_queue.qsize())
+      if self.progress_interval is not None and perf_counter() - last_progress_time >= self.progress_interval:
+        last_progress_time = perf_counter()
+        self.log(self.metrics.progress_line())
+      await asyncio.sleep(self.CONST_QUEUE_SAMPLE_INTERVAL)
+
   async def run_async(self):
-    producer = asyncio.create_task(self.run_task_producer())
+    start_time = perf_counter()
+    self.metrics.start()
+    if self.checkpoint is not None:
+      self.checkpoint.open(type(self).__name__)
+      if self.checkpoint.is_resumed:
+        self.log(
+          f"Resuming the run started at {self.checkpoint.started_at} from {self.checkpoint.path}: {len(self.checkpoint.completed_titles)} pages already completed, " 
+          f"continuing after {self.checkpoint.position}", 
+          ENUM_LOGGER_STATES.warn
+        )
+    if self.api is not None:
+      await self.api.open()
+    await self.run_on_startup()
+    monitor = asyncio.create_task(self.run_task_monitor())
+    producer = asyncio.create_task(
+      self.run_task_producer_threaded() if self.threaded_producer else self.run_task_producer()
+    )
     consumers = [asyncio.create_task(self.run_task_consumer()) for _ in range(self.num_consumers)]
+    savers = [asyncio.create_task(self.run_task_saver()) for _ in range(self.num_savers)]
     await producer
     await self.queue.join()
-    for consumer in consumers:
-      consumer.cancel()
-    if (len(self.error_pages) > 0):
+    await self.save_queue.join()
+    for task in [*consumers, *savers, monitor]:
+      task.cancel()
+    self.metrics.sample_queues(self.queue.qsize(), self.save_queue.qsize())
+    # The results of a shard are reported by the parent process, once merged with those of the other shards
+    if self.shard is None:
+      self.log_results()
+    self.log_throughput(perf_counter() - start_time)
+    await self.close_resources()
+    if self.shard is None:
+      await self.run_on_termination()
+    if self.api is not None:
+      self.log(self.api.stats())
+      await self.api.close()
+    if self.metrics_path is not None:
+      json_path, prometheus_path = self.metrics.write_snapshot(self.metrics_path)
+      self.log(f"Metrics written to {json_path} and {prometheus_path}")
+    if self.checkpoint is not None:
+      self.checkpoint.finish()
+    # The results of a shard are read back by the parent process, which deletes them once merged
+    if self.shard is None:
+      self.results.remove()
+    else:
+      self.results.close()
+    self.executor.shutdown(wait=True)
+
+  def log_results(self) -> None:
+    if (self.results.num_errors > 0):
       self.log(f"The following pages need intervention", ENUM_LOGGER_STATES.error)
-      self.log("\n".join(map(
-        lambda tpl: f"{tpl[0]}\t{ENUM_ANSI_COLOURS.red.value}{tpl[1]}{ENUM_ANSI_COLOURS.default.value}", 
-        self.error_pages)))
-    if (len(self.edited_pages) > 0):
+      for page_title, err_message in self.results.error_pages():
+        self.log(f"{page_title}\t{ENUM_ANSI_COLOURS.red.value}{err_message}{ENUM_ANSI_COLOURS.default.value}")
+    if (self.results.num_edited > 0):
       self.log(f"{ENUM_ANSI_COLOURS.magenta.value}Finished editing the following pages:{ENUM_ANSI_COLOURS.default.value}")
-      self.log("\n".join(self.edited_pages))
+      for page_title in self.results.edited_pages():
+        self.log(page_title)
+
+  def shard_results(self) -> Dict[str, Any]:
+    """
+    Override this method (and merge_shard_results) to send more results of a shard to the parent process. The 
+    results are pickled.
+    """
+    self.results.close()
+    return {
+      # Results streamed to a file are read back from the file by the parent process
+      "results": list(self.results.records()) if self.results.path is None else None,
+      "results_path": self.results.path,
+      "metrics": self.metrics.snapshot()
+    }
+
+  def merge_shard_results(self, results: Dict[str, Any]) -> None:
+    """Add the results of a shard to the results of this bot, in the parent process"""
+    for shard_results in results["results"] if results["results"] is not None else ResultSink.read(results["results_path"]):
+      self.results.append(shard_results)
+    if results["results_path"] is not None:
+      os.remove(results["results_path"])
+
+  async def run_merged(self) -> None:
+    """Report the merged results of all shards, in the parent process"""
+    for err_message in self.shard_failures:
+      self.log(err_message, ENUM_LOGGER_STATES.error)
+    self.log_results()
     await self.run_on_termination()
+    self.results.remove()
+    self.executor.shutdown(wait=True)
 
   @countElapsedTime
   def run(self):
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Concurrent mode of vlw_editlinks.py (-async).
+
+The pages of the generator go through the fetch/transform/save pipeline of AsyncBotWrapper, so that the save
+round-trip of a page overlaps with the rewrite of the next pages. The pages are rewritten by LinkEditorBot
+(rewrite_page), and the bot keeps the behaviour of a LinkEditorBot run: the diff of each page is shown, each change
+is confirmed unless -always is set (one prompt at a time, "All" and "Quit" work as usual), -simulate makes the saves
+no-ops, and the read/write/skip counters end with the usual pywikibot summary.
+
+The saves are paced by edits_per_minute, if given, on top of the put_throttle of pywikibot, which still spaces out
+the start of the saves.
+
+Requires the file async_bot_wrapper.py (and the modules it imports) to be saved in the same folder as this script.
+"""
+
+import asyncio
+import itertools
+
+import pywikibot
+from pywikibot.bot import CurrentPageBot, QuitKeyboardInterrupt
+
+from typing import Any, Dict, Optional, Tuple
+
+from async_bot_wrapper import AsyncBotWrapper
+
+# MAXIMUM NUMBER OF PAGES READ AHEAD OF THE REWRITE
+CONST_QUEUE_SIZE = 100
+# DEFAULT NUMBER OF PAGES REWRITTEN AT A SINGLE TIME, AND OF PAGES SAVED AT A SINGLE TIME
+CONST_NUM_WORKERS = 5
+
+class AsyncLinkEditor(AsyncBotWrapper):
+  # The LinkEditorBot whose options, rewrite and counters are used
+  editor: CurrentPageBot
+
+  def __init__(self, editor: CurrentPageBot, num_workers: int = CONST_NUM_WORKERS, edits_per_minute: Optional[float] = None):
+    self.__is_quitting = False
+    super().__init__(
+      # Stop reading pages once the user has quit
+      generator=itertools.takewhile(lambda page: not self.__is_quitting, editor.generator),
+      queue_size=CONST_QUEUE_SIZE,
+      num_consumers=num_workers,
+      # Threads for the rewrites and for the saves
+      num_workers=2 * num_workers,
+      threaded_producer=True,
+      num_savers=num_workers,
+      edits_per_minute=edits_per_minute
+    )
+    self.editor = editor
+    # Edit summary of each page waiting to be saved, by page title
+    self.__summaries: Dict[str, str] = {}
+    # Only one page is shown (and confirmed) at a time
+    self.__prompt_lock = asyncio.Lock()
+
+  def __confirm_change(self, page: pywikibot.Page, old_text: str, new_text: str, summary: str) -> bool:
+    """Show the change as LinkEditorBot.put_current does, and ask for confirmation unless -always is set"""
+    self.editor.current_page = page
+    pywikibot.showDiff(old_text, new_text)
+    pywikibot.info(f"Edit summary: {summary}")
+    return self.editor.user_confirm("Do you want to accept these changes?")
+
+  async def treat_one_page(self, page: pywikibot.Page) -> Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]:
+    if page is None or self.__is_quitting:
+      return (None, None, None, None, None)
+    page = self.editor.init_page(page)
+    if await self.fetch_blocking(self.editor.skip_page, page):
+      self.editor.counter["skip"] += 1
+      return (None, None, None, None, None)
+    self.editor.counter["read"] += 1
+    page_title = page.title()
+    old_text = await self.fetch_blocking(lambda: page.text)
+    new_text, summary = await self.run_blocking(self.editor.rewrite_page, page)
+    if old_text.rstrip() == new_text.rstrip():
+      pywikibot.info(f"No changes were needed on {page}")
+      return (False, page_title, None, None, None)
+
+    async with self.__prompt_lock:
+      if self.__is_quitting:
+        return (None, None, None, None, None)
+      try:
+        is_confirmed = await self.run_blocking(self.__confirm_change, page, old_text, new_text, summary)
+      except QuitKeyboardInterrupt:
+        self.__is_quitting = True
+        pywikibot.info(f"\nUser quit {type(self.editor).__name__} bot run...")
+        return (None, None, None, None, None)
+    if not is_confirmed:
+      return (False, page_title, None, None, None)
+
+    # The page is saved by the save stage of AsyncBotWrapper
+    self.__summaries[page_title] = summary
+    page.text = new_text
+    return (True, page_title, None, None, None)
+
+  def save_page(self, page: pywikibot.Page) -> None:
+    page.save(summary=self.__summaries.pop(page.title()))
+
+  async def complete_page(self, page: pywikibot.Page, results: Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]) -> None:
+    if results[0]:
+      self.editor.counter["write"] += 1
+    await super().complete_page(page, results)
+
+  def log_results(self) -> None:
+    # The run ends with the summary of LinkEditorBot only: the edited pages are listed by their diffs, and the pages
+    # that failed to save are logged as they fail
+    pass
+
+  def log_throughput(self, elapsed_time: float) -> None:
+    pass
+
+  async def run_on_termination(self):
+    pass
+
+  def run(self) -> None:
+    """Run the pipeline in place of LinkEditorBot.run, ending with the same summary"""
+    self.editor._start_ts = pywikibot.Timestamp.now()
+    self.editor.setup()
+    try:
+      asyncio.run(self.run_async())
+      self.editor.generator_completed = not self.__is_quitting
+    except KeyboardInterrupt:
+      pywikibot.info(f"\nKeyboardInterrupt during {type(self.editor).__name__} bot run...")
+    finally:
+      self.editor.exit()
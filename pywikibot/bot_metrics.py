@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Per-stage metrics of an AsyncBotWrapper run.
+
+The time spent on each page is split into stages:
+  fetch      time spent waiting for the wiki while treating the page (API requests, blocking pywikibot calls run
+             through fetch_blocking), counted once while several requests of the page are in flight
+  transform  the rest of the time spent treating the page (parsing and editing the wikitext)
+  save       time spent saving the page
+Each stage is recorded in a histogram with Prometheus-style cumulative buckets.
+
+The page being treated by a consumer is kept in the current_page_metrics context variable, which is inherited by the
+tasks started while treating the page, so that ApiClient and fetch_blocking can add their waiting time to it
+(measure_fetch).
+
+The queue depths and the number of busy consumers are sampled periodically. A snapshot of everything can be written
+as JSON, or in the Prometheus text format (for the textfile collector of node_exporter).
+"""
+
+import contextvars
+import json
+import os
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# UPPER BOUNDS OF THE HISTOGRAM BUCKETS, IN SECONDS
+CONST_SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+CONST_STAGES = ("fetch", "transform", "treat", "save")
+# MAXIMUM NUMBER OF QUEUE DEPTH SAMPLES KEPT (OLDER SAMPLES ARE THINNED OUT)
+CONST_MAX_QUEUE_SAMPLES = 2000
+CONST_PROMETHEUS_PREFIX = "vlw_bot"
+
+class Histogram:
+  buckets: Tuple[float, ...]
+  counts: List[int]
+  count: int
+  sum: float
+  max: float
+
+  def __init__(self, buckets: Tuple[float, ...] = CONST_SECONDS_BUCKETS):
+    self.buckets = buckets
+    self.counts = [0] * (len(buckets) + 1)
+    self.count = 0
+    self.sum = 0
+    self.max = 0
+
+  def observe(self, value: float) -> None:
+    index = 0
+    while index < len(self.buckets) and value > self.buckets[index]:
+      index += 1
+    self.counts[index] += 1
+    self.count += 1
+    self.sum += value
+    self.max = max(self.max, value)
+
+  def quantile(self, q: float) -> float:
+    """Estimate a quantile by linear interpolation inside its bucket (like histogram_quantile in Prometheus)"""
+    if self.count == 0:
+      return 0
+    rank = q * self.count
+    cumulative = 0
+    for index, count in enumerate(self.counts):
+      if cumulative + count >= rank and count > 0:
+        lower = self.buckets[index - 1] if index > 0 else 0
+        upper = self.buckets[index] if index < len(self.buckets) else self.max
+        return min(self.max, lower + (upper - lower) * (rank - cumulative) / count)
+      cumulative += count
+    return self.max
+
+  def cumulative_counts(self) -> List[Tuple[str, int]]:
+    cumulative = 0
+    result = []
+    for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+      cumulative += count
+      result.append((bound, cumulative))
+    return result
+
+  def to_dict(self) -> Dict[str, Any]:
+    return {
+      "count": self.count,
+      "sum": self.sum,
+      "mean": self.sum / self.count if self.count > 0 else 0,
+      "p50": self.quantile(0.5),
+      "p90": self.quantile(0.9),
+      "p99": self.quantile(0.99),
+      "max": self.max,
+      "buckets": dict(self.cumulative_counts())
+    }
+
+class PageMetrics:
+  """Timings of one page, while it is treated by a consumer"""
+  start_time: float
+  fetch_time: float
+
+  def __init__(self):
+    self.start_time = perf_counter()
+    self.fetch_time = 0
+    self.__num_fetches_in_flight = 0
+    self.__fetch_start_time = 0
+
+  def start_fetch(self) -> None:
+    if self.__num_fetches_in_flight == 0:
+      self.__fetch_start_time = perf_counter()
+    self.__num_fetches_in_flight += 1
+
+  def end_fetch(self) -> None:
+    self.__num_fetches_in_flight -= 1
+    if self.__num_fetches_in_flight == 0:
+      self.fetch_time += perf_counter() - self.__fetch_start_time
+
+current_page_metrics: contextvars.ContextVar[Optional[PageMetrics]] = contextvars.ContextVar("current_page_metrics", default=None)
+
+@contextmanager
+def measure_fetch() -> Iterator[None]:
+  """Count the time spent in this block as fetch time of the page being treated (if any)"""
+  page_metrics = current_page_metrics.get()
+  if page_metrics is None:
+    yield
+    return
+  page_metrics.start_fetch()
+  try:
+    yield
+  finally:
+    page_metrics.end_fetch()
+
+class BotMetrics:
+  bot_name: str
+  num_consumers: int
+  # ApiClient of the bot (if any), read for the number of API requests and bytes received
+  api: Optional[Any]
+  start_time: float
+  stages: Dict[str, Histogram]
+  num_pages_treated: int
+  num_pages_edited: int
+  num_pages_failed: int
+  num_busy_consumers: int
+  busy_time: float
+  errors: Counter
+  queue_samples: List[Tuple[float, int, int, int]]
+
+  def __init__(self, bot_name: str, num_consumers: int, api: Optional[Any] = None):
+    self.bot_name = bot_name
+    self.num_consumers = num_consumers
+    self.api = api
+    self.start_time = perf_counter()
+    self.stages = { stage: Histogram() for stage in CONST_STAGES }
+    self.num_pages_treated = 0
+    self.num_pages_edited = 0
+    self.num_pages_failed = 0
+    self.num_busy_consumers = 0
+    self.busy_time = 0
+    self.errors = Counter()
+    self.queue_samples = []
+    self.__num_samples_seen = 0
+    self.__sample_step = 1
+
+  def start(self) -> None:
+    self.start_time = perf_counter()
+
+  def elapsed_time(self) -> float:
+    return perf_counter() - self.start_time
+
+  def start_page(self) -> PageMetrics:
+    self.num_busy_consumers += 1
+    page_metrics = PageMetrics()
+    current_page_metrics.set(page_metrics)
+    return page_metrics
+
+  def end_page(self, page_metrics: PageMetrics) -> None:
+    current_page_metrics.set(None)
+    treat_time = perf_counter() - page_metrics.start_time
+    self.num_busy_consumers -= 1
+    self.busy_time += treat_time
+    self.num_pages_treated += 1
+    self.stages["treat"].observe(treat_time)
+    self.stages["fetch"].observe(page_metrics.fetch_time)
+    self.stages["transform"].observe(max(0, treat_time - page_metrics.fetch_time))
+
+  def observe(self, stage: str, value: float) -> None:
+    self.stages[stage].observe(value)
+
+  def record_result(self, is_edited: bool, is_failed: bool) -> None:
+    self.num_pages_edited += 1 if is_edited else 0
+    self.num_pages_failed += 1 if is_failed else 0
+
+  def record_error(self, error: BaseException) -> None:
+    self.errors[type(error).__name__] += 1
+
+  def sample_queues(self, queue_depth: int, save_queue_depth: int) -> None:
+    # Keep every __sample_step-th sample, and halve the samples when the limit is reached, so that a long run is
+    # covered from start to end with a bounded number of samples
+    self.__num_samples_seen += 1
+    if (self.__num_samples_seen - 1) % self.__sample_step != 0:
+      return
+    self.queue_samples.append((round(self.elapsed_time(), 3), queue_depth, save_queue_depth, self.num_busy_consumers))
+    if len(self.queue_samples) >= CONST_MAX_QUEUE_SAMPLES:
+      self.queue_samples = self.queue_samples[::2]
+      self.__sample_step *= 2
+
+  def busy_ratio(self) -> float:
+    """Fraction of the consumer time spent treating pages (the rest is spent waiting for pages in the queue)"""
+    total_time = self.num_consumers * self.elapsed_time()
+    return min(1, self.busy_time / total_time) if total_time > 0 else 0
+
+  def api_totals(self) -> Tuple[int, int]:
+    if self.api is None:
+      return (0, 0)
+    return (self.api.num_requests, self.api.num_bytes_received)
+
+  def progress_line(self) -> str:
+    elapsed_time = self.elapsed_time()
+    num_requests, num_bytes = self.api_totals()
+    num_pages = max(self.num_pages_treated, 1)
+    latest = self.queue_samples[-1] if len(self.queue_samples) > 0 else (0, 0, 0, 0)
+    line = f"[{elapsed_time:7.0f} s] {self.num_pages_treated} pages treated ({self.num_pages_treated / max(elapsed_time, 1e-9):.2f}/s), "
+    line += f"{self.num_pages_edited} edited, {self.num_pages_failed} failed"
+    line += f" | queue {latest[1]}, save queue {latest[2]}, consumers {self.busy_ratio():.0%} busy"
+    line += f" | p50 fetch {self.stages['fetch'].quantile(0.5):.2f} s, transform {self.stages['transform'].quantile(0.5):.3f} s, save {self.stages['save'].quantile(0.5):.2f} s"
+    if self.api is not None:
+      line += f" | {num_requests / num_pages:.1f} API requests, {num_bytes / num_pages / 1024:.0f} KiB per page"
+    return line
+
+  def snapshot(self) -> Dict[str, Any]:
+    num_requests, num_bytes = self.api_totals()
+    num_pages = max(self.num_pages_treated, 1)
+    return {
+      "bot": self.bot_name,
+      "elapsed_seconds": self.elapsed_time(),
+      "pages": { "treated": self.num_pages_treated, "edited": self.num_pages_edited, "failed": self.num_pages_failed },
+      "stages": { stage: histogram.to_dict() for stage, histogram in self.stages.items() },
+      "consumers": { "count": self.num_consumers, "busy_ratio": self.busy_ratio() },
+      "api": {
+        "requests": num_requests,
+        "bytes_received": num_bytes,
+        "requests_per_page": num_requests / num_pages,
+        "bytes_per_page": num_bytes / num_pages
+      },
+      "errors": dict(self.errors),
+      "queue_depth": [
+        { "time": time, "queue": queue_depth, "save_queue": save_queue_depth, "busy_consumers": busy_consumers }
+        for time, queue_depth, save_queue_depth, busy_consumers in self.queue_samples
+      ]
+    }
+
+  def to_prometheus(self) -> str:
+    bot_label = f"bot=\"{self.bot_name}\""
+    num_requests, num_bytes = self.api_totals()
+    latest = self.queue_samples[-1] if len(self.queue_samples) > 0 else (0, 0, 0, 0)
+    lines = [
+      f"# HELP {CONST_PROMETHEUS_PREFIX}_stage_seconds Time spent on each page, by stage",
+      f"# TYPE {CONST_PROMETHEUS_PREFIX}_stage_seconds histogram"
+    ]
+    for stage, histogram in self.stages.items():
+      for bound, count in histogram.cumulative_counts():
+        lines.append(f"{CONST_PROMETHEUS_PREFIX}_stage_seconds_bucket{{{bot_label},stage=\"{stage}\",le=\"{bound}\"}} {count}")
+      lines.append(f"{CONST_PROMETHEUS_PREFIX}_stage_seconds_sum{{{bot_label},stage=\"{stage}\"}} {histogram.sum}")
+      lines.append(f"{CONST_PROMETHEUS_PREFIX}_stage_seconds_count{{{bot_label},stage=\"{stage}\"}} {histogram.count}")
+    lines += [
+      f"# HELP {CONST_PROMETHEUS_PREFIX}_pages_total Pages treated, edited and failed",
+      f"# TYPE {CONST_PROMETHEUS_PREFIX}_pages_total counter",
+      f"{CONST_PROMETHEUS_PREFIX}_pages_total{{{bot_label},result=\"treated\"}} {self.num_pages_treated}",
+      f"{CONST_PROMETHEUS_PREFIX}_pages_total{{{bot_label},result=\"edited\"}} {self.num_pages_edited}",
+      f"{CONST_PROMETHEUS_PREFIX}_pages_total{{{bot_label},result=\"failed\"}} {self.num_pages_failed}",
+      f"# HELP {CONST_PROMETHEUS_PREFIX}_errors_total Errors, by exception type",
+      f"# TYPE {CONST_PROMETHEUS_PREFIX}_errors_total counter"
+    ]
+    for error_type, count in sorted(self.errors.items()):
+      lines.append(f"{CONST_PROMETHEUS_PREFIX}_errors_total{{{bot_label},type=\"{error_type}\"}} {count}")
+    lines += [
+      f"# HELP {CONST_PROMETHEUS_PREFIX}_api_requests_total API requests made by the bot",
+      f"# TYPE {CONST_PROMETHEUS_PREFIX}_api_requests_total counter",
+      f"{CONST_PROMETHEUS_PREFIX}_api_requests_total{{{bot_label}}} {num_requests}",
+      f"# HELP {CONST_PROMETHEUS_PREFIX}_api_received_bytes_total Bytes received in API responses",
+      f"# TYPE {CONST_PROMETHEUS_PREFIX}_api_received_bytes_total counter",
+      f"{CONST_PROMETHEUS_PREFIX}_api_received_bytes_total{{{bot_label}}} {num_bytes}",
+      f"# HELP {CONST_PROMETHEUS_PREFIX}_queue_depth Pages waiting in each queue at the last sample",
+      f"# TYPE {CONST_PROMETHEUS_PREFIX}_queue_depth gauge",
+      f"{CONST_PROMETHEUS_PREFIX}_queue_depth{{{bot_label},queue=\"pages\"}} {latest[1]}",
+      f"{CONST_PROMETHEUS_PREFIX}_queue_depth{{{bot_label},queue=\"saves\"}} {latest[2]}",
+      f"# HELP {CONST_PROMETHEUS_PREFIX}_consumer_busy_ratio Fraction of the consumer time spent treating pages",
+      f"# TYPE {CONST_PROMETHEUS_PREFIX}_consumer_busy_ratio gauge",
+      f"{CONST_PROMETHEUS_PREFIX}_consumer_busy_ratio{{{bot_label}}} {self.busy_ratio()}",
+      f"# HELP {CONST_PROMETHEUS_PREFIX}_elapsed_seconds Run time of the bot",
+      f"# TYPE {CONST_PROMETHEUS_PREFIX}_elapsed_seconds gauge",
+      f"{CONST_PROMETHEUS_PREFIX}_elapsed_seconds{{{bot_label}}} {self.elapsed_time()}"
+    ]
+    return "\n".join(lines) + "\n"
+
+  def write_snapshot(self, path: str) -> Tuple[str, str]:
+    """Write the metrics to <path>.json and <path>.prom. Each file is replaced at once, so it is never read half-written."""
+    json_path, prometheus_path = f"{path}.json", f"{path}.prom"
+    for file_path, contents in ((json_path, json.dumps(self.snapshot(), indent=2)), (prometheus_path, self.to_prometheus())):
+      with open(f"{file_path}.tmp", "w", encoding="utf-8") as f:
+        f.write(contents)
+      os.replace(f"{file_path}.tmp", file_path)
+    return (json_path, prometheus_path)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Persistent (SQLite) cache of category members, shared between runs of a bot.
+
+Each cached member can carry a flag (e.g. whether an album is in Category:Compilation albums). Categories cached 
+with flags are dropped as a whole when the flag category itself changes.
+
+On each run, sync() asks the wiki which categories have changed since the previous sync:
+  - list=recentchanges with rctype=categorize lists every category whose members were added or removed
+  - list=logevents (deletions and moves) lists pages that have left their categories without a categorize entry
+Only those categories are dropped from the cache and downloaded again; every other category is served from disk.
+"""
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from time import time
+
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from api_client import ApiClient
+from category_index import normalize_category_title
+from recent_changes import get_recently_categorized, parse_timestamp, format_timestamp
+
+# RECENT CHANGES ARE ONLY KEPT BY THE WIKI FOR A LIMITED TIME ($wgRCMaxAge), THE WHOLE CACHE IS DROPPED IF THE LAST SYNC IS OLDER THAN THIS
+CONST_RECENT_CHANGES_MAX_AGE = timedelta(days=30)
+
+class CategoryMembersCache:
+  path: str
+  flag_category: Optional[str]
+  connection: sqlite3.Connection
+  num_hits: int
+  num_misses: int
+  lookup_time: float
+  is_cold: bool
+
+  def __init__(self, path: str, flag_category: Optional[str] = None):
+    self.path = path
+    self.flag_category = normalize_category_title(flag_category) if flag_category is not None else None
+    self.connection = sqlite3.connect(path)
+    self.connection.executescript("""
+      CREATE TABLE IF NOT EXISTS categories (
+        category TEXT NOT NULL,
+        namespace INTEGER NOT NULL,
+        has_flags INTEGER NOT NULL DEFAULT 0,
+        fetched_at TEXT NOT NULL,
+        PRIMARY KEY (category, namespace)
+      );
+      CREATE TABLE IF NOT EXISTS members (
+        category TEXT NOT NULL,
+        namespace INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        is_compilation INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (category, namespace, title)
+      );
+      CREATE INDEX IF NOT EXISTS members_by_title ON members (title);
+      CREATE TABLE IF NOT EXISTS sync (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+      );
+    """)
+    self.num_hits = 0
+    self.num_misses = 0
+    self.lookup_time = 0
+    self.is_cold = True
+
+  def close(self) -> None:
+    self.connection.close()
+
+  def get_last_sync(self) -> Optional[datetime]:
+    row = self.connection.execute("SELECT value FROM sync WHERE key = 'last_sync'").fetchone()
+    if row is None:
+      return None
+    return parse_timestamp(row[0])
+
+  def get(self, category: str, namespace: int) -> Optional[List[Tuple[str, bool]]]:
+    """Get the cached (title, is_compilation) members of the category, or None if the category is not cached"""
+    category = normalize_category_title(category)
+    cached = self.connection.execute(
+      "SELECT 1 FROM categories WHERE category = ? AND namespace = ?", (category, namespace)
+    ).fetchone()
+    if cached is None:
+      self.num_misses += 1
+      return None
+    self.num_hits += 1
+    rows = self.connection.execute(
+      "SELECT title, is_compilation FROM members WHERE category = ? AND namespace = ?", (category, namespace)
+    ).fetchall()
+    return [(title, bool(is_compilation)) for title, is_compilation in rows]
+
+  def put(self, category: str, namespace: int, members: List[Tuple[str, bool]], has_flags: bool = False) -> None:
+    category = normalize_category_title(category)
+    fetched_at = format_timestamp(datetime.now(timezone.utc))
+    with self.connection:
+      self.connection.execute("DELETE FROM members WHERE category = ? AND namespace = ?", (category, namespace))
+      self.connection.executemany(
+        "INSERT OR REPLACE INTO members (category, namespace, title, is_compilation) VALUES (?, ?, ?, ?)",
+        [(category, namespace, title, int(is_compilation)) for title, is_compilation in members]
+      )
+      self.connection.execute(
+        "INSERT OR REPLACE INTO categories (category, namespace, has_flags, fetched_at) VALUES (?, ?, ?, ?)",
+        (category, namespace, int(has_flags), fetched_at)
+      )
+
+  async def get_or_fetch(
+    self, 
+    category: str, 
+    namespace: int, 
+    fetch: Callable[[], Awaitable[List[Tuple[str, bool]]]], 
+    has_flags: bool = False
+  ) -> List[Tuple[str, bool]]:
+    """Get the members of the category from the cache, or else download them with fetch() and cache them"""
+    start_time = time()
+    members = self.get(category, namespace)
+    if members is None:
+      members = await fetch()
+      self.put(category, namespace, members, has_flags)
+    self.lookup_time += time() - start_time
+    return members
+
+  def invalidate(self, categories: Set[str]) -> None:
+    with self.connection:
+      for category in categories:
+        self.connection.execute("DELETE FROM categories WHERE category = ?", (category,))
+        self.connection.execute("DELETE FROM members WHERE category = ?", (category,))
+
+  def clear(self) -> None:
+    with self.connection:
+      self.connection.execute("DELETE FROM categories")
+      self.connection.execute("DELETE FROM members")
+
+  async def sync(self, api: ApiClient) -> Set[str]:
+    """
+    Drop the categories that have changed since the last sync. Returns the set of dropped categories.
+    """
+    sync_started_at = datetime.now(timezone.utc)
+    last_sync = self.get_last_sync()
+    num_cached = self.connection.execute("SELECT COUNT(*) FROM categories").fetchone()[0]
+    changed_categories = set()
+    if last_sync is None or sync_started_at - last_sync > CONST_RECENT_CHANGES_MAX_AGE:
+      self.clear()
+    else:
+      changed_categories = await self.__get_changed_categories(api, last_sync)
+      self.invalidate(changed_categories)
+      self.is_cold = num_cached == 0
+    with self.connection:
+      self.connection.execute(
+        "INSERT OR REPLACE INTO sync (key, value) VALUES ('last_sync', ?)",
+        (format_timestamp(sync_started_at),)
+      )
+    return changed_categories
+
+  async def __get_changed_categories(self, api: ApiClient, since: datetime) -> Set[str]:
+    changed_categories = await get_recently_categorized(api, since)
+
+    affected_titles = set()
+    for log_type in ("delete", "move"):
+      log_events_params = {
+        "action": "query",
+        "format": "json",
+        "list": "logevents",
+        "letype": log_type,
+        "leprop": "title|details",
+        "leend": format_timestamp(since),
+        "lelimit": "max",
+        "origin": "*"
+      }
+      async for data in api.continued_query(log_events_params):
+        for event in data.get("query", {}).get("logevents", []):
+          affected_titles.add(event["title"])
+          if "target_title" in event.get("params", {}):
+            affected_titles.add(event["params"]["target_title"])
+    for title in affected_titles:
+      if title.startswith("Category:"):
+        changed_categories.add(normalize_category_title(title))
+      for (category,) in self.connection.execute("SELECT DISTINCT category FROM members WHERE title = ?", (title,)):
+        changed_categories.add(category)
+    if self.flag_category is not None and self.flag_category in changed_categories:
+      for (category,) in self.connection.execute("SELECT DISTINCT category FROM categories WHERE has_flags = 1"):
+        changed_categories.add(category)
+    return changed_categories
+
+  def stats(self) -> str:
+    return f"Category cache ({'cold' if self.is_cold else 'warm'}): {self.num_hits} hits, {self.num_misses} misses, {self.lookup_time:.2f} s spent in category lookups"
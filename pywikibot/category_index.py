@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+In-memory index of the category memberships of a wiki.
+
+Instead of walking each category with many small list=categorymembers queries, the index enumerates every page
+(generator=allpages) together with its categories (prop=categories) once, in batches of 500 pages (5000 pages with
+the apihighlimits user right), and inverts the result into a category -> members map.
+
+The index can also be built offline from XML dumps (build_from_dump), from the [[Category:...]] tags in the wikitext
+of each page. Categories added by templates are not seen that way.
+"""
+
+import sys
+import regex as re
+from time import time
+
+from typing import Dict, Iterable, List, Set
+
+from api_client import ApiClient
+from xml_dump import iter_dump_pages
+
+CONST_NS_MAIN = 0
+CONST_NS_CATEGORY = 14
+
+RX_CATEGORY_TAG = re.compile(r"\[\[\s*[Cc]ategory\s*:([^\|\[\]\n]+)(?:\|[^\[\]\n]*)?\]\]")
+RX_COMMENT = re.compile(r"<!--.*?(?:-->|$)", re.S)
+
+def normalize_category_title(title: str) -> str:
+  """Normalize a category title to the form returned by the API, i.e. Category:Foo bar"""
+  title = title.replace("_", " ").strip()
+  if not title.startswith("Category:"):
+    title = f"Category:{title}"
+  name = title[len("Category:"):].strip()
+  return f"Category:{name[:1].upper()}{name[1:]}"
+
+def extract_category_tags(wikitext: str) -> List[str]:
+  """Get the categories of a page from the [[Category:...]] tags in its wikitext (outside of HTML comments)"""
+  return [normalize_category_title(category) for category in RX_CATEGORY_TAG.findall(RX_COMMENT.sub("", wikitext))]
+
+class CategoryIndex:
+  pages: Dict[str, Set[str]]
+  subcategories: Dict[str, Set[str]]
+  num_requests: int
+  build_time: float
+
+  def __init__(self):
+    self.pages = {}
+    self.subcategories = {}
+    self.num_requests = 0
+    self.build_time = 0
+
+  async def build(self, api: ApiClient, namespaces: Iterable[int] = (CONST_NS_MAIN, CONST_NS_CATEGORY), batch_size: int | str = "max") -> "CategoryIndex":
+    start_time = time()
+    for namespace in namespaces:
+      params = {
+        "action": "query",
+        "format": "json",
+        "generator": "allpages",
+        "gapnamespace": namespace,
+        "gaplimit": batch_size,
+        "prop": "categories",
+        "cllimit": "max",
+        "origin": "*"
+      }
+      async for data in api.continued_query(params):
+        self.num_requests += 1
+        if "query" not in data:
+          continue
+        for page in data["query"]["pages"].values():
+          self.add_page(page["title"], namespace, [category["title"] for category in page.get("categories", [])])
+    self.build_time = time() - start_time
+    return self
+
+  def build_from_dump(self, paths: Iterable[str], namespaces: Iterable[int] = (CONST_NS_MAIN, CONST_NS_CATEGORY)) -> "CategoryIndex":
+    start_time = time()
+    for page in iter_dump_pages(paths, namespaces):
+      self.add_page(page.title(), page.namespace, extract_category_tags(page.text))
+    self.build_time = time() - start_time
+    return self
+
+  def add_page(self, title: str, namespace: int, categories: Iterable[str]) -> None:
+    members = self.subcategories if namespace == CONST_NS_CATEGORY else self.pages
+    title = sys.intern(title)
+    for category in categories:
+      category_title = sys.intern(category)
+      if category_title not in members:
+        members[category_title] = set()
+      members[category_title].add(title)
+
+  def pages_in_category(self, category: str) -> Set[str]:
+    return self.pages.get(normalize_category_title(category), set())
+
+  def subcategories_of(self, category: str) -> Set[str]:
+    return self.subcategories.get(normalize_category_title(category), set())
+
+  def memory_footprint(self) -> int:
+    """Approximate size of the index in bytes (containers, plus each distinct string counted once)"""
+    total = 0
+    seen_strings = set()
+    for members in (self.pages, self.subcategories):
+      total += sys.getsizeof(members)
+      for category, titles in members.items():
+        total += sys.getsizeof(titles)
+        for title in (category, *titles):
+          if id(title) not in seen_strings:
+            seen_strings.add(id(title))
+            total += sys.getsizeof(title)
+    return total
+
+  def stats(self) -> str:
+    num_memberships = sum(map(len, self.pages.values())) + sum(map(len, self.subcategories.values()))
+    return f"Category index: {len(self.pages) + len(self.subcategories)} categories, {num_memberships} memberships, {self.num_requests} API requests, built in {self.build_time:.2f} s, {self.memory_footprint() / 1024:.0f} KiB in memory"
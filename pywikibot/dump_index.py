@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Random-access index over MediaWiki XML dump files (e.g. the exported-vlw-songs-N.xml files of mwn/export-songs.ts).
+
+The index is built with one pass over the dumps, and records the byte offset and length of each <page> element by
+page title and by page id. It is saved in a compact binary file:
+
+  header        magic, number of dump files, number of pages, number of hash table slots
+  dump files    size, modification time and path of each dump (to detect dumps that changed after indexing)
+  records       title hash, page id, dump file number, byte offset and byte length of each page (26 bytes each)
+  title table   open-addressing hash table of record numbers, by title hash
+  id table      open-addressing hash table of record numbers, by page id
+
+Both the index and the dumps are memory-mapped, so a lookup reads only a few bytes of the index and the bytes of the
+page itself, whatever the size of the dumps. As titles are only stored as hashes, a title lookup checks the title of
+the page in the dump before returning it, so that two titles with the same hash are told apart.
+
+Usage:
+
+python dump_index.py -build:<index file> -dump:<file>[,<file>...]
+  Index the given dump files (glob patterns are expanded, e.g. -dump:"exported-vlw-songs-*.xml").
+
+python dump_index.py -index:<index file> -page:<page title>
+python dump_index.py -index:<index file> -pageid:<page id>
+  Print the wikitext of a page.
+
+"""
+
+import hashlib
+import html
+import mmap
+import os
+import struct
+import sys
+import regex as re
+import xml.etree.ElementTree as ET
+
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from xml_dump import DumpPage, read_page_element, expand_dump_paths
+
+CONST_INDEX_MAGIC = b"VLWDIDX1"
+# MAXIMUM FILL RATIO OF THE HASH TABLES (LOWER = FEWER PROBES PER LOOKUP, BUT A LARGER INDEX FILE)
+CONST_MAX_LOAD_FACTOR = 0.5
+
+HEADER = struct.Struct("<8sIII")
+DUMP_FILE = struct.Struct("<QQH")
+RECORD = struct.Struct("<QIHQI")
+SLOT = struct.Struct("<I")
+
+RX_PAGE_START = re.compile(rb"<page[\s>]")
+RX_PAGE_TITLE = re.compile(rb"<title>([^<]*)</title>")
+RX_PAGE_ID = re.compile(rb"<id>(\d+)</id>")
+
+class StaleDumpIndexException(Exception):
+  pass
+
+def hash_title(title: str) -> int:
+  return int.from_bytes(hashlib.blake2b(title.encode("utf-8"), digest_size=8).digest(), "little")
+
+def hash_page_id(page_id: int) -> int:
+  return (page_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+
+def scan_dump_pages(path: str) -> Iterator[Tuple[str, int, int, int]]:
+  """Get the title, page id, byte offset and byte length of each <page> element of a dump file"""
+  with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+    position = 0
+    while True:
+      start = RX_PAGE_START.search(data, position)
+      if start is None:
+        return
+      end = data.find(b"</page>", start.start())
+      if end == -1:
+        return
+      end += len(b"</page>")
+      title = RX_PAGE_TITLE.search(data, start.start(), end)
+      page_id = RX_PAGE_ID.search(data, start.start(), end)
+      if title is not None:
+        yield (
+          html.unescape(title.group(1).decode("utf-8")),
+          int(page_id.group(1)) if page_id is not None else 0,
+          start.start(),
+          end - start.start()
+        )
+      position = end
+
+def get_num_slots(num_records: int) -> int:
+  num_slots = 8
+  while num_slots * CONST_MAX_LOAD_FACTOR < num_records:
+    num_slots *= 2
+  return num_slots
+
+def build_hash_table(keys: Iterable[int], num_slots: int) -> bytearray:
+  table = bytearray(num_slots * SLOT.size)
+  mask = num_slots - 1
+  for record_number, key in enumerate(keys):
+    if key is None:
+      continue
+    slot = key & mask
+    while SLOT.unpack_from(table, slot * SLOT.size)[0] != 0:
+      slot = (slot + 1) & mask
+    SLOT.pack_into(table, slot * SLOT.size, record_number + 1)
+  return table
+
+class DumpIndex:
+  index_path: str
+  dump_paths: List[str]
+  num_records: int
+  num_slots: int
+
+  def __init__(self, index_path: str):
+    self.index_path = index_path
+    self.__file = open(index_path, "rb")
+    self.__data = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, num_files, self.num_records, self.num_slots = HEADER.unpack_from(self.__data, 0)
+    if magic != CONST_INDEX_MAGIC:
+      raise StaleDumpIndexException(f"{index_path} is not a dump index")
+    self.dump_paths = []
+    self.__dump_stats = []
+    position = HEADER.size
+    for _ in range(num_files):
+      size, mtime_ns, path_length = DUMP_FILE.unpack_from(self.__data, position)
+      position += DUMP_FILE.size
+      self.dump_paths.append(self.__data[position:position + path_length].decode("utf-8"))
+      self.__dump_stats.append((size, mtime_ns))
+      position += path_length
+    self.__records_offset = position
+    self.__title_table_offset = self.__records_offset + self.num_records * RECORD.size
+    self.__id_table_offset = self.__title_table_offset + self.num_slots * SLOT.size
+    self.__dumps = {}
+
+  @staticmethod
+  def build(dump_paths: Iterable[str], index_path: str) -> "DumpIndex":
+    """Index the pages of the given dump files. If a title appears in more than one dump, the last one is kept."""
+    dump_paths = [os.path.abspath(path) for path in dump_paths]
+    records = []
+    # By title rather than by title hash, so that two titles with the same hash are both indexed
+    title_records = {}
+    id_records = {}
+    for file_number, path in enumerate(dump_paths):
+      for title, page_id, offset, length in scan_dump_pages(path):
+        title_records[title] = len(records)
+        if page_id != 0:
+          id_records[page_id] = len(records)
+        records.append((hash_title(title), page_id, file_number, offset, length))
+    # Only the last record of each title/page id is reachable from the hash tables
+    title_keys = [None] * len(records)
+    for record_number in title_records.values():
+      title_keys[record_number] = records[record_number][0]
+    id_keys = [None] * len(records)
+    for page_id, record_number in id_records.items():
+      id_keys[record_number] = hash_page_id(page_id)
+    num_slots = get_num_slots(len(records))
+
+    temp_path = f"{index_path}.tmp"
+    with open(temp_path, "wb") as f:
+      f.write(HEADER.pack(CONST_INDEX_MAGIC, len(dump_paths), len(records), num_slots))
+      for path in dump_paths:
+        stat = os.stat(path)
+        encoded_path = path.encode("utf-8")
+        f.write(DUMP_FILE.pack(stat.st_size, stat.st_mtime_ns, len(encoded_path)))
+        f.write(encoded_path)
+      for record in records:
+        f.write(RECORD.pack(*record))
+      f.write(build_hash_table(title_keys, num_slots))
+      f.write(build_hash_table(id_keys, num_slots))
+    os.replace(temp_path, index_path)
+    return DumpIndex(index_path)
+
+  def __len__(self) -> int:
+    return self.num_records
+
+  def is_stale(self) -> bool:
+    """Whether any of the dump files has been changed or removed since it was indexed"""
+    for path, (size, mtime_ns) in zip(self.dump_paths, self.__dump_stats):
+      if not os.path.exists(path):
+        return True
+      stat = os.stat(path)
+      if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+        return True
+    return False
+
+  def __get_dump(self, file_number: int) -> mmap.mmap:
+    if file_number not in self.__dumps:
+      size, mtime_ns = self.__dump_stats[file_number]
+      f = open(self.dump_paths[file_number], "rb")
+      if os.fstat(f.fileno()).st_size != size:
+        f.close()
+        raise StaleDumpIndexException(f"{self.dump_paths[file_number]} has changed since it was indexed")
+      self.__dumps[file_number] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    return self.__dumps[file_number][1]
+
+  def __find_record(self, table_offset: int, key: int, matches) -> Optional[tuple]:
+    mask = self.num_slots - 1
+    slot = key & mask
+    while True:
+      record_number = SLOT.unpack_from(self.__data, table_offset + slot * SLOT.size)[0]
+      if record_number == 0:
+        return None
+      record = RECORD.unpack_from(self.__data, self.__records_offset + (record_number - 1) * RECORD.size)
+      if matches(record):
+        return record
+      slot = (slot + 1) & mask
+
+  def __read_record(self, record: tuple) -> DumpPage:
+    _, _, file_number, offset, length = record
+    return read_page_element(ET.fromstring(self.__get_dump(file_number)[offset:offset + length]))
+
+  def __read_record_title(self, record: tuple) -> Optional[str]:
+    _, _, file_number, offset, length = record
+    title = RX_PAGE_TITLE.search(self.__get_dump(file_number), offset, offset + length)
+    return html.unescape(title.group(1).decode("utf-8")) if title is not None else None
+
+  def __find_title_record(self, title: str) -> Optional[tuple]:
+    title_hash = hash_title(title)
+    return self.__find_record(
+      self.__title_table_offset, title_hash, 
+      lambda record: record[0] == title_hash and self.__read_record_title(record) == title
+    )
+
+  def get_page(self, title: str) -> Optional[DumpPage]:
+    record = self.__find_title_record(title)
+    return self.__read_record(record) if record is not None else None
+
+  def get_page_by_id(self, page_id: int) -> Optional[DumpPage]:
+    record = self.__find_record(self.__id_table_offset, hash_page_id(page_id), lambda record: record[1] == page_id)
+    return self.__read_record(record) if record is not None else None
+
+  def __contains__(self, title: str) -> bool:
+    return self.__find_title_record(title) is not None
+
+  def close(self) -> None:
+    for f, data in self.__dumps.values():
+      data.close()
+      f.close()
+    self.__dumps = {}
+    self.__data.close()
+    self.__file.close()
+
+  def __enter__(self) -> "DumpIndex":
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.close()
+
+  def stats(self) -> str:
+    return f"Dump index: {self.num_records} pages in {len(self.dump_paths)} dump files, {os.path.getsize(self.index_path) / 1024:.0f} KiB"
+
+if __name__ == "__main__":
+  options = {}
+  for arg in sys.argv[1:]:
+    arg, _, value = arg.partition(':')
+    options[arg] = value
+  if "-build" in options:
+    index = DumpIndex.build(expand_dump_paths(options["-dump"].split(",")), options["-build"])
+    print(index.stats())
+  else:
+    index = DumpIndex(options["-index"])
+    if index.is_stale():
+      print("Warning: the dump files have changed since they were indexed", file=sys.stderr)
+    page = index.get_page(options["-page"]) if "-page" in options else index.get_page_by_id(int(options["-pageid"]))
+    if page is None:
+      print("Page not found in the dumps", file=sys.stderr)
+      sys.exit(1)
+    print(page.text)
+  index.close()
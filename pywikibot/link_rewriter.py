@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Rewriters of the internal wiki links and category tags of a page, for LinkEditorBot (vlw_editlinks.py).
+
+The patterns of a rewrite only depend on the old and new names, which are the same for the whole run: each rewriter
+compiles its pattern once when it is created (i.e. when the bot is created), and is then applied to every page. All
+the rewrites of a rewriter are applied in a single pass over the page (WikilinkRewriter). MultiRenamer applies all the
+renames of a renames file (-renames) at once.
+
+Old names are matched as MediaWiki matches titles: _ for spaces, and either case of the first letter.
+"""
+
+import csv
+import json
+import re
+
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+# MODES OF THE ROWS OF A RENAMES FILE (-renames), A ROW WITHOUT A MODE MOVES THE INTERNAL WIKI LINKS
+CONST_RENAME_MODES = ('moveprodcat', 'movesingercat', 'link')
+# EDIT SUMMARIES ARE CUT TO THIS LENGTH WHEN A PAGE IS AFFECTED BY MANY RENAMES (THE WIKI LIMIT IS 500 CHARACTERS)
+CONST_MAX_SUMMARY_LENGTH = 400
+
+def build_title_pattern(title: str, fold_first_letter: bool = True) -> str:
+  """Pattern of a page title, matching _ for spaces and (if fold_first_letter) either case of the first letter"""
+  pattern = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\|\\])", r"\\\1", title)
+  pattern = re.sub(r"[ _]", "[ _]", pattern)
+  if fold_first_letter:
+    pattern = re.sub(r"^(\w)", 
+      lambda x: f"[{x.group(1).capitalize()}{x.group(1).lower()}]", 
+      pattern)
+  return pattern
+
+def normalize_title(title: str, fold_first_letter: bool = True) -> str:
+  """Key of a title matched by build_title_pattern"""
+  title = title.replace('_', ' ')
+  if fold_first_letter and re.match(r"\w", title):
+    title = title[0].capitalize() + title[1:]
+  return title
+
+class DuplicateRewriteException(Exception):
+  pass
+
+def build_link_replacement(new_internal_link: str, new_link_text: str = "") -> Callable[[Optional[str]], str]:
+  """Replacement of a link: [[new|new_link_text]] if new_link_text is given, else [[new]] keeping the link text of the page"""
+  if new_link_text.strip() != "":
+    return lambda link_text: f"[[{new_internal_link}|{new_link_text}]]"
+  return lambda link_text: f"[[{new_internal_link}]]" if link_text is None else f"[[{new_internal_link}|{link_text}]]"
+
+class WikilinkRewriter:
+  """
+  Rewrites the category tags and internal links of a page in a single pass.
+
+  The rewrites are registered first, then compiled into one tokenizer pattern, made of an alternation of the old names
+  (the longest first) for each kind of [[...]] span:
+    [[Category:<old> songs list...]]                producer categories
+    [[Category:Songs/Albums featuring <old>...]]    singer categories
+    [[<old>]], [[<old>|link text]]                  links
+    [[<old>]]                                       plain links (without a link text or leading spaces)
+  The page is scanned once: the tokenizer only stops at the spans to rewrite, their target is normalized (_ for spaces,
+  case of the first letter) and looked up to find the rewrite, and the text in between is copied untouched. As every
+  span is rewritten from the original text of the page, the rewrites are not chained. A link nested in the link text of
+  another ([[foo|see [[foo]]]], which MediaWiki does not render as two links either) is rewritten, not the outer link.
+  """
+  def __init__(self):
+    # Normalized old name -> (tag, new name)
+    self.__producer_categories: Dict[str, Tuple[Any, str]] = {}
+    self.__singer_categories: Dict[str, Tuple[Any, str]] = {}
+    # Normalized old link target -> (tag, replacement of the link given its link text, or None if the link has none)
+    self.__links: Dict[str, Tuple[Any, Callable[[Optional[str]], str]]] = {}
+    # Normalized old link target -> (tag, replacement of the link)
+    self.__plain_links: Dict[str, Tuple[Any, str]] = {}
+    self.__regex: Optional[re.Pattern] = None
+
+  def add_producer_category(self, old_producer_alias: str, new_producer_alias: str, tag: Any = None) -> None:
+    self.__add(self.__producer_categories, normalize_title(old_producer_alias), (tag, new_producer_alias))
+
+  def add_singer_category(self, old_singer_cat: str, new_singer_cat: str, tag: Any = None) -> None:
+    self.__add(self.__singer_categories, normalize_title(old_singer_cat, fold_first_letter=False), (tag, new_singer_cat))
+
+  def add_link(self, orig_internal_link: str, replacement: Callable[[Optional[str]], str], tag: Any = None) -> None:
+    name = normalize_title(orig_internal_link)
+    self.__add(self.__links, name, (tag, replacement), self.__plain_links)
+
+  def add_plain_link(self, orig_internal_link: str, replacement: str, tag: Any = None) -> None:
+    name = normalize_title(orig_internal_link)
+    self.__add(self.__plain_links, name, (tag, replacement), self.__links)
+
+  @staticmethod
+  def __add(rewrites: Dict[str, Any], name: str, rewrite: Any, other_rewrites: Optional[Dict[str, Any]] = None) -> None:
+    if name in rewrites or (other_rewrites is not None and name in other_rewrites):
+      raise DuplicateRewriteException(f"{name} is rewritten more than once")
+    rewrites[name] = rewrite
+
+  def compile(self) -> None:
+    """Compile the tokenizer pattern, once all the rewrites have been added"""
+    def alternation(names: Dict[str, Any], fold_first_letter: bool = True) -> str:
+      return "|".join(build_title_pattern(name, fold_first_letter) for name in sorted(names, key=len, reverse=True))
+
+    category_patterns = []
+    if len(self.__producer_categories) > 0:
+      category_patterns.append(rf"(?P<producer>{alternation(self.__producer_categories)})[ _]songs[ _]list")
+    if len(self.__singer_categories) > 0:
+      category_patterns.append(rf"(?P<kind>Songs|Albums)[ _][Ff]eaturing[ _](?P<singer>{alternation(self.__singer_categories, fold_first_letter=False)})")
+    # Only the kinds of spans with rewrites are in the pattern, so that it starts with [[Category: when it only moves categories
+    span_patterns = []
+    if len(category_patterns) > 0:
+      span_patterns.append(rf"Category:(?:{'|'.join(category_patterns)})(?P<rest>[^\[\]]*)\]\]")
+    if len(self.__links) > 0:
+      span_patterns.append(rf"\s*?(?P<target>{alternation(self.__links)})\s*(?:\]\]|\|(?P<link_text>(?:(?!\[\[).)+?)\]\])")
+    if len(self.__plain_links) > 0:
+      span_patterns.append(rf"(?P<plain_target>{alternation(self.__plain_links)})\s*\]\]")
+    self.__regex = re.compile(rf"\[\[(?:{'|'.join(span_patterns)})" if len(span_patterns) > 0 else "(?!)")
+
+  def rewrite(self, str_page: str) -> Tuple[str, Set[Any]]:
+    """Apply the rewrites to the page, returns the new text of the page and the tags of the rewrites applied to it"""
+    if self.__regex is None:
+      self.compile()
+    applied_tags = set()
+
+    def replace(match: re.Match) -> str:
+      groups = match.groupdict()
+      producer, singer, target = groups.get("producer"), groups.get("singer"), groups.get("target")
+      if producer is not None:
+        tag, new_producer_alias = self.__producer_categories[normalize_title(producer)]
+        applied_tags.add(tag)
+        return f"[[Category:{new_producer_alias} songs list{groups['rest']}]]"
+      if singer is not None:
+        tag, new_singer_cat = self.__singer_categories[normalize_title(singer, fold_first_letter=False)]
+        applied_tags.add(tag)
+        return f"[[Category:{groups['kind']} featuring {new_singer_cat}{groups['rest']}]]"
+      if target is not None:
+        tag, replacement = self.__links[normalize_title(target)]
+        applied_tags.add(tag)
+        return replacement(groups["link_text"])
+      tag, replacement = self.__plain_links[normalize_title(groups["plain_target"])]
+      applied_tags.add(tag)
+      return replacement
+
+    return (self.__regex.sub(replace, str_page), applied_tags)
+
+class LinkRewriter:
+  """Change the internal links to a page (-old/-new/-linkcap)"""
+  def __init__(self, orig_internal_link: str, new_internal_link: str, new_link_text: str = ""):
+    self.__rewriter = WikilinkRewriter()
+    self.__rewriter.add_link(orig_internal_link, build_link_replacement(new_internal_link, new_link_text))
+    self.__rewriter.compile()
+
+  def rewrite(self, str_page: str) -> str:
+    return self.__rewriter.rewrite(str_page)[0]
+
+class VocalistDisambigRewriter:
+  """
+  Change the internal links to a vocal synth into {{Singer}} links to its page of the synth family, on the pages
+  already (manually) tagged in the category of that page (-chardisambig)
+  """
+  category: str
+
+  def __init__(self, base_voicebank: str, synth_family: str):
+    new_internal_link = f"{base_voicebank} ({synth_family})"
+    self.category = f"Songs featuring {new_internal_link}"
+    self.__rewriter = WikilinkRewriter()
+    self.__rewriter.add_link(
+      base_voicebank, 
+      lambda link_text: f"{{{{Singer|{new_internal_link}}}}}" if link_text is None else f"{{{{Singer|{new_internal_link}|{link_text}}}}}")
+    self.__rewriter.compile()
+
+  def rewrite(self, str_page: str, list_categories: List[str]) -> str:
+    if self.category not in list_categories:
+      return str_page
+    return self.__rewriter.rewrite(str_page)[0]
+
+class ProducerCategoryMover:
+  """Move the pages from the category of a producer to another (-moveprodcat), and optionally the links to the producer (-changelink)"""
+  def __init__(self, old_producer_alias: str, new_producer_alias: str, bool_changeredirect: bool = False, bool_showoldlinkcap: bool = False):
+    self.__rewriter = WikilinkRewriter()
+    self.__rewriter.add_producer_category(old_producer_alias, new_producer_alias)
+    if bool_changeredirect:
+      replacement = build_link_replacement(new_producer_alias, old_producer_alias if bool_showoldlinkcap else "")
+      self.__rewriter.add_link(old_producer_alias, replacement)
+      self.__rewriter.add_link(f":Category:{old_producer_alias} songs list", replacement)
+    self.__rewriter.compile()
+
+  def rewrite(self, str_page: str) -> str:
+    return self.__rewriter.rewrite(str_page)[0]
+
+class SingerCategoryMover:
+  """Move the pages from the song and album categories of a vocal synth to another, and change the plain links to it (-movesingercat)"""
+  def __init__(self, old_singer_cat: str, new_singer_cat: str):
+    singer_disambig_redirect = re.match(r"^(.*) \((.*?)\)$", new_singer_cat)
+    self.__rewriter = WikilinkRewriter()
+    self.__rewriter.add_singer_category(old_singer_cat, new_singer_cat)
+    self.__rewriter.add_plain_link(
+      old_singer_cat, 
+      f"[[{new_singer_cat}]]" if singer_disambig_redirect is None else f"[[{new_singer_cat}|{singer_disambig_redirect.group(1)}]]")
+    self.__rewriter.compile()
+
+  def rewrite(self, str_page: str) -> str:
+    return self.__rewriter.rewrite(str_page)[0]
+
+class RenamesFileException(Exception):
+  pass
+
+class Rename:
+  mode: str
+  old: str
+  new: str
+  changelink: bool
+  preserveoldname: bool
+  linkcap: str
+
+  def __init__(self, mode: str, old: str, new: str, changelink: bool = False, preserveoldname: bool = False, linkcap: str = ''):
+    self.mode = mode
+    self.old = old
+    self.new = new
+    self.changelink = changelink
+    self.preserveoldname = preserveoldname
+    self.linkcap = linkcap
+
+  def summary(self, is_album: bool) -> str:
+    if self.mode == 'moveprodcat':
+      return f"Changed category [[Category:{self.old} songs list]] -> [[Category:{self.new} songs list]]"
+    if self.mode == 'movesingercat':
+      return f"Changed category [[Category:{'Albums' if is_album else 'Songs'} featuring {self.old}]] -> [[Category:{'Albums' if is_album else 'Songs'} featuring {self.new}]]"
+    return f"Changed link [[{self.old}]] -> [[{self.new}]]"
+
+def parse_rename_flag(value: Union[str, bool, None]) -> bool:
+  if isinstance(value, bool):
+    return value
+  return (value or '').strip().lower() in ('1', 'true', 'yes', 'y', 'x')
+
+def load_renames(path: str) -> List[Rename]:
+  """
+  Read the renames of a CSV file (with a header row) or of a JSON file (a list of objects). The columns are mode, old,
+  new, and optionally changelink, preserveoldname (for moveprodcat) and linkcap (for link).
+  """
+  try:
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+      rows = json.load(f) if path.lower().endswith('.json') else list(csv.DictReader(f))
+  except (OSError, ValueError, csv.Error) as e:
+    raise RenamesFileException(f"Could not read {path}: {e}")
+  if not isinstance(rows, list):
+    raise RenamesFileException(f"{path} should contain a list of renames")
+  renames = []
+  for number, row in enumerate(rows, 1):
+    if not isinstance(row, dict):
+      raise RenamesFileException(f"Rename {number} of {path} is not an object")
+    mode = (row.get('mode') or 'link').strip()
+    old = (row.get('old') or '').strip()
+    new = (row.get('new') or '').strip()
+    if mode not in CONST_RENAME_MODES:
+      raise RenamesFileException(f"Rename {number} of {path} has an unknown mode {mode}, expected one of {', '.join(CONST_RENAME_MODES)}")
+    if old == '' or new == '':
+      raise RenamesFileException(f"Rename {number} of {path} is missing old or new")
+    renames.append(Rename(
+      mode, old, new,
+      changelink=parse_rename_flag(row.get('changelink')),
+      preserveoldname=parse_rename_flag(row.get('preserveoldname')),
+      linkcap=(row.get('linkcap') or '').strip()
+    ))
+  return renames
+
+class MultiRenamer:
+  """
+  Applies every rename of a renames file to a page at once, in a single pass of a WikilinkRewriter. The renames are
+  all applied to the original text of the page: they are not chained (with foo -> bar and bar -> baz, [[foo]] becomes
+  [[bar]]).
+  """
+  def __init__(self, renames: List[Rename]):
+    self.renames = renames
+    self.__rewriter = WikilinkRewriter()
+    for rename in renames:
+      try:
+        if rename.mode == 'moveprodcat':
+          self.__rewriter.add_producer_category(rename.old, rename.new, rename)
+          if rename.changelink:
+            replacement = build_link_replacement(rename.new, rename.old if rename.preserveoldname else "")
+            self.__rewriter.add_link(rename.old, replacement, rename)
+            self.__rewriter.add_link(f":Category:{rename.old} songs list", replacement, rename)
+        elif rename.mode == 'movesingercat':
+          self.__rewriter.add_singer_category(rename.old, rename.new, rename)
+          singer_disambig_redirect = re.match(r"^(.*) \((.*?)\)$", rename.new)
+          self.__rewriter.add_plain_link(
+            rename.old, 
+            f"[[{rename.new}]]" if singer_disambig_redirect is None else f"[[{rename.new}|{singer_disambig_redirect.group(1)}]]", 
+            rename)
+        else:
+          self.__rewriter.add_link(rename.old, build_link_replacement(rename.new, rename.linkcap), rename)
+      except DuplicateRewriteException:
+        raise RenamesFileException(f"{rename.old} is renamed more than once")
+    self.__rewriter.compile()
+
+  def apply(self, str_page: str) -> Tuple[str, List[Rename]]:
+    """Apply the renames to the page, returns the new text of the page and the renames applied to it"""
+    str_page, applied_renames = self.__rewriter.rewrite(str_page)
+    return (str_page, [rename for rename in self.renames if rename in applied_renames])
+
+  def summary(self, applied_renames: List[Rename], is_album: bool) -> str:
+    """Edit summary of the renames applied to a page, the renames that do not fit are only counted"""
+    summaries = [rename.summary(is_album) for rename in applied_renames]
+    summary = summaries[0] if len(summaries) > 0 else ""
+    for number, rename_summary in enumerate(summaries[1:], 1):
+      if len(summary) + len(rename_summary) + 2 > CONST_MAX_SUMMARY_LENGTH:
+        return summary + f"; and {len(summaries) - number} more"
+      summary += "; " + rename_summary
+    return summary
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Adaptive token-bucket rate limiter shared by all requests of a bot.
+
+The rate is adjusted with additive increase/multiplicative decrease:
+  - each successful request raises the rate a little (by about `increase` requests/s for every second of healthy responses)
+  - each throttled request (HTTP 429/503, or a maxlag/ratelimited API error) cuts the rate by `decrease`, at most once
+    per `cooldown` seconds, and pauses every request until the Retry-After time has passed
+
+SharedRateLimiter is a fixed-rate limiter shared by several processes (e.g. the shards of a bot, see shard_runner.py).
+"""
+
+import asyncio
+import multiprocessing
+from time import monotonic
+
+from typing import Optional
+
+class AdaptiveRateLimiter:
+  min_rate: float
+  max_rate: float
+  burst: float
+  increase: float
+  decrease: float
+  cooldown: float
+  num_throttled: int
+
+  def __init__(
+    self,
+    rate: float = 10,
+    min_rate: float = 0.5,
+    max_rate: float = 50,
+    burst: Optional[float] = None,
+    increase: float = 1,
+    decrease: float = 0.5,
+    cooldown: float = 1
+  ):
+    self.__rate = rate
+    self.min_rate = min_rate
+    self.max_rate = max_rate
+    self.burst = burst if burst is not None else max(1, rate)
+    self.increase = increase
+    self.decrease = decrease
+    self.cooldown = cooldown
+    self.num_throttled = 0
+    self.__tokens = self.burst
+    self.__last_refill = monotonic()
+    self.__last_decrease = 0
+    self.__paused_until = 0
+    self.__lock = None
+
+  @property
+  def rate(self) -> float:
+    """Current number of requests allowed per second"""
+    return self.__rate
+
+  def __refill(self, now: float) -> None:
+    self.__tokens = min(self.burst, self.__tokens + (now - self.__last_refill) * self.__rate)
+    self.__last_refill = now
+
+  async def acquire(self) -> None:
+    if self.__lock is None:
+      self.__lock = asyncio.Lock()
+    async with self.__lock:
+      while True:
+        now = monotonic()
+        if now < self.__paused_until:
+          await asyncio.sleep(self.__paused_until - now)
+          continue
+        self.__refill(now)
+        if self.__tokens >= 1:
+          self.__tokens -= 1
+          return
+        await asyncio.sleep((1 - self.__tokens) / self.__rate)
+
+  def on_success(self) -> None:
+    self.__rate = min(self.max_rate, self.__rate + self.increase / self.__rate)
+
+  def on_throttled(self, retry_after: Optional[float] = None) -> None:
+    now = monotonic()
+    self.num_throttled += 1
+    if now - self.__last_decrease >= self.cooldown:
+      self.__refill(now)
+      self.__rate = max(self.min_rate, self.__rate * self.decrease)
+      self.__tokens = min(self.__tokens, 0)
+      self.__last_decrease = now
+    if retry_after is not None:
+      self.__paused_until = max(self.__paused_until, now + retry_after)
+
+  def stats(self) -> str:
+    return f"{self.__rate:.1f} requests/s, throttled {self.num_throttled} times"
+
+class SharedRateLimiter:
+  """
+  Fixed-rate limiter shared by several processes: each acquire() reserves the next free slot, so that at most `rate`
+  slots per second are handed out in total across all processes. Create it before starting the processes, and pass
+  it to them.
+  """
+  rate: float
+
+  def __init__(self, rate: float, context=multiprocessing):
+    self.rate = rate
+    # Time of the next free slot (time.monotonic() is system-wide, so it can be compared between processes)
+    self.__next_slot = context.Value("d", 0.0)
+
+  async def acquire(self) -> None:
+    with self.__next_slot.get_lock():
+      now = monotonic()
+      slot = max(now, self.__next_slot.value)
+      self.__next_slot.value = slot + 1 / self.rate
+    if slot > now:
+      await asyncio.sleep(slot - now)
+
+  def stats(self) -> str:
+    return f"{self.rate:.2f} requests/s shared between processes"
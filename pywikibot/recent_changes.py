@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Helpers for bots that only process what has changed on the wiki since their last successful run.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+from typing import Optional, Set
+
+from api_client import ApiClient
+from category_index import normalize_category_title
+
+CONST_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+def format_timestamp(timestamp: datetime) -> str:
+  return timestamp.astimezone(timezone.utc).strftime(CONST_TIMESTAMP_FORMAT)
+
+def parse_timestamp(timestamp: str) -> datetime:
+  return datetime.strptime(timestamp, CONST_TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+
+class RunWatermark:
+  """Timestamp of the start of the last successful run, kept in a local JSON file"""
+  path: str
+
+  def __init__(self, path: str):
+    self.path = path
+
+  def load(self) -> Optional[datetime]:
+    if not os.path.exists(self.path):
+      return None
+    with open(self.path, "r", encoding="utf-8") as f:
+      data = json.load(f)
+    return parse_timestamp(data["last_run"]) if "last_run" in data else None
+
+  def save(self, timestamp: datetime) -> None:
+    temp_path = f"{self.path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+      json.dump({ "last_run": format_timestamp(timestamp) }, f)
+    os.replace(temp_path, self.path)
+
+async def get_recently_categorized(api: ApiClient, since: datetime) -> Set[str]:
+  """
+  Get the categories that had pages added or removed since the given time (list=recentchanges&rctype=categorize).
+  """
+  categories = set()
+  params = {
+    "action": "query",
+    "format": "json",
+    "list": "recentchanges",
+    "rctype": "categorize",
+    "rcnamespace": 14,
+    "rcprop": "title",
+    "rcend": format_timestamp(since),
+    "rclimit": "max",
+    "origin": "*"
+  }
+  async for data in api.continued_query(params):
+    for change in data.get("query", {}).get("recentchanges", []):
+      categories.add(normalize_category_title(change["title"]))
+  return categories
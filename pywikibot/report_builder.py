@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Builder of bot-generated wiki reports that may grow past the page size limit of the wiki ($wgMaxArticleSize, 2 MiB
+by default).
+
+The report is made of a header, sections (a heading followed by entries, e.g. one entry per page) and a footer. The
+parts are only joined once, when the report is built. A report larger than the limit is split into numbered
+subpages (<report>/1, <report>/2, ...) between two entries: the report page then only keeps the header, links to the
+subpages and the footer, and a section that continues on the next subpage has its heading repeated there.
+"""
+
+from typing import List, Optional, Tuple
+
+# DEFAULT MAXIMUM SIZE OF A PAGE, IN BYTES (THE DEFAULT $wgMaxArticleSize IS 2048 KIB, SOME ROOM IS LEFT FOR THE HEADINGS)
+CONST_MAX_PAGE_SIZE = 2000 * 1024
+
+class ReportBuilder:
+  header: str
+  footer: str
+
+  def __init__(self, header: str = "", footer: str = ""):
+    self.header = header
+    self.footer = footer
+    # (heading of the section, entries of the section)
+    self.__sections: List[Tuple[str, List[str]]] = []
+
+  def section(self, heading: str) -> None:
+    """Start a new section, the following entries are added to it"""
+    self.__sections.append((heading, []))
+
+  def add(self, entry: str) -> None:
+    """Add an entry to the current section. An entry is never split between two subpages."""
+    if len(self.__sections) == 0:
+      self.section("")
+    self.__sections[-1][1].append(entry)
+
+  def build(self) -> str:
+    parts = [self.header]
+    for heading, entries in self.__sections:
+      parts.append(heading)
+      parts.extend(entries)
+    parts.append(self.footer)
+    return "".join(parts)
+
+  def build_pages(self, max_size: int = CONST_MAX_PAGE_SIZE, continued: str = " (continued)") -> List[str]:
+    """
+    Build the report as one page if it fits in max_size bytes, else as the report page followed by its numbered
+    subpages.
+    """
+    size = len(self.header.encode("utf-8")) + len(self.footer.encode("utf-8"))
+    for heading, entries in self.__sections:
+      size += len(heading.encode("utf-8")) + sum(len(entry.encode("utf-8")) for entry in entries)
+    if size <= max_size:
+      return [self.build()]
+
+    subpages: List[List[str]] = []
+    subpage_size = max_size
+    for heading, entries in self.__sections:
+      current_heading: Optional[str] = heading
+      for entry in entries if len(entries) > 0 else [""]:
+        entry_size = len(entry.encode("utf-8"))
+        heading_size = len(current_heading.encode("utf-8")) if current_heading is not None else 0
+        if subpage_size + heading_size + entry_size > max_size:
+          subpages.append([])
+          subpage_size = 0
+          if current_heading is None:
+            # The section continues on this subpage
+            current_heading = heading.rstrip() + continued + "\n\n" if heading.strip() != "" else ""
+            heading_size = len(current_heading.encode("utf-8"))
+        if current_heading is not None:
+          subpages[-1].append(current_heading)
+          subpage_size += heading_size
+          current_heading = None
+        subpages[-1].append(entry)
+        subpage_size += entry_size
+
+    index = [f"\n''This report is split into {len(subpages)} parts:''\n"]
+    index.extend(f"*[[/{number}]]\n" for number in range(1, len(subpages) + 1))
+    return [self.header + "".join(index) + self.footer, *("".join(subpage) for subpage in subpages)]
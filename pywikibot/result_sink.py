@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Results of the pages completed by an AsyncBotWrapper bot.
+
+Each result is a tuple (is_page_edited, page_title, error_message, payload on success, payload on failure), as
+returned by treat_one_page. With a path, every result is appended to a JSON Lines file as soon as the page has been
+completed, and the results are read back from the file when they are reported, so that the results of a long run
+are not kept in memory (the payloads are then read back as JSON, e.g. tuples become lists). The file is deleted once
+the results have been reported (remove). Without a path, the results are kept in memory.
+"""
+
+import json
+import os
+
+from typing import Any, Iterator, List, Optional, Tuple
+
+class ResultSink:
+  path: Optional[str]
+  num_results: int
+  num_edited: int
+  num_errors: int
+  num_results_on_success: int
+  num_results_on_failure: int
+
+  def __init__(self, path: Optional[str] = None):
+    self.path = path
+    self.num_results = 0
+    self.num_edited = 0
+    self.num_errors = 0
+    self.num_results_on_success = 0
+    self.num_results_on_failure = 0
+    self.__records: List[Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]] = []
+    self.__file = open(path, "w", encoding="utf-8") if path is not None else None
+
+  def append(self, results: Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]) -> None:
+    is_edited, page_title, err_message, payload_on_success, payload_on_failure = results
+    self.num_results += 1
+    self.num_edited += 1 if is_edited else 0
+    self.num_errors += 1 if err_message is not None else 0
+    self.num_results_on_success += 1 if payload_on_success is not None else 0
+    self.num_results_on_failure += 1 if payload_on_failure is not None else 0
+    if self.__file is None:
+      self.__records.append(results)
+      return
+    self.__file.write(json.dumps([is_edited, page_title, err_message, payload_on_success, payload_on_failure], ensure_ascii=False) + "\n")
+    self.__file.flush()
+
+  def close(self) -> None:
+    if self.__file is not None:
+      self.__file.close()
+      self.__file = None
+
+  def remove(self) -> None:
+    """Delete the file of the results once they have been reported"""
+    self.close()
+    if self.path is not None and os.path.exists(self.path):
+      os.remove(self.path)
+
+  @staticmethod
+  def read(path: str) -> Iterator[Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]]:
+    with open(path, "r", encoding="utf-8") as f:
+      for line in f:
+        yield tuple(json.loads(line))
+
+  def records(self) -> Iterator[Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]]:
+    if self.path is None:
+      yield from self.__records
+    else:
+      if self.__file is not None:
+        self.__file.flush()
+      yield from ResultSink.read(self.path)
+
+  def edited_pages(self) -> Iterator[str]:
+    return (page_title for is_edited, page_title, _, _, _ in self.records() if is_edited)
+
+  def error_pages(self) -> Iterator[Tuple[str, str]]:
+    return ((page_title, err_message) for _, page_title, err_message, _, _ in self.records() if err_message is not None)
+
+  def results_on_success(self) -> Iterator[Tuple[str, Any]]:
+    return ((page_title, payload) for _, page_title, _, payload, _ in self.records() if payload is not None)
+
+  def results_on_failure(self) -> Iterator[Tuple[str, Any]]:
+    return ((page_title, payload) for _, page_title, _, _, payload in self.records() if payload is not None)
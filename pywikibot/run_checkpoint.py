@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Checkpoint of a long AsyncBotWrapper run, kept in a local JSON Lines journal, so that an interrupted run can be
+resumed where it left off.
+
+The first line of the journal records the bot and the start time of the run. Every page is then appended to the
+journal (and flushed to disk) once it has been completed, i.e. treated and, if edited, saved, together with its
+results (edited, error message, payloads on success and on failure) and the generator position: the title of the
+last page such that every page taken from the generator up to it has been completed.
+
+When the journal already exists, it is read back first: the completed pages are skipped, and their results are
+restored into the results of the bot. Bots can also leave the completed pages out of their generator before
+preloading the page contents (is_completed). A page that was being treated or saved when the run was interrupted
+has no entry, and is treated again. The journal is deleted once the run has completed.
+
+The generator position only tells how far the run went, as pages are not always yielded in the order of their
+titles (e.g. pages preloaded in batches are yielded in the order of their page ids).
+"""
+
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+class CheckpointMismatchException(Exception):
+  pass
+
+class RunCheckpoint:
+  path: str
+  bot_name: Optional[str]
+  started_at: Optional[datetime]
+  # Title of the last page such that every page taken from the generator up to it has been completed
+  position: Optional[str]
+  completed_titles: Set[str]
+  # Results of the completed pages, in the order in which they were completed
+  results: List[Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]]
+  is_resumed: bool
+
+  def __init__(self, path: str):
+    self.path = path
+    self.bot_name = None
+    self.started_at = None
+    self.position = None
+    self.completed_titles = set()
+    self.results = []
+    self.is_resumed = False
+    self.__file = None
+    self.__valid_size = 0
+    # Pages taken from the generator and not yet completed (title -> is_completed), in the order of the generator
+    self.__in_flight: "OrderedDict[str, bool]" = OrderedDict()
+    self.__load()
+
+  def __load(self) -> None:
+    if not os.path.exists(self.path):
+      return
+    with open(self.path, "rb") as f:
+      for line in f:
+        try:
+          record: Dict[str, Any] = json.loads(line)
+        except ValueError:
+          # The last line is cut short if the run was killed while writing it
+          break
+        self.__valid_size += len(line)
+        if "bot" in record:
+          self.bot_name = record["bot"]
+          self.started_at = datetime.fromisoformat(record["started"])
+          continue
+        self.completed_titles.add(record["title"])
+        self.results.append((record["edited"], record["title"], record["error"], record["success"], record["failure"]))
+        if record["position"] is not None:
+          self.position = record["position"]
+    self.is_resumed = self.bot_name is not None
+
+  def open(self, bot_name: str) -> None:
+    """Open the journal for appending, and start a new journal if there is no run to resume"""
+    if self.is_resumed and self.bot_name != bot_name:
+      raise CheckpointMismatchException(f"The checkpoint {self.path} was written by {self.bot_name}, not by {bot_name}")
+    if not self.is_resumed:
+      self.bot_name = bot_name
+      self.started_at = datetime.now(timezone.utc)
+      self.__valid_size = 0
+    self.__file = open(self.path, "ab")
+    self.__file.truncate(self.__valid_size)
+    if not self.is_resumed:
+      self.__append({ "bot": self.bot_name, "started": self.started_at.isoformat() })
+
+  def close(self) -> None:
+    if self.__file is not None:
+      self.__file.close()
+      self.__file = None
+
+  def finish(self) -> None:
+    """Delete the journal once the run has completed"""
+    self.close()
+    if os.path.exists(self.path):
+      os.remove(self.path)
+
+  def is_completed(self, title: str) -> bool:
+    return title in self.completed_titles
+
+  def should_skip(self, title: str) -> bool:
+    """Whether the page has already been completed, or is being treated (if the generator yields it twice)"""
+    return title in self.completed_titles or title in self.__in_flight
+
+  def dispatch(self, title: str) -> None:
+    """Record that the page has been taken from the generator"""
+    self.__in_flight[title] = False
+
+  def complete(self, title: str, results: Tuple[Optional[bool], Optional[str], Optional[str], Optional[Any], Optional[Any]]) -> None:
+    """Record that the page has been completed, with its results"""
+    position = None
+    if title in self.__in_flight:
+      self.__in_flight[title] = True
+      while len(self.__in_flight) > 0 and next(iter(self.__in_flight.values())):
+        position, _ = self.__in_flight.popitem(last=False)
+    if position is not None:
+      self.position = position
+    self.completed_titles.add(title)
+    is_edited, _, err_message, payload_on_success, payload_on_failure = results
+    self.__append({
+      "title": title,
+      "edited": is_edited,
+      "error": err_message,
+      "success": payload_on_success,
+      "failure": payload_on_failure,
+      "position": position
+    })
+
+  def __append(self, record: Dict[str, Any]) -> None:
+    self.__file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+    self.__file.flush()
+    os.fsync(self.__file.fileno())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Run an AsyncBotWrapper bot in several processes (shards), so that the CPU-bound work of the bot (parsing and
+rewriting wikitext) is spread over several cores.
+
+Each shard only treats the pages whose title falls in its hash bucket (is_in_shard), so the shards are disjoint
+whatever the order of the generator. The edits of all shards are paced by a single SharedRateLimiter, so that the
+edit rate of the whole run stays within the budget of the bot. Once every shard has finished, the results of the
+shards are merged into a bot created in the parent process, which reports them (run_on_termination) once. If a shard failed,
+the merged bot is told so (shard_failures) before it reports, and run_sharded then raises ShardFailedException.
+
+The shards are forked from the parent process where possible (e.g. on Linux). Where processes can only be spawned
+(e.g. on Windows), create_bot must be picklable, e.g. a class or a functools.partial of a module-level function.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import zlib
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from rate_limiter import SharedRateLimiter
+
+# NUMBER OF SECONDS BETWEEN TWO CHECKS OF THE SHARD PROCESSES, WHILE WAITING FOR THEIR RESULTS
+CONST_POLL_INTERVAL = 1
+
+class ShardFailedException(Exception):
+  pass
+
+def shard_of(title: str, num_shards: int) -> int:
+  # crc32 rather than hash(), which is salted differently in every process
+  return zlib.crc32(title.encode("utf-8")) % num_shards
+
+def is_in_shard(title: str, shard: Tuple[int, int]) -> bool:
+  index, num_shards = shard
+  return shard_of(title, num_shards) == index
+
+def shard_path(path: str, shard: Tuple[int, int]) -> str:
+  """Path of the file of a shard, e.g. checkpoint.jsonl -> checkpoint.shard1of4.jsonl"""
+  index, num_shards = shard
+  root, extension = os.path.splitext(path)
+  return f"{root}.shard{index + 1}of{num_shards}{extension}"
+
+def run_shard(
+  create_bot: Callable[..., Any],
+  shard: Tuple[int, int],
+  edit_limiter: Optional[SharedRateLimiter],
+  results_queue: multiprocessing.Queue
+) -> None:
+  """Run one shard of the bot (in the shard process), then send its results to the parent process"""
+  import pywikibot
+  try:
+    bot = create_bot(shard=shard)
+    if edit_limiter is not None:
+      bot.edit_limiter = edit_limiter
+    bot.run()
+    results_queue.put((shard[0], bot.shard_results(), None))
+  except BaseException as e:
+    results_queue.put((shard[0], None, f"{type(e).__name__}: {e}"))
+    raise
+  finally:
+    # Wait for the pending saves of pywikibot, which are not waited for when a child process exits
+    pywikibot.stopme()
+
+def run_sharded(create_bot: Callable[..., Any], num_shards: int, edits_per_minute: Optional[float] = None) -> Any:
+  """
+  Run the bot in num_shards processes, then report the merged results from the parent process.
+
+  create_bot(shard=...) should create the bot, with shard=(index, number of shards) in the shard processes, and with
+  shard=None in the parent process (this bot only reports the merged results, and never iterates its generator).
+  Returns the bot of the parent process.
+  """
+  context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+  edit_limiter = SharedRateLimiter(edits_per_minute / 60, context) if edits_per_minute is not None else None
+  results_queue = context.Queue()
+  processes = [
+    context.Process(target=run_shard, args=(create_bot, (index, num_shards), edit_limiter, results_queue), name=f"shard-{index + 1}")
+    for index in range(num_shards)
+  ]
+  for process in processes:
+    process.start()
+
+  results: Dict[int, Dict[str, Any]] = {}
+  failures: List[Tuple[int, str]] = []
+  # The results are read before the processes are joined, as a process only exits once its results have been read
+  while len(results) + len(failures) < num_shards:
+    try:
+      index, shard_results, err_message = results_queue.get(timeout=CONST_POLL_INTERVAL)
+    except queue.Empty:
+      finished = set(results) | { index for index, _ in failures }
+      for index, process in enumerate(processes):
+        # A process that has exited has flushed its results to the queue, if any
+        if index not in finished and not process.is_alive() and results_queue.empty():
+          failures.append((index, f"exited with status {process.exitcode}"))
+      continue
+    if shard_results is None:
+      failures.append((index, err_message))
+    else:
+      results[index] = shard_results
+  for process in processes:
+    process.join()
+
+  bot = create_bot(shard=None)
+  for index in sorted(results):
+    bot.merge_shard_results(results[index])
+    pages = results[index]["metrics"]["pages"]
+    bot.log(f"Shard {index + 1}/{num_shards}: {pages['treated']} pages treated, {pages['edited']} edited, {pages['failed']} failed")
+  # The bot is told about the failed shards before it reports, as their pages are missing from the merged results
+  bot.shard_failures = [f"Shard {index + 1}/{num_shards} failed: {err_message}" for index, err_message in sorted(failures)]
+  asyncio.run(bot.run_merged())
+  if len(bot.shard_failures) > 0:
+    raise ShardFailedException("\n".join(bot.shard_failures))
+  return bot
@@ -3,6 +3,9 @@
 
 This is a custom bot for bulk editing of links in the Vocaloid Lyrics Wiki.
 
+Requires the file link_rewriter.py to be saved in the same folder as this script. The -async mode also requires the file
+async_link_editor.py and the file async_bot_wrapper.py (and the modules it imports).
+
 By default the pywikibot wrapper will prompt the user to confirm the changes unless the global flag -always is used.
 
 Usage:
@@ -40,6 +43,27 @@ python pwb.py vlw_editlinks -chardisambig -basevb:"Hatsune Miku" -synth:"VOCALOI
   Edit internal wiki link of singers/synths that link to character disambiguation pages
   Automatic check based on the categories already (manually) tagged in
 
+python pwb.py vlw_editlinks -renames:"renames.csv"
+
+  Apply many renames in one run, from a CSV file (with a header row) or a JSON file (a list of objects) with the columns
+  mode (moveprodcat, movesingercat or link), old, new, and optionally changelink and preserveoldname (for moveprodcat)
+  and linkcap (for link). Each row works as the command of its mode with -old and -new. The bot treats the union of the
+  pages affected by the renames (the pages of the categories, and the pages that link to the old page for link), and
+  saves each page once with all the renames that apply to it. Renames are not chained: with foo -> bar and bar -> baz,
+  [[foo]] becomes [[bar]].
+
+    mode,old,new,changelink,preserveoldname,linkcap
+    moveprodcat,MATERU,MARETU,yes,,
+    movesingercat,Hatsune Miku,Hatsune Miku (VOCALOID),,,
+    link,foo,bar,,,text
+
+python pwb.py vlw_editlinks ... -async [-workers:5] [-editsperminute:30]
+
+  Run any of the commands above through a concurrent pipeline: the pages are rewritten by -workers pages at a time,
+  and saved by -workers saves at a time while the next pages are rewritten, at most -editsperminute edits per minute
+  (the put_throttle of pywikibot still applies). The diffs, the confirmation prompts (one at a time, unless -always
+  is used), -simulate and the final summary are the same as without -async.
+
 """
 import pywikibot
 from pywikibot import pagegenerators
@@ -51,6 +75,19 @@ from pywikibot.bot import (
 )
 import re
 
+from typing import List, Optional, Tuple
+
+from link_rewriter import (
+  LinkRewriter,
+  MultiRenamer,
+  ProducerCategoryMover,
+  Rename,
+  RenamesFileException,
+  SingerCategoryMover,
+  VocalistDisambigRewriter,
+  load_renames,
+)
+
 #Pywikibot Log/Output
 prLog = pywikibot.bot.log
 prOutput = pywikibot.bot.output
@@ -63,6 +100,9 @@ docuReplacements = {
   '&params;': pagegenerators.parameterHelp
 }  # noqa: N816
 
+# SUBCATEGORIES OF A PRODUCER CATEGORY, MOVED ALONG WITH THE PRODUCER CATEGORY
+CONST_PRODUCER_SUBCATEGORIES = ["/Albums", "/Lyrics", "/Arrangement", "/Tuning", "/Visuals", "/Other"]
+
 class LinkEditorBot(
   # Refer pywikobot.bot for generic bot classes
   SingleSiteBot,          # A bot only working on one site
@@ -96,117 +136,35 @@ class LinkEditorBot(
     # User options for moving singer categories
     'movesingercat': False
   }
-  
-  """Change the internal link in the page"""
-  def change_internal_link_address(self, str_page, orig_internal_link, new_internal_link, new_link_text):
-    orig_internal_link = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\\])", r"\\\1", orig_internal_link)
-    orig_internal_link = re.sub(r"[ _]", "[ _]", orig_internal_link)
-    orig_internal_link = re.sub(r"^(\w)", 
-      lambda x: "[" + x.group(1).capitalize() + x.group(1).lower() + "]", 
-      orig_internal_link)
-    search_regex_1 = re.compile(f"\[\[\s*?{orig_internal_link}\s*\]\]")
-    search_regex_2 = re.compile(f"\[\[\s*?{orig_internal_link}\s*\|(.+?)\]\]")
-    #replace_regex_1 = re.compile("[[" + new_internal_link + "]]")
-    #replace_regex_2 = re.compile("[[" + new_internal_link + "|\1]]")
-    str_page = search_regex_1.sub(
-      "[[" + new_internal_link + "]]" if new_link_text.strip() == "" else 
-      "[[" + new_internal_link + "|" + new_link_text + "]]", 
-      str_page)
-    str_page = search_regex_2.sub(
-      lambda x: f"[[{new_internal_link}|{x.group(1)}]]" 
-      if new_link_text.strip() == "" else 
-      f"[[{new_internal_link}|{new_link_text}]]",
-      str_page)
-    return str_page
-  
-  """Change the internal link to a vocal synth in the case when that link is connected to a character disambiguation page"""
-  def change_vocalist_disambig(self, str_page, list_categories, base_voicebank, synth_family):
-    orig_internal_link = base_voicebank
-    new_internal_link = f"{base_voicebank} ({synth_family})"
-    str_find_category = f"Songs featuring {new_internal_link}"
-    if str_find_category in list_categories:
-      #str_page = self.change_internal_link_address(str_page, base_voicebank, base_voicebank + " (" + synth_family + ")", base_voicebank)
-      orig_internal_link = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\\])", r"\\\1", orig_internal_link)
-      orig_internal_link = re.sub(r"[ _]", "[ _]", orig_internal_link)
-      orig_internal_link = re.sub(r"^(\w)", 
-        lambda x: f"[{x.group(1).capitalize()}{x.group(1).lower()}]", 
-        orig_internal_link)
-      search_regex_1 = re.compile(f"\[\[\s*?{orig_internal_link}\s*\]\]")
-      search_regex_2 = re.compile(f"\[\[\s*?{orig_internal_link}\s*\|(.+?)\]\]")
-      str_page = search_regex_1.sub(
-        f"{{{{Singer|{new_internal_link}}}}}", 
-        str_page)
-      str_page = search_regex_2.sub(
-        lambda x: f"{{{{Singer|{new_internal_link}|{x.group(1)}}}}}", 
-        str_page)
-    return str_page
-
-  """Change the internal link to a producer"""
-  def move_producer_category(self, str_page, old_producer_alias, new_producer_alias, bool_changeredirect, bool_showoldlinkcap):
-
-    old_maincat = f"{old_producer_alias} songs list"
-    new_maincat = f"{new_producer_alias} songs list"
-    
-    #Compile regex
-    regex_pattern = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\\])", r"\\\1", old_maincat)
-    regex_pattern = re.sub(r"[ _]", "[ _]", regex_pattern)
-    regex_pattern = re.sub(r"^(\w)", 
-      lambda x: "[" + x.group(1).capitalize() + x.group(1).lower() + "]", 
-      regex_pattern)
-    regex_pattern = f"\[\[Category:{regex_pattern}([^\[\]]*)\]\]"
-    search_regex = re.compile(regex_pattern, re.DOTALL)
-        
-    #Replace category
-    str_page = search_regex.sub(lambda match: "[[Category:" + new_maincat + match.group(1) + "]]", str_page)
-    #Replace producer redirect if specified
-    if bool_changeredirect:
-      str_page = self.change_internal_link_address(
-        str_page, old_producer_alias, new_producer_alias, 
-        old_producer_alias if bool_showoldlinkcap else "")
-      str_page = self.change_internal_link_address(
-        str_page, f":Category:{old_maincat}", new_producer_alias, 
-        old_producer_alias if bool_showoldlinkcap else "")
-        
-    return str_page
-  
-  """Change the internal link to a vocal synth"""
-  def move_singer_category(self, str_page, old_singer_cat, new_singer_cat):
-      
-    # Compile regex
-    regex_pattern = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\\])", r"\\\1", f"featuring {old_singer_cat}")
-    regex_pattern = re.sub(r"[ _]", "[ _]", regex_pattern)
-    regex_pattern = re.sub(r"^(\w)", 
-      lambda x: f"[{x.group(1).capitalize()}{x.group(1).lower()}]", 
-      regex_pattern)
-    regex_pattern = f"\[\[Category:(Songs|Albums)[ _]{regex_pattern}([^\[\]]*)\]\]"
-    search_regex = re.compile(regex_pattern, re.DOTALL)
-        
-    # Replace category
-    str_page = search_regex.sub(lambda match: f"[[Category:{match.group(1)} featuring {new_singer_cat}{match.group(2)}]]", str_page)
-
-    # Replace singer redirect
-    regex_pattern = re.sub(r"([\.\+\*\?\^\$\(\)\[\]\{\}\\])", r"\\\1", old_singer_cat)
-    regex_pattern = re.sub(r"[ _]", "[ _]", regex_pattern)
-    regex_pattern = re.sub(r"^(\w)", 
-      lambda x: f"[{x.group(1).capitalize()}{x.group(1).lower()}]", 
-      regex_pattern)
-    regex_pattern = f"\[\[{regex_pattern}\s*\]\]"
-    search_regex = re.compile(regex_pattern, re.DOTALL)
-    singer_disambig_redirect = re.match(r"^(.*) \((.*?)\)$", new_singer_cat)
-    repl = f"[[{new_singer_cat}]]" if singer_disambig_redirect is None else f"[[{new_singer_cat}|{singer_disambig_redirect.group(1)}]]"
-    str_page = search_regex.sub(repl, str_page)
-        
-    return str_page
 
-  def treat_page(self) -> None:
+  def __init__(self, renames: Optional[List[Rename]] = None, **kwargs):
+    super().__init__(**kwargs)
+    # Renames of a renames file (-renames), applied to each page in one pass instead of the options above
+    self.renamer = MultiRenamer(renames) if renames else None
+    # The patterns of the rewrite are compiled once for the whole run, rather than on every page
+    if self.opt.chardisambig:
+      self.rewriter = VocalistDisambigRewriter(self.opt.basevb, self.opt.synth)
+    elif self.opt.moveprodcat:
+      self.rewriter = ProducerCategoryMover(self.opt.old, self.opt.new, self.opt.changelink, self.opt.preserveoldname)
+    elif self.opt.movesingercat:
+      self.rewriter = SingerCategoryMover(self.opt.old, self.opt.new)
+    else:
+      self.rewriter = LinkRewriter(self.opt.old, self.opt.new, self.opt.linkcap)
+
+  def rewrite_page(self, curpage: pywikibot.Page) -> Tuple[str, str]:
+    """New text and edit summary of the page, the page itself is left unchanged"""
 
-    curpage: pywikibot.Page = self.current_page
     str_page = curpage.text
     title = curpage.title()
 
     default_summary_text = ""
 
-    if self.opt.chardisambig:
+    if self.renamer is not None:
+
+      str_page, applied_renames = self.renamer.apply(str_page)
+      default_summary_text = self.renamer.summary(applied_renames, title.endswith("(album)"))
+
+    elif self.opt.chardisambig:
 
       list_categories = list(map(lambda catobj: re.sub(r"^Category:", "", catobj.title()), curpage.categories()))
 
@@ -215,17 +173,15 @@ class LinkEditorBot(
 
       default_summary_text = f"Changed link [[{base_voicebank}]] -> [[{base_voicebank} ({synth_family})]]"
 
-      str_page = self.change_vocalist_disambig(str_page, list_categories, base_voicebank, synth_family)
+      str_page = self.rewriter.rewrite(str_page, list_categories)
     
     elif self.opt.moveprodcat:
 
       old_producer_alias = self.opt.old
       new_producer_alias = self.opt.new
-      bool_changeredirect = self.opt.changelink
-      bool_showoldlinkcap = self.opt.preserveoldname
 
       default_summary_text = f"Changed category [[Category:{old_producer_alias} songs list]] -> [[Category:{new_producer_alias} songs list]]"
-      str_page = self.move_producer_category(str_page, old_producer_alias, new_producer_alias, bool_changeredirect, bool_showoldlinkcap)
+      str_page = self.rewriter.rewrite(str_page)
     
     elif self.opt.movesingercat:
 
@@ -234,18 +190,22 @@ class LinkEditorBot(
       #bool_album_mode = self.opt.album
       is_album = title.endswith("(album)")
       default_summary_text = f"Changed category [[Category:{'Albums' if is_album else 'Songs'} featuring {old_singer}]] -> [[Category:{'Albums' if is_album else 'Songs'} featuring {new_singer}]]"
-      str_page = self.move_singer_category(str_page, old_singer, new_singer)
+      str_page = self.rewriter.rewrite(str_page)
 
     else:
 
       orig_internal_link = self.opt.old
       new_internal_link = self.opt.new
-      new_link_text = self.opt.linkcap
 
       default_summary_text = f"Changed link [[{orig_internal_link}]] -> [[{new_internal_link}]]"
 
-      str_page = self.change_internal_link_address(str_page, orig_internal_link, new_internal_link, new_link_text)
+      str_page = self.rewriter.rewrite(str_page)
 
+    return (str_page, default_summary_text)
+
+  def treat_page(self) -> None:
+
+    str_page, default_summary_text = self.rewrite_page(self.current_page)
     self.put_current(str_page, summary=default_summary_text)
     # curpage.text = str_page
     # curpage.save(
@@ -266,6 +226,10 @@ def main(*args: str) -> None:
   :param args: command line arguments
   """
   options = {}
+  renames_path = ''
+  is_async = False
+  num_workers = None
+  edits_per_minute = None
   # Process global arguments to determine desired site
   local_args = pywikibot.handle_args(args)
 
@@ -282,8 +246,25 @@ def main(*args: str) -> None:
     arg, _, value = arg.partition(':')
     option = arg[1:]
 
+    # Renames file, for many renames in one run
+    if option == 'renames':
+      renames_path = value or pywikibot.input('Please enter the path of the renames file')
+
+    # Concurrent pipeline, with its number of workers and edit rate
+    elif option == 'async':
+      is_async = True
+    elif option in ('workers', 'editsperminute'):
+      try:
+        if option == 'workers':
+          num_workers = int(value or pywikibot.input('Please enter the number of workers'))
+        else:
+          edits_per_minute = float(value or pywikibot.input('Please enter the maximum number of edits per minute'))
+      except ValueError:
+        prError(f"<<red>>-{option.upper()} SHOULD BE A NUMBER<<default>>")
+        return
+
     # User options for bot
-    if option in ('chardisambig', 'basevb', 'synth', 'old', 'new', 'linkcap', 'moveprodcat', 'changelink', 'preserveoldname', 'movesingercat', 'album'):
+    elif option in ('chardisambig', 'basevb', 'synth', 'old', 'new', 'linkcap', 'moveprodcat', 'changelink', 'preserveoldname', 'movesingercat', 'album'):
       if option in ('chardisambig', 'moveprodcat', 'changelink', 'preserveoldname', 'movesingercat', 'album'):
         options[option] = True
       elif not value:
@@ -296,20 +277,47 @@ def main(*args: str) -> None:
     else:
       options[option] = True
 
+  renames = None
   main_command = ''
+  if renames_path:
+    try:
+      renames = load_renames(renames_path)
+      # Check the renames before listing the pages
+      MultiRenamer(renames)
+    except RenamesFileException as e:
+      prError(f"<<red>>{e}<<default>>")
+      return
+    main_command = 'renames'
   for key in ['chardisambig', 'moveprodcat', 'movesingercat']:
     if key in options.keys():
+      if renames is not None:
+        prError(f"<<red>>-RENAMES CANNOT BE USED WITH -{key.upper()}<<default>>")
+        return
       main_command = key
       break
 
-  if main_command == 'moveprodcat':
+  if main_command == 'renames':
+    #Get the union of the pages affected by the renames, each page is only treated once
+    gen_factory = pagegenerators.GeneratorFactory()
+    for rename in renames:
+      if rename.mode == 'moveprodcat':
+        gen_factory.handle_arg(f"-cat:{rename.old} songs list")
+        for item in CONST_PRODUCER_SUBCATEGORIES:
+          gen_factory.handle_arg(f"-cat:{rename.old} songs list{item}")
+      elif rename.mode == 'movesingercat':
+        gen_factory.handle_arg(f"-cat:Songs featuring {rename.old}")
+        gen_factory.handle_arg(f"-cat:Albums featuring {rename.old}")
+      else:
+        gen_factory.handle_arg(f"-ref:{rename.old}")
+
+  elif main_command == 'moveprodcat':
     if (options['old'] == "" or options['new'] == ""):
       prError("<<red>>PLEASE ADD PARAMETERS -OLD AND -NEW<<default>>")
       return
     #Get list of pages to process
     gen_factory = pagegenerators.GeneratorFactory()
     gen_factory.handle_arg(f"-cat:{options['old']} songs list")
-    for item in ["/Albums", "/Lyrics", "/Arrangement", "/Tuning", "/Visuals", "/Other"]:
+    for item in CONST_PRODUCER_SUBCATEGORIES:
       gen_factory.handle_arg(f"-cat:{options['old']} songs list{item}")
 
   elif main_command == 'movesingercat':
@@ -334,14 +342,24 @@ def main(*args: str) -> None:
   # check if further help is needed
   if not pywikibot.bot.suggest_help(missing_generator=not gen):
     # pass generator and private options to the bot
-    bot = LinkEditorBot(generator=gen, **options)
-    if not bot.opt.chardisambig and (bot.opt.old == "" or bot.opt.new == ""):
+    bot = LinkEditorBot(generator=gen, renames=renames, **options)
+    if renames is None and not bot.opt.chardisambig and (bot.opt.old == "" or bot.opt.new == ""):
       prError("<<red>>PLEASE ADD PARAMETERS -OLD AND -NEW<<default>>")
       return
     elif bot.opt.chardisambig and (bot.opt.basevb == "" or bot.opt.synth == ""):
       prError("<<red>>PLEASE ADD PARAMETERS -BASEVB AND -SYNTH<<default>>")
       return
-    bot.run()
+    if (num_workers is not None or edits_per_minute is not None) and not is_async:
+      prError("<<red>>-WORKERS AND -EDITSPERMINUTE CAN ONLY BE USED WITH -ASYNC<<default>>")
+      return
+    elif (num_workers is not None and num_workers < 1) or (edits_per_minute is not None and edits_per_minute <= 0):
+      prError("<<red>>-WORKERS AND -EDITSPERMINUTE SHOULD BE POSITIVE<<default>>")
+      return
+    if is_async:
+      from async_link_editor import AsyncLinkEditor, CONST_NUM_WORKERS
+      AsyncLinkEditor(bot, num_workers if num_workers is not None else CONST_NUM_WORKERS, edits_per_minute).run()
+    else:
+      bot.run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Streaming reader for MediaWiki XML dumps (Special:Export, or the action=query&export files written by
+mwn/export-songs.ts).
+
+The pages are parsed one at a time with ElementTree.iterparse, and each page is dropped from the tree as soon as it
+has been read, so the memory used does not grow with the size of the dumps.
+"""
+
+import glob
+import xml.etree.ElementTree as ET
+
+from typing import Iterable, Iterator, List, Optional
+
+def local_name(tag: str) -> str:
+  """Strip the export schema namespace from a tag, e.g. {http://www.mediawiki.org/xml/export-0.11/}page -> page"""
+  return tag.rsplit("}", 1)[-1]
+
+def expand_dump_paths(patterns: Iterable[str]) -> List[str]:
+  """Expand the glob patterns of the dump files (e.g. exported-vlw-songs-*.xml), in natural order of their numbers"""
+  paths = []
+  for pattern in patterns:
+    matches = glob.glob(pattern)
+    paths.extend(sorted(matches, key=lambda path: (len(path), path)) if len(matches) > 0 else [pattern])
+  return paths
+
+class DumpPage:
+  """
+  A page read from an XML dump.
+
+  Has the parts of the pywikibot.Page interface used by the bots (title(), exists(), isRedirectPage() and text), so
+  that it can be treated like a page loaded from the wiki. original_text keeps the text of the dumped revision.
+  """
+  page_id: Optional[int]
+  namespace: int
+  is_redirect: bool
+  original_text: str
+  text: str
+
+  def __init__(self, title: str, namespace: int, page_id: Optional[int], is_redirect: bool, text: str):
+    self.__title = title
+    self.namespace = namespace
+    self.page_id = page_id
+    self.is_redirect = is_redirect
+    self.original_text = text
+    self.text = text
+
+  def title(self) -> str:
+    return self.__title
+
+  def exists(self) -> bool:
+    return True
+
+  def isRedirectPage(self) -> bool:
+    return self.is_redirect
+
+def read_page_element(element: ET.Element) -> DumpPage:
+  """Read a <page> element. If the page has more than one <revision>, the text of the last one is used."""
+  title = ""
+  namespace = 0
+  page_id = None
+  is_redirect = False
+  text = ""
+  for child in element:
+    tag = local_name(child.tag)
+    if tag == "title":
+      title = child.text or ""
+    elif tag == "ns":
+      namespace = int(child.text)
+    elif tag == "id":
+      page_id = int(child.text)
+    elif tag == "redirect":
+      is_redirect = True
+    elif tag == "revision":
+      for revision_child in child:
+        if local_name(revision_child.tag) == "text":
+          text = revision_child.text or ""
+  return DumpPage(title, namespace, page_id, is_redirect, text)
+
+def iter_dump_pages(paths: Iterable[str], namespaces: Optional[Iterable[int]] = None) -> Iterator[DumpPage]:
+  """Read the pages of one or more XML dumps, in order, optionally only those in the given namespaces"""
+  namespaces = set(namespaces) if namespaces is not None else None
+  for path in paths:
+    root = None
+    for event, element in ET.iterparse(path, events=("start", "end")):
+      if root is None:
+        root = element
+      if event != "end" or local_name(element.tag) != "page":
+        continue
+      page = read_page_element(element)
+      # Drop the page (and any page before it) from the tree, the root element would otherwise keep every page
+      root.clear()
+      if namespaces is None or page.namespace in namespaces:
+        yield page